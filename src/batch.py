@@ -0,0 +1,125 @@
+# Steps many independent matches per call with NumPy, for bot tournaments, AI training and server-side
+# simulation. Each state field is one integer array across all matches, and the rules are sim.step's
+# exactly (swept paddle hits included), so any match can move between the two paths without drifting.
+#
+#   python src/batch.py --bench [MATCHES]   time both paths; tests/test_batch.py checks they agree
+import sys
+import time
+
+import numpy as np
+
+from constants import FIXED_WIDTH, FIXED_HEIGHT, PADDLE_HEIGHT, PADDLE_WIDTH, BALL_SIZE, BALL_SPEED, PADDLE_SPEED
+from sim import (SIM_KEYS, LEFT_PADDLE_X, LEFT_FACE, RIGHT_PADDLE_X, GameState, new_state, save_state, load_state,
+                 step, INPUT_UP, INPUT_DOWN)
+
+DTYPE = np.int32
+
+class BatchState:
+    __slots__ = SIM_KEYS + ('size',)
+
+    def __init__(self, size, is_host=True):
+        self.size = size
+        template = new_state(is_host)
+        for key in SIM_KEYS:
+            setattr(self, key, np.full(size, getattr(template, key), dtype=DTYPE))
+
+    @classmethod
+    def from_states(cls, states):
+        batch = cls(len(states))
+        for key, column in zip(SIM_KEYS, zip(*map(save_state, states))):
+            setattr(batch, key, np.array(column, dtype=DTYPE))
+        return batch
+
+    def state(self, i):
+        state = GameState.__new__(GameState)
+        load_state(state, tuple(int(getattr(self, key)[i]) for key in SIM_KEYS))
+        return state
+
+def move_paddles(y, inputs):
+    y = np.where((inputs & INPUT_UP != 0) & (y > 0), y - PADDLE_SPEED, y)
+    return np.where((inputs & INPUT_DOWN != 0) & (y < FIXED_HEIGHT - PADDLE_HEIGHT), y + PADDLE_SPEED, y)
+
+def update_balls(batch):
+    # sim.update_ball for every match at once; returns a mask of the matches where someone scored
+    old_x = batch.ball_x
+    old_y = batch.ball_y
+    speed_x = batch.ball_speed_x
+    speed_y = batch.ball_speed_y
+    ball_x = old_x + speed_x
+    ball_y = old_y + speed_y
+
+    wall = (ball_y <= 0) | (ball_y + BALL_SIZE >= FIXED_HEIGHT)
+
+    # The same swept test as the scalar path; the division is floored on both sides
+    moving_left = speed_x < 0
+    center_y = old_y + speed_y * np.maximum(old_x - LEFT_FACE, 0) // np.maximum(-speed_x, 1) + BALL_SIZE // 2
+    left_hit = (moving_left & (ball_x <= LEFT_FACE) & (old_x >= LEFT_PADDLE_X)
+                & (batch.paddle_y <= center_y) & (center_y <= batch.paddle_y + PADDLE_HEIGHT))
+    center_y = (old_y + speed_y * np.maximum(RIGHT_PADDLE_X - BALL_SIZE - old_x, 0) // np.maximum(speed_x, 1)
+                + BALL_SIZE // 2)
+    right_hit = ((speed_x > 0) & (ball_x + BALL_SIZE >= RIGHT_PADDLE_X)
+                 & (old_x + BALL_SIZE <= RIGHT_PADDLE_X + PADDLE_WIDTH)
+                 & (batch.opponent_paddle_y <= center_y) & (center_y <= batch.opponent_paddle_y + PADDLE_HEIGHT))
+    ball_x = np.where(left_hit & (ball_x < LEFT_FACE), 2 * LEFT_FACE - ball_x, ball_x)
+    ball_x = np.where(right_hit & (ball_x + BALL_SIZE > RIGHT_PADDLE_X), 2 * (RIGHT_PADDLE_X - BALL_SIZE) - ball_x, ball_x)
+    speed_x = np.where(left_hit | right_hit, -speed_x, speed_x)
+    speed_y = np.where(wall, -speed_y, speed_y)
+
+    right_scored = ball_x <= 0
+    left_scored = ~right_scored & (ball_x >= FIXED_WIDTH)
+    scored = right_scored | left_scored
+    batch.right_score = batch.right_score + right_scored
+    batch.left_score = batch.left_score + left_scored
+    batch.ball_x = np.where(scored, FIXED_WIDTH // 2, ball_x).astype(DTYPE, copy=False)
+    batch.ball_y = np.where(scored, FIXED_HEIGHT // 2, ball_y).astype(DTYPE, copy=False)
+    batch.ball_speed_x = np.where(scored, BALL_SPEED, speed_x).astype(DTYPE, copy=False)
+    batch.ball_speed_y = np.where(scored, BALL_SPEED, speed_y).astype(DTYPE, copy=False)
+    return scored
+
+def step_batch(batch, left_inputs, right_inputs):
+    # sim.step for every match; inputs are arrays (or scalars) of INPUT_* bits
+    batch.paddle_y = move_paddles(batch.paddle_y, left_inputs)
+    batch.opponent_paddle_y = move_paddles(batch.opponent_paddle_y, right_inputs)
+    return update_balls(batch)
+
+def random_states(count, rng, max_speed=40):
+    # Mid-rally states, including speeds well past PADDLE_WIDTH per tick that a discrete test would tunnel at
+    states = []
+    for _ in range(count):
+        state = new_state(True)
+        state.paddle_y = rng.randrange(0, FIXED_HEIGHT - PADDLE_HEIGHT)
+        state.opponent_paddle_y = rng.randrange(0, FIXED_HEIGHT - PADDLE_HEIGHT)
+        state.ball_x = rng.randrange(LEFT_FACE, RIGHT_PADDLE_X - BALL_SIZE)
+        state.ball_y = rng.randrange(0, FIXED_HEIGHT - BALL_SIZE)
+        state.ball_speed_x = rng.choice((-1, 1)) * rng.randint(1, max_speed)
+        state.ball_speed_y = rng.randint(-max_speed, max_speed)
+        states.append(state)
+    return states
+
+def benchmark(matches=10000, steps=600):
+    import random
+    rng = random.Random(5)
+    inputs = np.array([[rng.choice((0, INPUT_UP, INPUT_DOWN)) for _ in range(matches)] for _ in range(2)],
+                      dtype=DTYPE)
+
+    states = random_states(matches, rng)
+    start = time.perf_counter()
+    for frame in range(steps // 10):
+        for state in states:
+            step(state, INPUT_UP, INPUT_DOWN)
+    scalar = matches * (steps // 10) / (time.perf_counter() - start)
+
+    batch = BatchState.from_states(random_states(matches, rng))
+    left, right = inputs
+    start = time.perf_counter()
+    for frame in range(steps):
+        step_batch(batch, left, right)
+    vectorized = matches * steps / (time.perf_counter() - start)
+
+    print(f"[BENCH] sim.step:   {scalar:13,.0f} ball-steps/s")
+    print(f"[BENCH] step_batch: {vectorized:13,.0f} ball-steps/s with {matches} matches ({vectorized / scalar:.0f}x)")
+    return {'scalar_steps_per_sec': scalar, 'batch_steps_per_sec': vectorized}
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--bench":
+        benchmark(int(sys.argv[2]) if len(sys.argv) > 2 else 10000)
@@ -0,0 +1,367 @@
+# Benchmark suite: physics, wire encoding, rendering and loopback networking, compared against a stored baseline.
+#
+#   python src/bench.py                  run everything, write bench_results.json, flag regressions
+#   python src/bench.py --save-baseline  run everything and store the results as the new baseline
+#   python src/bench.py --strict         also exit non-zero on a regression (only meaningful on the baseline's machine)
+import os
+import sys
+import json
+import time
+import random
+import socket
+import asyncio
+import threading
+import statistics
+import subprocess
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")  # Offscreen rendering for the render and loopback benchmarks
+
+from constants import SOCKET_BUFFER_SIZE
+from display import LEAN_IMPORT
+from sim import new_state, step, INPUT_UP, INPUT_DOWN
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+RESULTS_PATH = "bench_results.json"
+TOLERANCE = 0.25  # Flag anything more than 25% worse than the baseline
+REPEATS = 3
+LOOPBACK_WINDOW = 64  # Packets the loopback sender lets be in flight, well inside the host's socket buffer
+LOOPBACK_STALL = 0.05  # Seconds without progress before the sender counts the window's stragglers as lost
+
+# Whether a bigger number is better, per metric
+HIGHER_IS_BETTER = {
+    'physics_steps_per_sec': True,
+    'batch_steps_per_sec': True,
+    'protocol_bytes_per_packet': False,
+    'protocol_encode_us': False,
+    'protocol_decode_us': False,
+    'rollback_16_frames_ms': False,
+    'server_matches_per_core': True,
+    'sendrate_good_packets_per_sec': False,
+    'sendrate_congested_packets_per_sec': False,
+    'recording_record_us': False,
+    'recording_replay_speedup': True,
+    'profiler_frame_us': False,
+    'lobby_heartbeat_us': False,
+    'lobby_page_us': False,
+    'lobby_search_us': False,
+    'render_native_ms': False,
+    'render_scaled_ms': False,
+    'loopback_rtt_p50_ms': False,
+    'loopback_rtt_p99_ms': False,
+    'loopback_packets_per_sec': True,
+    'loopback_loss_pct': False,
+    'receive_packets_per_sec': True,
+    'receive_backlog_ms': False,
+    'startup_headless_import_ms': False,
+    'startup_first_lobby_frame_ms': False,
+    'startup_first_lobby_frame_lean_ms': False,
+    'lobby_idle_cpu_pct': False,
+}
+
+# What servers, bots, replays and tests import; none of it should need pygame
+HEADLESS_MODULES = ("sim", "protocol", "reliable", "netsync", "sendrate", "rollback", "recording", "rooms", "telemetry")
+HEADLESS_IMPORT = '''
+import sys, time
+start = time.perf_counter()
+import {modules}
+print((time.perf_counter() - start) * 1000, "pygame" in sys.modules)
+'''
+# The client from a cold interpreter to its first lobby frame, which exits the process instead of being shown
+FIRST_LOBBY_FRAME = '''
+import os
+import p2p
+def first_frame():
+    print(flush=True)
+    os._exit(0)
+p2p.pygame.display.flip = first_frame
+p2p.room_selection_screen()
+'''
+# The client sitting in its lobby with nobody touching it, as on a kiosk; a thread reports the process's CPU use
+LOBBY_IDLE = '''
+import os, threading, time
+import p2p
+def report():
+    time.sleep({settle})
+    cpu, wall = time.process_time(), time.monotonic()
+    time.sleep({seconds})
+    print((time.process_time() - cpu) / (time.monotonic() - wall) * 100, flush=True)
+    os._exit(0)
+threading.Thread(target=report, daemon=True).start()
+p2p.room_selection_screen()
+'''
+
+def bench_physics(steps=200000):
+    rng = random.Random(42)
+    inputs = [rng.choice((0, INPUT_UP, INPUT_DOWN)) for _ in range(1024)]
+    best = 0
+    for _ in range(REPEATS):
+        state = new_state(True)
+        start = time.perf_counter()
+        for i in range(steps):
+            step(state, inputs[i & 1023], inputs[(i * 7) & 1023])
+        best = max(best, steps / (time.perf_counter() - start))
+    return {'physics_steps_per_sec': best}
+
+def bench_batch():
+    import batch
+    return {'batch_steps_per_sec': max(batch.benchmark()['batch_steps_per_sec'] for _ in range(REPEATS))}
+
+def bench_protocol():
+    import protocol
+    runs = [protocol.benchmark(20000) for _ in range(REPEATS)]
+    return {
+        'protocol_bytes_per_packet': runs[0]['bytes'],
+        'protocol_encode_us': min(run['encode_us'] for run in runs),
+        'protocol_decode_us': min(run['decode_us'] for run in runs),
+    }
+
+def bench_rollback():
+    import rollback
+    return {'rollback_16_frames_ms': min(rollback.benchmark() for _ in range(REPEATS)) * 1000}
+
+def bench_server():
+    import server
+    return {'server_matches_per_core': max(server.benchmark(200, 2.0) for _ in range(REPEATS))}
+
+def bench_sendrate():
+    import sendrate
+    results = sendrate.benchmark()
+    return {
+        'sendrate_good_packets_per_sec': results['client_good'][0] + results['host_good'][0],
+        'sendrate_congested_packets_per_sec': results['client_congested'][0] + results['host_congested'][0],
+    }
+
+def bench_recording():
+    import recording
+    runs = [recording.benchmark() for _ in range(REPEATS)]
+    return {
+        'recording_record_us': min(run['record_us'] for run in runs),
+        'recording_replay_speedup': max(run['replay_speedup'] for run in runs),
+    }
+
+def bench_profiler():
+    import profiler
+    return {'profiler_frame_us': min(profiler.benchmark()['frame_us'] for _ in range(REPEATS))}
+
+def bench_lobby():
+    import lobby
+    runs = [lobby.benchmark(20000) for _ in range(REPEATS)]
+    return {
+        'lobby_heartbeat_us': min(run['heartbeat_us'] for run in runs),
+        'lobby_page_us': min(run['first_page_us'] for run in runs),
+        'lobby_search_us': min(run['name_search_us'] for run in runs),
+    }
+
+def bench_render():
+    import render
+    from constants import FIXED_WIDTH, FIXED_HEIGHT
+    results = render.benchmark(300)
+    return {
+        'render_native_ms': results[((FIXED_WIDTH, FIXED_HEIGHT), "renderer")],
+        'render_scaled_ms': results[((1280, 720), "renderer")],
+    }
+
+def bench_loopback(pings=500, packets=20000):
+    # A host/client pair on ephemeral ports, each on its own engine, through the game's HELLO handshake
+    # and receive_data, with the host answering from a second thread. Nothing is bound to the game's own
+    # ports and no room is advertised, so this runs fine next to a live game.
+    import p2p
+    from engine import NetEngine
+    from handshake import wait_for_client, connect_to_host
+    from protocol import SnapshotEncoder, SnapshotDecoder
+    from netsync import ClockSync, SnapshotInbox, now_ms
+    from telemetry import ConnectionStats
+
+    host_net, client_net = NetEngine(), NetEngine()
+    host_endpoint = host_net.open(buffer_size=SOCKET_BUFFER_SIZE)
+    client = client_net.open(buffer_size=SOCKET_BUFFER_SIZE)
+    host = {}
+    def run_host():
+        host['handshake'] = host_net.wait(wait_for_client(host_endpoint, "bench-host", "p2p"), 5)
+    thread = threading.Thread(target=run_host, daemon=True)
+    thread.start()
+    _, host_addr, _ = client_net.wait(connect_to_host(client, ("127.0.0.1", host_endpoint.port), "bench-client"))
+    thread.join()
+
+    peer_clock = ClockSync()
+    stats = ConnectionStats(peer_clock)
+    p2p.receive_data(host_endpoint, SnapshotDecoder(), peer_clock, SnapshotInbox(), stats, host['handshake'][2],
+                     SnapshotInbox())
+    running = True
+    def serve_host():
+        while running:
+            host_net.poll(0.05)
+    host_thread = threading.Thread(target=serve_host)
+    host_thread.start()
+
+    async def ping_host():
+        pinger = ClockSync()
+        rtts = []
+        for _ in range(pings):
+            start = time.perf_counter()
+            client.sendto(pinger.make_ping(), host_addr)
+            try:
+                await asyncio.wait_for(client.recv(), 1)
+            except asyncio.TimeoutError:
+                continue
+            rtts.append((time.perf_counter() - start) * 1000)
+        return sorted(rtts)
+    rtts = client_net.loop.run_until_complete(ping_host())
+
+    # The sender keeps at most LOOPBACK_WINDOW packets unreceived, so what's measured is how fast the host
+    # takes packets in, not how fast the kernel can drop them from a full socket buffer
+    received_before = stats.packets_received
+    encoder = SnapshotEncoder()
+    start = time.perf_counter()
+    for i in range(packets):
+        in_flight = i - (stats.packets_received - received_before)
+        if in_flight >= LOOPBACK_WINDOW:
+            waiting_since = time.perf_counter()
+            while in_flight >= LOOPBACK_WINDOW // 2 and time.perf_counter() - waiting_since < LOOPBACK_STALL:
+                time.sleep(0)  # Hands the GIL to the host thread
+                in_flight = i - (stats.packets_received - received_before)
+        client.sendto(encoder.encode((100 + i % 300, 0, 0, 0, 0), None, now_ms()), host_addr)
+        if i % 16 == 0:
+            client_net.poll(0)  # Flush anything the transport had to buffer
+    # Wait for the host to take in the last window
+    last, idle_since = -1, time.perf_counter()
+    while time.perf_counter() - idle_since < 0.2:
+        if stats.packets_received != last:
+            last, idle_since = stats.packets_received, time.perf_counter()
+        client_net.poll(0.01)
+    elapsed = idle_since - start
+    received = stats.packets_received - received_before
+
+    running = False
+    host_thread.join()
+    client_net.close()
+    host_net.close()
+    return {
+        'loopback_rtt_p50_ms': statistics.median(rtts),
+        'loopback_rtt_p99_ms': rtts[int(len(rtts) * 0.99) - 1],
+        'loopback_packets_per_sec': received / elapsed,
+        'loopback_loss_pct': 100.0 * (packets - received) / packets,
+    }
+
+def bench_receive(backlogs=200, backlog=100):
+    # The state a client is in after a hitch: `backlog` snapshots already waiting in the socket. Times how long
+    # receive_data takes to get through them, reading a datagram per event loop pass as asyncio's transport does
+    # and drained in batches with only the newest decoded.
+    import p2p
+    from engine import NetEngine
+    from protocol import SnapshotEncoder, SnapshotDecoder
+    from netsync import ClockSync, SnapshotInbox
+    from telemetry import ConnectionStats
+
+    results = {}
+    for mode, drain in (('per-datagram', False), ('drained', True)):
+        net = NetEngine()
+        endpoint = net.open(0, buffer_size=SOCKET_BUFFER_SIZE)
+        stats = ConnectionStats(ClockSync())
+        inbox = SnapshotInbox()
+        p2p.receive_data(endpoint, SnapshotDecoder(), ClockSync(), inbox, stats, None, SnapshotInbox(), drain)
+        sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        target = ('127.0.0.1', endpoint.port)
+        encoder = SnapshotEncoder()
+        busy, recoveries, applied = 0.0, [], 0
+        for i in range(backlogs):
+            for j in range(backlog):
+                sender.sendto(encoder.encode((100 + j, 200, 300 + i % 50, 0, 0), None, j), target)
+            expected = stats.packets_received + backlog
+            start = time.perf_counter()
+            while stats.packets_received < expected:
+                net.poll(0)
+            elapsed = time.perf_counter() - start
+            busy += elapsed
+            recoveries.append(elapsed * 1000)
+            applied += len(inbox.drain())
+        sender.close()
+        net.close()
+        results[mode] = (backlogs * backlog / busy, statistics.median(recoveries))
+        print(f"[BENCH] {mode:12} receive: {results[mode][0]:9.0f} packets/s, a {backlog}-packet backlog cleared in "
+              f"{results[mode][1]:.2f} ms with {applied / backlogs:.0f} snapshots applied")
+    return {'receive_packets_per_sec': results['drained'][0], 'receive_backlog_ms': results['drained'][1]}
+
+def bench_startup():
+    # The first lobby frame is timed as shipped and with display.py's opt-in lean pygame import
+    src = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, PYGAME_HIDE_SUPPORT_PROMPT="1")
+    env.pop(LEAN_IMPORT, None)
+    lean_env = dict(env, **{LEAN_IMPORT: "1"})
+    imports, frames, lean_frames = [], [], []
+    for _ in range(REPEATS):
+        output = subprocess.run([sys.executable, "-c", HEADLESS_IMPORT.format(modules=", ".join(HEADLESS_MODULES))],
+                                cwd=src, env=env, capture_output=True, text=True, check=True).stdout.split()
+        if output[1] == "True":
+            print("[BENCH] Warning: a headless module imported pygame")
+        imports.append(float(output[0]))
+
+        for times, client_env in ((frames, env), (lean_frames, lean_env)):
+            start = time.perf_counter()
+            client = subprocess.Popen([sys.executable, "-c", FIRST_LOBBY_FRAME], cwd=src, env=client_env,
+                                      stdout=subprocess.PIPE, text=True)
+            client.stdout.readline()
+            times.append((time.perf_counter() - start) * 1000)
+            client.wait()
+    print(f"[BENCH] Headless imports {min(imports):.1f} ms, cold start to first lobby frame {min(frames):.0f} ms, "
+          f"{min(lean_frames):.0f} ms with {LEAN_IMPORT}=1")
+    return {'startup_headless_import_ms': min(imports), 'startup_first_lobby_frame_ms': min(frames),
+            'startup_first_lobby_frame_lean_ms': min(lean_frames)}
+
+def bench_lobby_idle(seconds=5.0):
+    src = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, PYGAME_HIDE_SUPPORT_PROMPT="1")
+    output = subprocess.run([sys.executable, "-c", LOBBY_IDLE.format(settle=1.5, seconds=seconds)], cwd=src, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    cpu = float(output.split()[0])
+    print(f"[BENCH] Idle lobby: {cpu:.2f}% of one core")
+    return {'lobby_idle_cpu_pct': cpu}
+
+BENCHMARKS = [bench_physics, bench_batch, bench_protocol, bench_rollback, bench_server, bench_sendrate, bench_recording, bench_profiler, bench_lobby, bench_loopback, bench_receive, bench_render, bench_startup, bench_lobby_idle]
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    regressions = []
+    for name, value in results.items():
+        old = baseline.get(name)
+        if old is None or old == 0 or name not in HIGHER_IS_BETTER:
+            continue
+        change = (value - old) / abs(old)
+        worse = -change if HIGHER_IS_BETTER[name] else change
+        if worse > tolerance:
+            regressions.append((name, old, value, worse))
+    return regressions
+
+def main():
+    results = {}
+    for benchmark in BENCHMARKS:
+        try:
+            results.update(benchmark())
+        except ImportError as e:
+            print(f"[BENCH] Skipping {benchmark.__name__}: {e}")
+
+    print()
+    for name, value in results.items():
+        print(f"{name:28} {value:14.3f}")
+    with open(RESULTS_PATH, "w") as f:
+        json.dump(results, f, indent=2)
+
+    if "--save-baseline" in sys.argv:
+        with open(BASELINE_PATH, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\n[BENCH] Baseline saved to {BASELINE_PATH}")
+        return 0
+    if not os.path.exists(BASELINE_PATH):
+        print("\n[BENCH] No baseline yet; run with --save-baseline to create one")
+        return 0
+
+    with open(BASELINE_PATH) as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline)
+    for name, old, value, worse in regressions:
+        print(f"[REGRESSION] {name}: {old:.3f} -> {value:.3f} ({worse * 100:.0f}% worse)")
+    if not regressions:
+        print("\n[BENCH] No regressions against the baseline")
+    return 1 if regressions and "--strict" in sys.argv else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
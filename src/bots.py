@@ -0,0 +1,263 @@
+# Headless bot players and a load generator for stress-testing a host or dedicated server before an event.
+# Bots join through the same HELLO handshake as the pygame client, then play the gameplay stream with a
+# tracking AI. The load generator spreads them over a process pool, each process running its bots as
+# tasks on one event loop, and reports latency percentiles, loss and the server's CPU use.
+#
+#   python src/bots.py --spawn-server --bots 200 --processes 8 --duration 30
+#   python src/bots.py --host 192.168.1.10 --bots 100 --server-pid 4242
+import argparse
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import time
+from multiprocessing import Pool
+
+from constants import PORT, GAME_SPEED, BALL_SIZE, PADDLE_HEIGHT, SOCKET_BUFFER_SIZE
+from engine import NetEngine
+from handshake import connect_to_host, parse_hello_ack
+from netsync import ClockSync, is_clock_packet, now_ms
+from protocol import SnapshotEncoder, SnapshotDecoder, snapshot_from_state
+from reliable import is_reliable_packet
+from sendrate import SendScheduler
+from sim import new_state, move_paddle, PADDLE_START_Y, INPUT_UP, INPUT_DOWN
+from telemetry import ConnectionStats
+
+BOT_PING_INTERVAL = 0.25  # More often than a player, for enough RTT samples to take percentiles
+REACTION_FRAMES = 6  # The AI only updates its target this often, like a human's reaction time
+AIM_ERROR = PADDLE_HEIGHT // 3
+STARTUP_GRACE = 2.0  # Seconds of pairing wait allowed beyond the ramp
+
+class Bot:
+    def __init__(self, endpoint, host_addr, username, seed=0):
+        self.endpoint = endpoint
+        self.host_addr = host_addr
+        self.username = username
+        self.rng = random.Random(seed)
+        self.stats = ConnectionStats(name=username)
+        self.rtts = []
+        self.handshake_ms = None
+        self.error = None
+        self.played = 0.0
+        self.target = PADDLE_START_Y
+        self.aim = 0
+        self.coming = False
+
+    def track(self, state, is_left, frame):
+        # Follows the ball while it's coming this way, otherwise drifts back to the middle
+        if frame % REACTION_FRAMES == 0:
+            coming = state.ball_speed_x < 0 if is_left else state.ball_speed_x > 0
+            if coming and not self.coming:
+                self.aim = self.rng.randint(-AIM_ERROR, AIM_ERROR)
+            self.coming = coming
+            if coming:
+                self.target = state.ball_y + BALL_SIZE // 2 - PADDLE_HEIGHT // 2 + self.aim
+            else:
+                self.target = PADDLE_START_Y
+        if state.paddle_y < self.target - PADDLE_HEIGHT // 10:
+            return INPUT_DOWN
+        if state.paddle_y > self.target + PADDLE_HEIGHT // 10:
+            return INPUT_UP
+        return 0
+
+    async def play(self, duration, wait):
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        try:
+            msg, peer_addr, channel = await asyncio.wait_for(
+                connect_to_host(self.endpoint, self.host_addr, self.username), wait)
+        except asyncio.TimeoutError:
+            msg = None
+        if msg is None:
+            self.error = "not paired in time"
+            return
+        self.handshake_ms = (loop.time() - start) * 1000
+        opponent, mode, is_left = parse_hello_ack(msg)
+        if mode == "rollback":
+            self.error = "rollback host"
+            return
+
+        # The host (or server) runs the ball, so the bot plays exactly like a non-authoritative client
+        state = new_state(is_left)
+        encoder = SnapshotEncoder()
+        decoder = SnapshotDecoder()
+        clock = ClockSync()
+        scheduler = SendScheduler(self.stats)
+        stats = self.stats
+        endpoint = self.endpoint
+        rtts = self.rtts
+        latest = []
+
+        def on_datagram(data, addr):
+            arrival = now_ms()
+            stats.on_receive(len(data))
+            if is_reliable_packet(data):
+                for message in channel.on_packet(data, arrival):
+                    command, _, args = message.partition(b":")
+                    left, _, right = args.partition(b":")
+                    if command == b"SCORE" and left.isdigit() and right.isdigit():
+                        state.left_score, state.right_score = int(left), int(right)
+                return
+            if is_clock_packet(data):
+                newest = clock.samples[-1] if clock.samples else None
+                pong = clock.handle(data, arrival)
+                if pong:
+                    endpoint.sendto(pong, addr)
+                elif clock.samples and clock.samples[-1] is not newest:
+                    rtts.append(clock.samples[-1][0])
+                return
+            result = decoder.decode(data)
+            if result is None:
+                return
+            seq, snapshot, ack, stamp, is_newest = result
+            stats.on_sequence(seq, stamp, arrival)
+            if ack is not None:
+                encoder.on_ack(ack)
+            if is_newest:
+                latest[:] = [snapshot]
+
+        endpoint.set_handler(on_datagram)
+        frame = 0
+        began = loop.time()
+        next_frame = began
+        last_ping = 0.0
+        while loop.time() - began < duration:
+            if latest:
+                state.opponent_paddle_y, state.ball_x, state.ball_y, state.ball_speed_x, state.ball_speed_y = latest[0]
+            bits = self.track(state, is_left, frame)
+            state.paddle_y = move_paddle(state.paddle_y, bits & INPUT_UP, bits & INPUT_DOWN)
+            snapshot = snapshot_from_state(state, include_ball=False)
+            if scheduler.should_send(frame, snapshot):
+                packet = encoder.encode(snapshot, decoder.latest, now_ms())
+                endpoint.sendto(packet, peer_addr)
+                stats.on_send(len(packet))
+            channel.poll(now_ms())
+            now = loop.time()
+            if now - last_ping >= BOT_PING_INTERVAL:
+                last_ping = now
+                endpoint.sendto(clock.make_ping(), peer_addr)
+            frame += 1
+            next_frame += 1 / GAME_SPEED
+            await asyncio.sleep(max(0.0, next_frame - loop.time()))
+        self.played = loop.time() - began
+
+    def result(self):
+        stats = self.stats
+        return {
+            'username': self.username, 'error': self.error, 'handshake_ms': self.handshake_ms, 'rtts': self.rtts,
+            'loss_pct': stats.loss_pct, 'played': self.played, 'packets_sent': stats.packets_sent,
+            'packets_received': stats.packets_received,
+        }
+
+def run_bots(job):
+    # One pool worker: its share of the bots, started evenly over the ramp, all on one event loop
+    host_addr, first, count, duration, ramp, seed = job
+    engine = NetEngine()
+    bots = [Bot(engine.open(buffer_size=SOCKET_BUFFER_SIZE), host_addr, f"bot{first + i}", seed + first + i)
+            for i in range(count)]
+
+    async def start(bot, delay):
+        await asyncio.sleep(delay)
+        await bot.play(duration, ramp - delay + STARTUP_GRACE)
+
+    async def start_all():
+        await asyncio.gather(*(start(bot, ramp * i / count) for i, bot in enumerate(bots)))
+
+    engine.loop.run_until_complete(start_all())
+    engine.close()
+    return [bot.result() for bot in bots]
+
+def process_cpu_seconds(pid):
+    # User + system CPU of another process, from /proc; None where that isn't available
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+def percentile(values, p):
+    return values[min(len(values) - 1, int(len(values) * p))] if values else float('nan')
+
+def positive_int(text):
+    try:
+        value = int(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"not a whole number: {text!r}")
+    if value < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, not {value}")
+    return value
+
+def run_load(host_addr, bots, processes, duration, ramp, server_pid=None, seed=1):
+    per_process = [bots // processes + (1 if i < bots % processes else 0) for i in range(processes)]
+    jobs = []
+    first = 0
+    for count in per_process:
+        if count:
+            jobs.append((host_addr, first, count, duration, ramp, seed))
+        first += count
+
+    print(f"[LOAD] {bots} bots in {len(jobs)} processes against {host_addr[0]}:{host_addr[1]}, "
+          f"ramping up over {ramp:.0f}s, then playing {duration:.0f}s")
+    cpu_start = process_cpu_seconds(server_pid) if server_pid else None
+    started = time.monotonic()
+    with Pool(len(jobs)) as pool:
+        results = [result for batch in pool.map(run_bots, jobs) for result in batch]
+    elapsed = time.monotonic() - started
+    cpu_end = process_cpu_seconds(server_pid) if server_pid else None
+
+    connected = [r for r in results if r['error'] is None]
+    errors = {}
+    for r in results:
+        if r['error']:
+            errors[r['error']] = errors.get(r['error'], 0) + 1
+    rtts = sorted(rtt for r in connected for rtt in r['rtts'])
+    worst_p99 = max((percentile(sorted(r['rtts']), 0.99) for r in connected if r['rtts']), default=float('nan'))
+    handshakes = sorted(r['handshake_ms'] for r in connected)
+    losses = [r['loss_pct'] for r in connected]
+    received = sum(r['packets_received'] for r in connected) / max(1e-9, sum(r['played'] for r in connected))
+
+    print(f"[LOAD] Connected {len(connected)}/{bots}" + (f", failed: {errors}" if errors else ""))
+    if connected:
+        print(f"[LOAD] Handshake incl. pairing p50 {percentile(handshakes, 0.5):.0f} ms, p99 {percentile(handshakes, 0.99):.0f} ms")
+        print(f"[LOAD] RTT over {len(rtts)} pings: p50 {percentile(rtts, 0.5):.1f} ms, p95 {percentile(rtts, 0.95):.1f} ms, "
+              f"p99 {percentile(rtts, 0.99):.1f} ms, max {rtts[-1] if rtts else float('nan'):.1f} ms; "
+              f"worst connection p99 {worst_p99:.1f} ms")
+        print(f"[LOAD] Loss mean {sum(losses) / len(losses):.2f}%, max {max(losses):.2f}%; "
+              f"{received:.1f} packets/s received per bot")
+    cpu = None
+    if cpu_start is not None and cpu_end is not None:
+        cpu = (cpu_end - cpu_start) / elapsed * 100
+        print(f"[LOAD] Server CPU {cpu:.1f}% of one core over {elapsed:.0f}s (pid {server_pid})")
+    elif server_pid:
+        print("[LOAD] Server CPU unavailable on this platform")
+    return {'connected': len(connected), 'rtt_p50_ms': percentile(rtts, 0.5), 'rtt_p99_ms': percentile(rtts, 0.99),
+            'loss_pct': sum(losses) / len(losses) if losses else None, 'server_cpu_pct': cpu}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Headless bots and load generator for P2P Pong")
+    parser.add_argument("--host", default="127.0.0.1", help="host or dedicated server, ip[:port]")
+    parser.add_argument("--bots", type=positive_int, default=20)
+    parser.add_argument("--processes", type=positive_int, default=os.cpu_count() or 1)
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds each bot plays once paired")
+    parser.add_argument("--ramp", type=float, default=5.0, help="seconds over which bots join")
+    parser.add_argument("--server-pid", type=int, help="measure this server process's CPU")
+    parser.add_argument("--spawn-server", action="store_true", help="start a local dedicated server for the run")
+    args = parser.parse_args()
+
+    ip, _, port = args.host.partition(":")
+    server = None
+    server_pid = args.server_pid
+    if args.spawn_server:
+        server = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "server.py")],
+                                  stdout=subprocess.DEVNULL)
+        server_pid = server.pid
+        time.sleep(1.0)
+    try:
+        run_load((ip, int(port or PORT)), args.bots, min(args.processes, args.bots), args.duration, args.ramp,
+                 server_pid)
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
@@ -0,0 +1,18 @@
+PORT = 42069
+DISCOVERY_PORT = 42070
+LOBBY_PORT = 42072
+SPECTATOR_PORT = 42073
+BUFFER_SIZE = 1024
+SOCKET_BUFFER_SIZE = 65536
+FIXED_WIDTH, FIXED_HEIGHT = 960, 540
+PADDLE_WIDTH, PADDLE_HEIGHT = 10, 100
+BALL_SIZE = 20
+BALL_SPEED = 3
+PADDLE_SPEED = 5
+GAME_SPEED = 60
+NETWORK_UPDATE_FREQUENCY = 2
+INTERPOLATION_FACTOR = 0.2
+ROOM_BROADCAST_INTERVAL = 2
+ROOM_HEARTBEAT_INTERVAL = 10  # Room announcements when nothing has changed; probes get answered at once
+ROOM_TIMEOUT = 60
+MAX_USERNAME_BYTES = 64  # UTF-8; keeps every handshake message inside a reliable message's 255 bytes
@@ -0,0 +1,38 @@
+# pygame for the windowed tools, loaded and started only as far as they need. Nothing here runs at import.
+import os
+import sys
+
+# Opt-in with PONG_LEAN_PYGAME=1: pygame's own import pulls in NumPy for surfarray/sndarray and pkg_resources
+# for its bundled-font lookup, well over half its import time. With the variable set, both are hidden while
+# pygame imports, so pygame.surfarray and pygame.sndarray are unavailable for the rest of the process, the
+# font is read from pygame's package directory instead, and anything else importing NumPy or pkg_resources
+# during those milliseconds (another thread, say) gets ImportError. Off by default, since it changes what
+# the process can import.
+PYGAME_OPTIONAL = ("numpy", "pkg_resources")
+LEAN_IMPORT = "PONG_LEAN_PYGAME"
+
+def import_pygame():
+    if "pygame" in sys.modules:
+        return sys.modules["pygame"]
+    if os.environ.get(LEAN_IMPORT) != "1":
+        import pygame
+        return pygame
+    hidden = [name for name in PYGAME_OPTIONAL if name not in sys.modules]
+    for name in hidden:
+        sys.modules[name] = None  # Makes `import name` raise ImportError
+    try:
+        import pygame
+    finally:
+        for name in hidden:
+            if sys.modules.get(name, 0) is None:
+                del sys.modules[name]  # Importable as normal again, e.g. NumPy for batch.py
+    return pygame
+
+def open_window(size, caption, flags=0):
+    # Only the display and fonts: pygame.init() would also bring up audio and joysticks, which nothing uses
+    pygame = import_pygame()
+    pygame.display.init()
+    pygame.font.init()
+    window = pygame.display.set_mode(size, flags)
+    pygame.display.set_caption(caption)
+    return window
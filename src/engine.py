@@ -0,0 +1,161 @@
+# asyncio transport layer: handshake, gameplay and LAN discovery all run as datagram endpoints on one
+# event loop, which the pygame loop drives a frame at a time instead of parking threads in recvfrom.
+import asyncio
+import socket
+
+from constants import BUFFER_SIZE
+from netsync import now_ms
+
+DRAIN_SLOTS = 256  # Datagrams per batch: about as many snapshots as a SOCKET_BUFFER_SIZE receive buffer holds
+
+class Endpoint(asyncio.DatagramProtocol):
+    def __init__(self, on_datagram=None):
+        self.on_datagram = on_datagram  # Called as on_datagram(data, addr); without one, datagrams queue for recv()
+        self.received = asyncio.Queue()
+        self.transport = None
+        self.closed = False
+        self.sock = None  # Set by NetEngine.open, for set_batch_handler
+        self.loop = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        if self.on_datagram:
+            self.on_datagram(data, addr)
+        else:
+            self.received.put_nowait((data, addr))
+
+    def error_received(self, exc):
+        pass  # ICMP errors such as port unreachable; the peer may still come up
+
+    def connection_lost(self, exc):
+        self.closed = True
+
+    def set_handler(self, on_datagram):
+        # Anything that arrived before the handler existed is delivered first, in order
+        self.on_datagram = on_datagram
+        while not self.received.empty():
+            on_datagram(*self.received.get_nowait())
+
+    def set_batch_handler(self, on_batch, drain=True, slots=DRAIN_SLOTS):
+        # Instead of one callback per datagram, on_batch gets a list of (data, addr, read time in ms): the
+        # datagram the transport just read, plus everything else already queued on the socket, read without
+        # blocking into preallocated buffers. Those are memoryviews that get reused, so a handler has to copy
+        # anything it keeps. Each datagram is stamped as it is read, which after a stall is when the backlog was
+        # read, not when it arrived. With drain=False, or on an event loop that doesn't read the socket itself,
+        # each datagram is its own batch.
+        if drain and self.sock is not None and isinstance(self.loop, asyncio.SelectorEventLoop):
+            views = [memoryview(bytearray(BUFFER_SIZE)) for _ in range(slots)]
+            recvfrom_into = self.sock.recvfrom_into
+        else:
+            views = ()
+
+        def drain_socket(data, addr):
+            batch = [(data, addr, now_ms())]
+            while True:
+                full = bool(views)
+                for view in views:
+                    try:
+                        size, addr = recvfrom_into(view)
+                    except (BlockingIOError, InterruptedError):
+                        full = False
+                        break
+                    except OSError:
+                        continue  # An ICMP error surfaced here; it doesn't stop what's queued behind it
+                    batch.append((view[:size], addr, now_ms()))
+                if batch:
+                    on_batch(batch)
+                if not full or self.closed:
+                    return
+                batch = []  # Every slot was used and more may be waiting; the handler is done with these views
+
+        self.set_handler(drain_socket)
+
+    async def recv(self):
+        return await self.received.get()
+
+    def sendto(self, data, addr):
+        if not self.closed:
+            self.transport.sendto(data, addr)
+
+    @property
+    def port(self):
+        return self.transport.get_extra_info('sockname')[1]
+
+    def close(self):
+        if self.transport:
+            self.transport.close()
+
+class NetEngine:
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.endpoints = []
+        self.tasks = set()
+        self.next_frame = None
+
+    def open(self, port=0, on_datagram=None, broadcast=False, reuse=False, buffer_size=None):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            if reuse:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            if broadcast:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+            if buffer_size:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, buffer_size)
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, buffer_size)
+            sock.bind(("0.0.0.0", port))
+            sock.setblocking(False)
+        except OSError:
+            sock.close()
+            raise
+        _, endpoint = self.loop.run_until_complete(
+            self.loop.create_datagram_endpoint(lambda: Endpoint(on_datagram), sock=sock))
+        endpoint.sock = sock
+        endpoint.loop = self.loop
+        self.endpoints = [e for e in self.endpoints if not e.closed] + [endpoint]
+        return endpoint
+
+    def start(self, coro):
+        task = self.loop.create_task(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+    def poll(self, timeout=0.0):
+        # Runs ready callbacks and services sockets for up to `timeout` seconds
+        stop = self.loop.call_later(timeout, self.loop.stop)
+        self.loop.run_forever()
+        stop.cancel()
+
+    def tick(self, fps):
+        # Frame pacing like pygame's Clock.tick, except the wait is spent handling datagrams as they arrive
+        frame = 1 / fps
+        now = self.loop.time()
+        if self.next_frame is None or now - self.next_frame > frame:
+            self.next_frame = now  # Fell behind; don't try to catch up with a burst of frames
+        self.next_frame += frame
+        self.poll(max(0.0, self.next_frame - now))
+
+    def wait(self, coro, timeout=None, on_idle=None, fps=60):
+        # Runs a coroutine to completion while the caller keeps its window responsive through on_idle.
+        # Raises asyncio.TimeoutError if it takes longer than `timeout` seconds.
+        task = self.start(asyncio.wait_for(coro, timeout))
+        while not task.done():
+            self.tick(fps)
+            if on_idle:
+                on_idle()
+        return task.result()
+
+    def close(self):
+        # Cancels every task and closes every socket before the loop goes away, so nothing is left behind
+        if self.loop.is_closed():
+            return
+        for task in list(self.tasks):
+            task.cancel()
+        for endpoint in self.endpoints:
+            endpoint.close()
+        if self.tasks:
+            self.loop.run_until_complete(asyncio.gather(*self.tasks, return_exceptions=True))
+        self.poll(0)  # Let the transports run their connection_lost callbacks
+        self.loop.close()
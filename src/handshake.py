@@ -0,0 +1,85 @@
+# The HELLO exchange that opens every game connection, over the reliable channel. It needs no display,
+# so headless bots (bots.py) join games the same way the pygame client does.
+import asyncio
+
+from constants import ROOM_TIMEOUT, MAX_USERNAME_BYTES
+from netsync import ClockSync, now_ms
+from reliable import ReliableChannel, is_reliable_packet
+
+CONNECT_TIMEOUT = 5.0  # Seconds for the host to acknowledge our HELLO at all
+HANDSHAKE_POLL = 0.02
+WAIT_KEEPALIVE = 2.0  # Seconds between pings while a dedicated server has no opponent for us yet
+
+async def wait_for_client(endpoint, username, mode):
+    # Each would-be client gets its own reliable channel until one of them completes the HELLO exchange
+    channels = {}
+    while True:
+        data, addr = await endpoint.recv()
+        if not is_reliable_packet(data):
+            continue
+        channel = channels.get(addr)
+        if channel is None:
+            channel = channels[addr] = ReliableChannel(lambda packet, addr=addr: endpoint.sendto(packet, addr))
+        now = now_ms()
+        for message in channel.on_packet(data, now):
+            if message.startswith(b"HELLO:"):
+                channel.send(hello_ack(username, "RB" if mode == "rollback" else ""))
+                channel.poll(now)
+                return message.decode(errors="replace").split(":", 1)[1], addr, channel
+        channel.poll(now)
+
+async def connect_to_host(endpoint, host_addr, username, greeting="HELLO"):
+    # The channel resends the HELLO on its own timeout until the host acks it. After that the host is
+    # known to be up, so we wait longer for its HELLO_ACK (a dedicated server sends it once we're paired),
+    # pinging it meanwhile so it doesn't drop us as gone. Spectators greet with WATCH and get a WATCH_ACK.
+    channel = ReliableChannel(lambda packet: endpoint.sendto(packet, host_addr))
+    channel.send(f"{greeting}:{clip_username(username)}".encode())
+    ack = f"{greeting}_ACK:".encode()
+    loop = asyncio.get_running_loop()
+    start = last_keepalive = loop.time()
+    clock = ClockSync()
+    while loop.time() - start < (ROOM_TIMEOUT if not channel.unacked else CONNECT_TIMEOUT):
+        channel.poll(now_ms())
+        if not channel.unacked and loop.time() - last_keepalive >= WAIT_KEEPALIVE:
+            last_keepalive = loop.time()
+            endpoint.sendto(clock.make_ping(), host_addr)
+        try:
+            data, addr = await asyncio.wait_for(endpoint.recv(), HANDSHAKE_POLL)
+        except asyncio.TimeoutError:
+            continue
+        if not is_reliable_packet(data):
+            continue
+        for message in channel.on_packet(data, now_ms()):
+            if message.startswith(ack):
+                channel.poll(now_ms())
+                return message, addr, channel
+    return None, None, None
+
+def clip_username(username):
+    # At most MAX_USERNAME_BYTES once encoded, cut at a character boundary
+    return username.encode()[:MAX_USERNAME_BYTES].decode(errors="ignore")
+
+def hello_ack(username, flag=""):
+    # HELLO_ACK:<flag>:<username>. The flag goes first so nothing typed into a username can pass for one:
+    # L or R for the side a dedicated server put us on, RB from a rollback host, empty from a p2p host.
+    return f"HELLO_ACK:{flag}:{clip_username(username)}".encode()
+
+def parse_hello_ack(message):
+    # Returns (opponent username, mode, is_host) for a client
+    flag, _, opponent = message.decode(errors="replace").split(":", 1)[1].partition(":")
+    if flag in ("L", "R"):
+        return opponent, "dedicated", flag == "L"
+    if flag == "RB":
+        return opponent, "rollback", False
+    return opponent, "p2p", False
+
+def watch_ack(left, right):
+    # WATCH_ACK:<byte length of the left name>:<left name><right name>, so either name may hold a ':'
+    left = clip_username(left).encode()
+    return b"WATCH_ACK:%d:" % len(left) + left + clip_username(right).encode()
+
+def parse_watch_ack(message):
+    # Returns (left name, right name) for a spectator
+    length, _, names = message.split(b":", 1)[1].partition(b":")
+    split = int(length) if length.isdigit() else len(names)
+    return names[:split].decode(errors="replace"), names[split:].decode(errors="replace")
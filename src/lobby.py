@@ -0,0 +1,238 @@
+# Lobby/rendezvous server for when LAN broadcast doesn't reach (or doesn't scale): hosts register their
+# room and heartbeat it, clients page through the listings. Rooms are indexed by id and expire from a
+# heap, so neither requests nor expiry ever rescan the whole table.
+#
+#   python src/lobby.py                   serve on LOBBY_PORT
+#   python src/lobby.py --bench 20000     time registrations and lookups with that many rooms
+#
+# Requests and replies are JSON datagrams:
+#   {"op": "register", "room": {...}}      -> {"op": "registered", "room_id": ...} (also the heartbeat)
+#   {"op": "unregister", "room_id": ...}
+#   {"op": "list", "page": 0, "page_size": 10, "open_only": true, "name": "..."}   (name matches whole words)
+#                                          -> {"op": "rooms", "page": 0, "name": "...", "rooms": [...], "total": N, "more": bool}
+import argparse
+import json
+import random
+import time
+from itertools import islice
+
+from constants import LOBBY_PORT, ROOM_HEARTBEAT_INTERVAL
+from engine import NetEngine
+from rooms import Room, ExpiryHeap
+
+LOBBY_ROOM_TIMEOUT = 3 * ROOM_HEARTBEAT_INTERVAL  # A few missed heartbeats; hosts unregister when they stop
+EXPIRE_INTERVAL = 0.5
+MAX_ROOMS = 50000
+PAGE_SIZE = 10
+MAX_PAGE_SIZE = 20  # Keeps a reply in a single small datagram
+
+class Lobby:
+    # The room index on its own, so it can be driven and benchmarked without sockets
+    def __init__(self, timeout=LOBBY_ROOM_TIMEOUT):
+        self.timeout = timeout
+        self.rooms = {}  # room_id -> Room, in registration order
+        self.open_rooms = {}  # The subset with a free slot, same order
+        self.owners = {}  # room_id -> address that registered it
+        self.expiry = ExpiryHeap()
+        self.words = {}  # lowercase word of a room name -> {room_id: Room}, for name search
+        self.room_words = {}  # room_id -> the words it is indexed under
+
+    def register(self, room, owner, now):
+        room_id = room.room_id
+        current_owner = self.owners.get(room_id)
+        if current_owner is None:
+            if len(self.rooms) >= MAX_ROOMS:
+                return False
+            self.owners[room_id] = owner
+        elif current_owner != owner:
+            return False  # Someone else's room id
+
+        self.rooms[room_id] = room
+        self._index_name(room)
+        if room.player_count < 2:
+            self.open_rooms[room_id] = room
+        else:
+            self.open_rooms.pop(room_id, None)
+        self.expiry.touch(room_id, now + self.timeout)
+        return True
+
+    def unregister(self, room_id, owner):
+        if self.owners.get(room_id) != owner:
+            return False
+        self._remove(room_id)
+        return True
+
+    def _index_name(self, room):
+        words = set(room.name.lower().split())
+        old_words = self.room_words.get(room.room_id, set())
+        for word in old_words - words:
+            self._unindex_word(word, room.room_id)
+        for word in words:
+            self.words.setdefault(word, {})[room.room_id] = room
+        self.room_words[room.room_id] = words
+
+    def _unindex_word(self, word, room_id):
+        rooms = self.words[word]
+        del rooms[room_id]
+        if not rooms:
+            del self.words[word]
+
+    def _remove(self, room_id):
+        del self.rooms[room_id]
+        del self.owners[room_id]
+        self.expiry.discard(room_id)
+        self.open_rooms.pop(room_id, None)
+        for word in self.room_words.pop(room_id):
+            self._unindex_word(word, room_id)
+
+    def expire(self, now):
+        expired = self.expiry.pop_expired(now)
+        for room_id in expired:
+            self._remove(room_id)
+        return len(expired)
+
+    def get(self, room_id):
+        return self.rooms.get(room_id)
+
+    def query(self, page=0, page_size=PAGE_SIZE, open_only=True, name=""):
+        # Returns (rooms, total, more); total is None for name searches, which stop once the page is full
+        index = self.open_rooms if open_only else self.rooms
+        start = page * page_size
+        words = name.lower().split()
+        if not words:
+            rooms = list(islice(index.values(), start, start + page_size))
+            return rooms, len(index), start + page_size < len(index)
+        try:
+            postings = sorted((self.words[word] for word in set(words)), key=len)
+        except KeyError:
+            return [], None, False
+        # Walk the rarest word's rooms and check the rest, so the cost follows the smallest posting list
+        rarest, others = postings[0], postings[1:]
+        matches = (room for room_id, room in rarest.items()
+                   if room_id in index and all(room_id in other for other in others))
+        rooms = list(islice(matches, start, start + page_size + 1))
+        return rooms[:page_size], None, len(rooms) > page_size
+
+def _valid_room(room):
+    return (room is not None and isinstance(room.name, str) and isinstance(room.host_ip, str)
+            and isinstance(room.room_id, str) and isinstance(room.port, int) and isinstance(room.player_count, int))
+
+class LobbyServer:
+    def __init__(self, port=LOBBY_PORT, engine=None):
+        self.engine = engine or NetEngine()
+        self.lobby = Lobby()
+        self.endpoint = self.engine.open(port, self.handle_datagram)
+        self.running = False
+
+    def handle_datagram(self, data, addr):
+        try:
+            request = json.loads(data)
+            op = request["op"]
+        except (ValueError, KeyError, TypeError):
+            return
+        now = time.monotonic()
+
+        if op == "register":
+            room = Room.from_dict(request.get("room"))
+            if not _valid_room(room):
+                return
+            # Behind NAT the address we see is the one other players can reach
+            if not addr[0].startswith("127."):
+                room.host_ip = addr[0]
+            if self.lobby.register(room, addr, now):
+                reply = {"op": "registered", "room_id": room.room_id}
+            else:
+                reply = {"op": "error", "room_id": room.room_id, "reason": "room id taken or lobby full"}
+        elif op == "unregister":
+            if isinstance(request.get("room_id"), str):
+                self.lobby.unregister(request["room_id"], addr)
+            return
+        elif op == "list":
+            try:
+                page = max(0, int(request.get("page", 0)))
+                page_size = min(max(1, int(request.get("page_size", PAGE_SIZE))), MAX_PAGE_SIZE)
+            except (TypeError, ValueError):
+                return
+            name = request.get("name") or ""
+            if not isinstance(name, str):
+                return
+            rooms, total, more = self.lobby.query(page, page_size, bool(request.get("open_only", True)), name)
+            reply = {"op": "rooms", "page": page, "name": name, "rooms": [room.to_dict() for room in rooms],
+                     "total": total, "more": more}
+        else:
+            return
+        self.endpoint.sendto(json.dumps(reply).encode(), addr)
+
+    def serve_forever(self):
+        self.running = True
+        print(f"[LOBBY] Listening on {self.endpoint.port}")
+        while self.running:
+            self.engine.poll(EXPIRE_INTERVAL)
+            expired = self.lobby.expire(time.monotonic())
+            if expired:
+                print(f"[LOBBY] Expired {expired} rooms, {len(self.lobby.rooms)} listed")
+
+    def stop(self):
+        self.running = False
+        self.engine.close()
+
+def benchmark(num_rooms=20000, lookups=2000):
+    rng = random.Random(1)
+    lobby = Lobby()
+    rooms = [Room(f"Room {i}", f"10.0.{i // 256 % 256}.{i % 256}", host_username=f"player{i}") for i in range(num_rooms)]
+    for room in rooms:
+        room.player_count = rng.choice((1, 1, 2))
+
+    start = time.perf_counter()
+    for i, room in enumerate(rooms):
+        lobby.register(room, ("10.0.0.1", i), 0.0)
+    register_us = (time.perf_counter() - start) / num_rooms * 1e6
+
+    start = time.perf_counter()
+    for i in range(num_rooms):
+        lobby.register(rooms[i], ("10.0.0.1", i), 1.0)
+    heartbeat_us = (time.perf_counter() - start) / num_rooms * 1e6
+
+    def timed(query):
+        start = time.perf_counter()
+        for _ in range(lookups):
+            query()
+        return (time.perf_counter() - start) / lookups * 1e6
+
+    last_page = len(lobby.open_rooms) // PAGE_SIZE
+    ids = [room.room_id for room in rooms]
+    results = {
+        'register_us': register_us,
+        'heartbeat_us': heartbeat_us,
+        'get_us': timed(lambda: lobby.get(ids[rng.randrange(num_rooms)])),
+        'first_page_us': timed(lambda: lobby.query(0)),
+        'last_page_us': timed(lambda: lobby.query(last_page)),
+        'name_search_us': timed(lambda: lobby.query(0, name=f"Room {rng.randrange(num_rooms)}")),
+    }
+    # Nothing due yet, then every room at once
+    start = time.perf_counter()
+    lobby.expire(5.0)
+    results['expire_idle_us'] = (time.perf_counter() - start) * 1e6
+    start = time.perf_counter()
+    lobby.expire(100.0)
+    results['expire_all_ms'] = (time.perf_counter() - start) * 1000
+
+    print(f"[BENCH] Lobby with {num_rooms} rooms:")
+    for name, value in results.items():
+        print(f"  {name:16} {value:10.3f}")
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Lobby/rendezvous server for P2P Pong")
+    parser.add_argument("--port", type=int, default=LOBBY_PORT)
+    parser.add_argument("--bench", type=int, metavar="ROOMS", help="benchmark the room index instead of serving")
+    args = parser.parse_args()
+
+    if args.bench:
+        benchmark(args.bench)
+    else:
+        server = LobbyServer(args.port)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            server.stop()
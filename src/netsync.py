@@ -0,0 +1,157 @@
+# Peer clock synchronization (ping/pong) and a jitter buffer that renders remote state a little in the past.
+import struct
+import time
+from collections import deque
+
+from constants import GAME_SPEED, NETWORK_UPDATE_FREQUENCY
+from sendrate import MAX_INTERVAL
+
+PING_INTERVAL = 1.0
+CLOCK_SAMPLES = 8
+SNAPSHOT_HISTORY = 32
+MIN_RENDER_DELAY = 30  # ms
+MAX_EXTRAPOLATION = 100  # ms; past this we hold the newest snapshot instead of guessing
+DELAY_SMOOTHING = 0.05
+TELEPORT_DISTANCE = 100  # A ball reset, not motion, so don't blend across it
+MAX_SEND_GAP = 1000 * MAX_INTERVAL / GAME_SPEED  # ms; longer gaps are an idle sender's keepalives
+
+PING = struct.Struct('!cI')
+PONG = struct.Struct('!cII')
+
+def now_ms():
+    return int(time.monotonic() * 1000)
+
+def _signed(value, bits):
+    value &= (1 << bits) - 1
+    return value - (1 << bits) if value >= 1 << (bits - 1) else value
+
+def is_clock_packet(data):
+    return data[:1] in (b'P', b'Q')
+
+class ClockSync:
+    def __init__(self):
+        self.samples = deque(maxlen=CLOCK_SAMPLES)  # (rtt, offset)
+        self.rtt = None
+        self.offset = None  # Peer clock minus our clock, in ms
+        self.last_ping = 0
+
+    def should_ping(self):
+        return time.monotonic() - self.last_ping >= PING_INTERVAL
+
+    def make_ping(self):
+        self.last_ping = time.monotonic()
+        return PING.pack(b'P', now_ms() & 0xFFFFFFFF)
+
+    def handle(self, data, now):
+        # Returns a pong to send back for a ping, otherwise None
+        try:
+            if data[:1] == b'P':
+                _, sent = PING.unpack(data)
+                return PONG.pack(b'Q', sent, now & 0xFFFFFFFF)
+            _, sent, peer_time = PONG.unpack(data)
+        except struct.error:
+            return None
+
+        rtt = _signed(now - sent, 32)
+        if rtt < 0:
+            return None
+        offset = _signed(peer_time - sent, 32) - rtt / 2
+        self.samples.append((rtt, offset))
+        self.rtt = rtt if self.rtt is None else self.rtt * 0.875 + rtt * 0.125
+        # The lowest-RTT sample had the least queueing, so its offset is the most trustworthy
+        self.offset = min(self.samples)[1]
+        return None
+
+class SnapshotInbox:
+    # Hands decoded packets from the receive handler to the game loop. There is exactly one writer and one
+    # reader, and deque append/popleft are atomic, so this holds even when the two run on different threads.
+    def __init__(self):
+        self.items = deque(maxlen=SNAPSHOT_HISTORY * 4)
+
+    def publish(self, item):
+        self.items.append(item)
+
+    def drain(self):
+        items = []
+        try:
+            while True:
+                items.append(self.items.popleft())
+        except IndexError:
+            return items
+
+class SnapshotBuffer:
+    def __init__(self, clock, min_delay=MIN_RENDER_DELAY, history=SNAPSHOT_HISTORY):
+        self.clock = clock
+        self.snapshots = deque(maxlen=history)  # (time in our clock, values), oldest first
+        self.min_delay = min_delay  # Spectators ask for seconds here, players for as little as is smooth
+        self.interval = 1000 * NETWORK_UPDATE_FREQUENCY / GAME_SPEED
+        self.jitter = 0.0
+        self.delay = max(min_delay, 2 * self.interval)
+        self.last_arrival = None
+        self.bootstrap_offset = None
+
+    def add(self, stamp, values, arrival):
+        # stamp is the sender's clock in ms modulo 2**16
+        offset = self.clock.offset
+        if offset is None:
+            if self.bootstrap_offset is None:
+                self.bootstrap_offset = _signed(stamp - arrival, 16)
+            offset = self.bootstrap_offset
+        sent = arrival + _signed(stamp - round(arrival + offset), 16)
+
+        if self.last_arrival is not None:
+            last_arrival, last_sent = self.last_arrival
+            gap = sent - last_sent
+            if gap > 0:
+                # RFC 3550 style jitter: how much the transit time varies between packets
+                self.jitter += (abs((arrival - last_arrival) - gap) - self.jitter) / 16
+                if gap <= MAX_SEND_GAP:
+                    self.interval += (gap - self.interval) / 16
+        if self.last_arrival is None or sent > self.last_arrival[1]:
+            self.last_arrival = (arrival, sent)
+
+        if self.snapshots and sent <= self.snapshots[-1][0]:
+            if sent < self.snapshots[0][0]:
+                return
+            items = list(self.snapshots)
+            for i, (existing, _) in enumerate(items):
+                if existing == sent:
+                    return
+                if existing > sent:
+                    items.insert(i, (sent, values))
+                    break
+            self.snapshots = deque(items, maxlen=self.snapshots.maxlen)
+            return
+        self.snapshots.append((sent, values))
+
+    def target_delay(self):
+        # Two send intervals rides out a single lost packet; the jitter term absorbs queueing spikes
+        return max(self.min_delay, 2 * self.interval + 3 * self.jitter)
+
+    def sample(self, now):
+        snapshots = self.snapshots
+        if not snapshots:
+            return None
+        self.delay += (self.target_delay() - self.delay) * DELAY_SMOOTHING
+        render_time = now - self.delay
+
+        if render_time <= snapshots[0][0]:
+            return snapshots[0][1]
+        newest_time, newest = snapshots[-1]
+        if render_time >= newest_time:
+            if len(snapshots) < 2 or render_time - newest_time > MAX_EXTRAPOLATION:
+                return newest
+            older_time, older = snapshots[-2]
+            return _blend(older, newest, (render_time - older_time) / (newest_time - older_time))
+
+        for i in range(len(snapshots) - 1, 0, -1):
+            older_time, older = snapshots[i - 1]
+            if older_time <= render_time:
+                newer_time, newer = snapshots[i]
+                return _blend(older, newer, (render_time - older_time) / (newer_time - older_time))
+        return snapshots[0][1]
+
+def _blend(older, newer, t):
+    if any(abs(b - a) > TELEPORT_DISTANCE for a, b in zip(older[1:], newer[1:])):
+        return newer if t >= 1 else older
+    return tuple(a + (b - a) * t for a, b in zip(older, newer))
@@ -1,146 +1,59 @@
-import pygame
-import socket
-import threading
-import struct
+import argparse
+import asyncio
 import time
-import json
-import random
-import string
-
-PORT = 42069
-DISCOVERY_PORT = 42070
-BUFFER_SIZE = 1024
-SOCKET_BUFFER_SIZE = 65536
-FIXED_WIDTH, FIXED_HEIGHT = 960, 540
-PADDLE_WIDTH, PADDLE_HEIGHT = 10, 100
-BALL_SIZE = 20
-BALL_SPEED = 3
-PADDLE_SPEED = 5
-GAME_SPEED = 60
-NETWORK_UPDATE_FREQUENCY = 2
-INTERPOLATION_FACTOR = 0.2
-ROOM_BROADCAST_INTERVAL = 2
-ROOM_TIMEOUT = 60
-
-pygame.init()
-screen = pygame.display.set_mode((800, 600), pygame.RESIZABLE)
-pygame.display.set_caption("P2P Pong")
-clock = pygame.time.Clock()
 
+from constants import (PORT, LOBBY_PORT, SPECTATOR_PORT, SOCKET_BUFFER_SIZE, FIXED_WIDTH, FIXED_HEIGHT, GAME_SPEED,
+                       ROOM_TIMEOUT)
+from display import import_pygame, open_window
+from engine import NetEngine
+from handshake import wait_for_client, connect_to_host, parse_hello_ack, clip_username
+from rooms import RoomManager
+from sim import new_state, save_state, move_paddle, update_ball, INPUT_UP, INPUT_DOWN
+from rollback import RollbackSession
+from protocol import SnapshotEncoder, SnapshotDecoder, snapshot_from_state, seq_newer, SEQ_MOD
+from netsync import ClockSync, SnapshotBuffer, SnapshotInbox, is_clock_packet, now_ms
+from reliable import is_reliable_packet
+from sendrate import SendScheduler
+from render import Renderer
+from telemetry import ConnectionStats, TelemetryWriter
+from timestep import FixedTimestep, blend_state, DEFAULT_RENDER_FPS
+from profiler import FrameProfiler, SPIKE_MS
+from recording import MatchRecorder
+from spectate import SpectatorHub
+
+GAME_STAGES = ('events', 'network', 'input', 'physics', 'send', 'record', 'draw', 'wait')  # For the F4 overlay
+ROLLBACK_STAGES = ('events', 'simulate', 'send', 'draw', 'wait')
+LOBBY_ACTIVE_LINGER = 1.0  # Seconds after the last input that the lobby keeps checking at full rate
+LOBBY_IDLE_POLL = 0.1  # Seconds between input checks once it's idle; the first input after that waits at most this
+LOBBY_LABEL_LIMIT = 128
+
+pygame = import_pygame()
+LOBBY_INPUT_EVENTS = (pygame.MOUSEMOTION, pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP, pygame.MOUSEWHEEL, pygame.KEYDOWN,
+                      pygame.KEYUP, pygame.TEXTINPUT)
+LOBBY_WINDOW_EVENTS = (pygame.VIDEOEXPOSE, pygame.VIDEORESIZE, pygame.WINDOWEXPOSED, pygame.WINDOWSIZECHANGED)
+screen = None  # Created by init_display on first use, so importing this module opens no window
 current_resolution = (FIXED_WIDTH, FIXED_HEIGHT)
-
-class Room:
-    def __init__(self, name, host_ip, room_id=None, host_username="Player"):
-        self.name = name
-        self.host_ip = host_ip
-        self.room_id = room_id or self._generate_id()
-        self.last_update = time.time()
-        self.player_count = 1
-        self.host_username = host_username
-        
-    def _generate_id(self):
-        return ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
-        
-    def to_json(self):
-        return json.dumps({
-            "name": self.name,
-            "host_ip": self.host_ip,
-            "room_id": self.room_id,
-            "player_count": self.player_count,
-            "host_username": self.host_username
-        })
-        
-    @classmethod
-    def from_json(cls, json_str):
-        try:
-            data = json.loads(json_str)
-            room = cls(data["name"], data["host_ip"], data["room_id"], data.get("host_username", "Player"))
-            room.player_count = data["player_count"]
-            return room
-        except:
-            return None
-
-class RoomManager:
-    def __init__(self):
-        self.rooms = {}
-        self.discovery_socket = None
-        self.running = False
-        self.is_host = False
-        self.my_room = None
-        
-    def start(self, is_host=False):
-        self.is_host = is_host
-        self.running = True
-        self.discovery_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.discovery_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self.discovery_socket.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
-        
-        if not is_host:
-            try:
-                self.discovery_socket.bind(("", DISCOVERY_PORT))
-            except:
-                print("[ERROR] Could not bind to discovery port")
-        
-        if is_host:
-            threading.Thread(target=self._broadcast_room, daemon=True).start()
-        else:
-            threading.Thread(target=self._discover_rooms, daemon=True).start()
-    
-    def create_room(self, name, username):
-        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        try:
-            s.connect(('8.8.8.8', 80))  # Connect to Google's DNS to determine local IP
-            host_ip = s.getsockname()[0]
-        except:
-            host_ip = '127.0.0.1'
-        finally:
-            s.close()
-            
-        self.my_room = Room(name, host_ip, host_username=username)
-        return self.my_room
-    
-    def get_rooms(self):
-        current_time = time.time()
-        expired_rooms = [room_id for room_id, room in self.rooms.items() 
-                         if current_time - room.last_update > ROOM_TIMEOUT]
-        for room_id in expired_rooms:
-            del self.rooms[room_id]
-            
-        return list(self.rooms.values())
-    
-    def _broadcast_room(self):
-        if not self.my_room:
-            return
-            
-        while self.running and self.is_host:
-            try:
-                room_data = self.my_room.to_json()
-                self.discovery_socket.sendto(room_data.encode(), ('<broadcast>', DISCOVERY_PORT))
-            except:
-                pass
-            time.sleep(ROOM_BROADCAST_INTERVAL)
-    
-    def _discover_rooms(self):
-        self.discovery_socket.settimeout(1)
-        
-        while self.running and not self.is_host:
-            try:
-                data, addr = self.discovery_socket.recvfrom(BUFFER_SIZE)
-                room = Room.from_json(data.decode())
-                if room:
-                    room.last_update = time.time()
-                    self.rooms[room.room_id] = room
-            except socket.timeout:
-                continue
-            except:
-                pass
-    
-    def stop(self):
-        self.running = False
-        if self.discovery_socket:
-            self.discovery_socket.close()
+renderer = None
+engine = None
+lobby_address = None  # (ip, port) of a lobby server from --lobby, if any
+recorder = None  # MatchRecorder from --record, closed by end_game
+room_manager = None  # The host's room announcer; end_game stops it so the room is unlisted at once
+options = None  # Command-line options, from parse_args in main
+
+def get_engine():
+    global engine
+    if engine is None:
+        engine = NetEngine()
+    return engine
+
+def init_display(size=(800, 600)):
+    global screen
+    if screen is None:
+        screen = open_window(size, "P2P Pong", pygame.RESIZABLE)
+    return screen
 
 def room_selection_screen():
+    screen = init_display()
     font = pygame.font.Font(None, 36)
     small_font = pygame.font.Font(None, 24)
 
@@ -149,6 +62,7 @@ def room_selection_screen():
     room_name_input = pygame.Rect(200, 300, 240, 50)
     username_input = pygame.Rect(200, 200, 240, 50)
     resolution_dropdown = pygame.Rect(450, 200, 150, 50)
+    search_input = pygame.Rect(610, 355, 180, 40)
     
     resolutions = ["960x540", "1280x720", "1920x1080", "640x480"]
     dropdown_open = False
@@ -167,16 +81,30 @@ def room_selection_screen():
     active_box = None
     room_name = "Game Room"
     username = "Player"
+    search = ""
     selected_resolution = resolutions[0]
     scroll_offset = 0
     max_visible_rooms = 5
 
-    room_manager = RoomManager()
+    room_manager = RoomManager(get_engine(), lobby_address)
     room_manager.start(False) 
     last_refresh = time.time()
 
+    labels = {}
+    def label(font, text, color):
+        # Text is rendered once and reused; the lobby only ever shows a few dozen strings
+        key = (font, text, tuple(color))
+        surface = labels.get(key)
+        if surface is None:
+            if len(labels) >= LOBBY_LABEL_LIMIT:
+                labels.clear()
+            surface = labels[key] = font.render(text, True, color)
+        return surface
+
+    drawn = None  # What the window currently shows; nothing is drawn until that changes
+    last_input = float('-inf')
+
     while True:
-        screen.fill((30, 30, 30))
         mouse_pos = pygame.mouse.get_pos()
         current_time = time.time()
         keys = pygame.key.get_pressed()
@@ -185,14 +113,17 @@ def room_selection_screen():
 
         if current_time - last_refresh > 3:
             last_refresh = current_time
+            room_manager.refresh(probe=False)  # LAN hosts announce their own changes; only the lobby needs polling
 
         rooms = room_manager.get_rooms()
 
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
-                room_manager.stop()
-                pygame.quit()
-                exit()
+                end_game()
+            if event.type in LOBBY_INPUT_EVENTS:
+                last_input = time.monotonic()
+            elif event.type in LOBBY_WINDOW_EVENTS:
+                drawn = None  # Uncovered or resized: whatever was there is gone
 
             if event.type == pygame.MOUSEBUTTONDOWN:
                 if create_room_button.collidepoint(event.pos):
@@ -200,10 +131,13 @@ def room_selection_screen():
                     return {"role": "host", "room_name": room_name, "username": username, "local_resolution": selected_resolution}
                 elif refresh_button.collidepoint(event.pos):
                     last_refresh = current_time
+                    room_manager.refresh()
                 elif room_name_input.collidepoint(event.pos):
                     active_box = 'room_name'
                 elif username_input.collidepoint(event.pos):
                     active_box = 'username'
+                elif search_input.collidepoint(event.pos):
+                    active_box = 'search'
                 elif resolution_dropdown.collidepoint(event.pos):
                     dropdown_open = not dropdown_open
                 else:
@@ -219,9 +153,14 @@ def room_selection_screen():
                     room_rect = pygame.Rect(200, 410 + i * 60, 400, 50)
                     if room_rect.collidepoint(event.pos):
                         room_manager.stop()
-                        return {"role": "client", "peer_ip": room.host_ip, "local_resolution": selected_resolution, 
+                        return {"role": "client", "peer_ip": room.host_ip, "peer_port": room.port, "local_resolution": selected_resolution, 
                                 "room_name": room.name, "username": username, "host_username": room.host_username}
 
+            if event.type == pygame.MOUSEWHEEL:
+                scroll_offset = max(0, min(scroll_offset - event.y, len(rooms) - max_visible_rooms))
+                if event.y < 0 and scroll_offset + max_visible_rooms >= len(rooms):
+                    room_manager.load_more()  # Scrolled to the end: the lobby may have another page
+
             if event.type == pygame.KEYDOWN:
                 if active_box == 'room_name':
                     if event.key == pygame.K_RETURN:
@@ -236,360 +175,467 @@ def room_selection_screen():
                     elif event.key == pygame.K_BACKSPACE:
                         username = username[:-1]
                     else:
-                        username += event.unicode
+                        username = clip_username(username + event.unicode)  # It has to fit in the HELLO
+                elif active_box == 'search':
+                    if event.key == pygame.K_RETURN:
+                        active_box = None
+                    elif event.key == pygame.K_BACKSPACE:
+                        search = search[:-1]
+                    else:
+                        search += event.unicode
+                    room_manager.refresh(name=search, probe=False)  # The lobby searches by name; LAN rooms are filtered here
+                    scroll_offset = 0
 
         button_color = color_hover if create_room_button.collidepoint(mouse_pos) else color_inactive
         input_color = color_active if active_box == 'room_name' else color_inactive
         username_color = color_active if active_box == 'username' else color_inactive
+        search_color = color_active if active_box == 'search' else color_inactive
         dropdown_color = color_hover if resolution_dropdown.collidepoint(mouse_pos) else color_inactive
         refresh_button_color = color_hover if refresh_button.collidepoint(mouse_pos) else color_inactive
-
-        pygame.draw.rect(screen, button_color, create_room_button, border_radius=10)
-        pygame.draw.rect(screen, refresh_button_color, refresh_button, border_radius=5)
-        pygame.draw.rect(screen, input_color, room_name_input, 2, border_radius=5)
-        pygame.draw.rect(screen, username_color, username_input, 2, border_radius=5)
-        pygame.draw.rect(screen, dropdown_color, resolution_dropdown, border_radius=5)
-
-        screen.blit(font.render("Create Room", True, (0, 0, 0)), (create_room_button.x + 120, create_room_button.y + 10))
-        screen.blit(small_font.render("Refresh", True, (0, 0, 0)), (refresh_button.x + 20, refresh_button.y + 8))
-        screen.blit(font.render("Room Name:", True, (255, 255, 255)), (200, 260))
-        screen.blit(font.render("Username:", True, (255, 255, 255)), (200, 165))
-        if not rooms:
-            msg = "No rooms found. Create one or wait for broadcasts."
-            screen.blit(small_font.render(msg, True, (200, 200, 200)), (250, 410))
+        dropdown_hover = next((i for i, rect in enumerate(dropdown_items) if rect.collidepoint(mouse_pos)), None)
+        visible_rooms = tuple((room.name, room.host_username, room.player_count)
+                              for room in rooms[scroll_offset:scroll_offset + max_visible_rooms])
+
+        # Everything the picture depends on; redraw only when some of it changed
+        view = (button_color, input_color, username_color, search_color, dropdown_color, refresh_button_color, room_name,
+                username, search, selected_resolution, dropdown_open, dropdown_open and dropdown_hover, visible_rooms)
+        if view != drawn:
+            drawn = view
+            screen.fill((30, 30, 30))
+            pygame.draw.rect(screen, button_color, create_room_button, border_radius=10)
+            pygame.draw.rect(screen, refresh_button_color, refresh_button, border_radius=5)
+            pygame.draw.rect(screen, input_color, room_name_input, 2, border_radius=5)
+            pygame.draw.rect(screen, username_color, username_input, 2, border_radius=5)
+            pygame.draw.rect(screen, search_color, search_input, 2, border_radius=5)
+            pygame.draw.rect(screen, dropdown_color, resolution_dropdown, border_radius=5)
+
+            screen.blit(label(font, "Create Room", (0, 0, 0)), (create_room_button.x + 120, create_room_button.y + 10))
+            screen.blit(label(small_font, "Refresh", (0, 0, 0)), (refresh_button.x + 20, refresh_button.y + 8))
+            screen.blit(label(font, "Room Name:", (255, 255, 255)), (200, 260))
+            screen.blit(label(font, "Username:", (255, 255, 255)), (200, 165))
+            if not visible_rooms:
+                msg = "No rooms found. Create one or wait for broadcasts."
+                screen.blit(label(small_font, msg, (200, 200, 200)), (250, 410))
+            else:
+                for i, (name, host_username, player_count) in enumerate(visible_rooms):
+                    room_rect = pygame.Rect(200, 410 + i * 60, 400, 50)
+                    pygame.draw.rect(screen, (100, 100, 100, 180), room_rect, border_radius=5)
+
+                    screen.blit(label(font, name, (255, 255, 255)), (room_rect.x + 10, room_rect.y + 10))
+                    player_text = f"Host: {host_username} | Players: {player_count}/2"
+                    screen.blit(label(small_font, player_text, (200, 200, 200)), (room_rect.x + 200, room_rect.y + 18))
+            screen.blit(label(font, "Resolution:", (255, 255, 255)), (450, 165))
+            screen.blit(label(font, room_name, input_color), (room_name_input.x + 10, room_name_input.y + 10))
+            screen.blit(label(font, username, username_color), (username_input.x + 10, username_input.y + 10))
+            screen.blit(label(small_font, search, search_color) if search else label(small_font, "Search rooms", (120, 120, 120)),
+                        (search_input.x + 10, search_input.y + 12))
+            screen.blit(label(font, selected_resolution, (0, 0, 0)), (resolution_dropdown.x + 10, resolution_dropdown.y + 15))
+
+            # Draw the dropdown menu if open
+            if dropdown_open:
+                for i, rect in enumerate(dropdown_items):
+                    if i < len(resolutions):
+                        pygame.draw.rect(screen, color_hover if i == dropdown_hover else color_inactive, rect)
+                        screen.blit(label(small_font, resolutions[i], (0, 0, 0)), (rect.x + 10, rect.y + 12))
+
+            screen.blit(label(font, "Available Rooms:", (255, 255, 255)), (200, 360))
+            pygame.display.flip()
+
+        if time.monotonic() - last_input < LOBBY_ACTIVE_LINGER:
+            get_engine().tick(GAME_SPEED)  # Someone's using it: follow the mouse and keyboard closely
         else:
-            for i, room in enumerate(rooms[scroll_offset:scroll_offset + max_visible_rooms]):
-                room_rect = pygame.Rect(200, 410 + i * 60, 400, 50)
-                pygame.draw.rect(screen, (100, 100, 100, 180), room_rect, border_radius=5)
-                
-                screen.blit(font.render(room.name, True, (255, 255, 255)), (room_rect.x + 10, room_rect.y + 10))
-                player_text = f"Host: {room.host_username} | Players: {room.player_count}/2"
-                screen.blit(small_font.render(player_text, True, (200, 200, 200)), (room_rect.x + 200, room_rect.y + 18))
-        screen.blit(font.render("Resolution:", True, (255, 255, 255)), (450, 165))
-        screen.blit(font.render(room_name, True, input_color), (room_name_input.x + 10, room_name_input.y + 10))
-        screen.blit(font.render(username, True, username_color), (username_input.x + 10, username_input.y + 10))
-        screen.blit(font.render(selected_resolution, True, (0, 0, 0)), (resolution_dropdown.x + 10, resolution_dropdown.y + 15))
-
-        # Draw the dropdown menu if open
-        if dropdown_open:
-            for i, rect in enumerate(dropdown_items):
-                if i < len(resolutions):
-                    hover = rect.collidepoint(mouse_pos)
-                    pygame.draw.rect(screen, color_hover if hover else color_inactive, rect)
-                    screen.blit(small_font.render(resolutions[i], True, (0, 0, 0)), (rect.x + 10, rect.y + 12))
-
-        screen.blit(font.render("Available Rooms:", True, (255, 255, 255)), (200, 360))
-
-        pygame.display.flip()
-        clock.tick(GAME_SPEED)
-
-
-def setup_network(room_data):
+            # Idle: sleep in the socket wait, handling discovery as it arrives, and look for input a few times a second
+            get_engine().poll(LOBBY_IDLE_POLL)
+
+
+def pump_window():
+    # Keeps the window responsive (and closable) while a handshake is in flight
+    if screen is None:
+        return
+    for event in pygame.event.get():
+        if event.type == pygame.QUIT:
+            end_game()
+
+def setup_network(room_data, net=None):
+    net = net or get_engine()
     role = room_data["role"]
     is_host = role == "host"
     res_text = room_data["local_resolution"]
     room_name = room_data.get("room_name", "Game Room")
     username = room_data.get("username", "Player")
     
-    global current_resolution
+    global current_resolution, room_manager
     try:
         width, height = map(int, res_text.split('x'))
         current_resolution = (width, height)
-        pygame.display.set_mode(current_resolution, pygame.RESIZABLE)
+        if screen is not None:
+            pygame.display.set_mode(current_resolution, pygame.RESIZABLE)
     except:
         print("[ERROR] Invalid resolution format. Using default resolution.")
         current_resolution = (FIXED_WIDTH, FIXED_HEIGHT)
 
-    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    sock.settimeout(ROOM_TIMEOUT)
-    sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCKET_BUFFER_SIZE)
-    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_BUFFER_SIZE)
-    
-    keys = pygame.key.get_pressed()
-    if keys[pygame.K_ESCAPE] or keys[pygame.K_q]:
-        end_game()
+    if screen is not None:
+        keys = pygame.key.get_pressed()
+        if keys[pygame.K_ESCAPE] or keys[pygame.K_q]:
+            end_game()
     
     opponent_username = None  # Will be set during handshake
+    mode = room_data.get("netcode", "p2p")
     
     if is_host:
-        room_manager = RoomManager()
+        endpoint = net.open(PORT, buffer_size=SOCKET_BUFFER_SIZE)
+        room_manager = RoomManager(net, lobby_address)
         room = room_manager.create_room(room_name, username)
         room_manager.start(True)
         
-        sock.bind(("0.0.0.0", PORT))
         print(f"[HOST] Created room: {room_name}")
         print(f"[HOST] Waiting for client on {PORT}...")
         
         try:
-            msg, peer_addr = sock.recvfrom(BUFFER_SIZE)
-            if msg.startswith(b"HELLO:"):
-                opponent_username = msg.decode().split(":", 1)[1]
-                print(f"[HOST] Client '{opponent_username}' connected from {peer_addr}")
-                sock.sendto(f"HELLO_ACK:{username}".encode(), peer_addr)
-                room.player_count = 2
-            else:
-                print("[HOST] Unexpected message. Connection failed.")
-                room_manager.stop()
-                exit()
-        except socket.timeout:
+            opponent_username, peer_addr, channel = net.wait(wait_for_client(endpoint, username, mode), ROOM_TIMEOUT,
+                                                             pump_window)
+        except asyncio.TimeoutError:
             print("[HOST] No client connected. Timeout.")
-            room_manager.stop()
-            exit()
+            end_game()
+        print(f"[HOST] Client '{opponent_username}' connected from {peer_addr}")
+        room.player_count = 2
+        room_manager.announce()  # Shows the room as full right away
     
     else:
         peer_ip = room_data["peer_ip"]
+        peer_port = room_data.get("peer_port", PORT)
         opponent_username = room_data.get("host_username", "Host")
-        sock.bind(("0.0.0.0", 0))
-        print(f"[CLIENT] Bound to {sock.getsockname()[1]}")
-        print(f"[CLIENT] Connecting to host {peer_ip}:{PORT}...")
-
-        for _ in range(5):
-            sock.sendto(f"HELLO:{username}".encode(), (peer_ip, PORT))
-            try:
-                msg, host_addr = sock.recvfrom(BUFFER_SIZE)
-                if msg.startswith(b"HELLO_ACK:"):
-                    host_username = msg.decode().split(":", 1)[1]
-                    opponent_username = host_username
-                    print(f"[CLIENT] Connected to room: {room_name} hosted by '{host_username}'")
-                    peer_addr = host_addr
-                    break
-                else:
-                    print("[CLIENT] Unexpected response from host.")
-                    exit()
-            except socket.timeout:
-                print("[CLIENT] Retrying connection...")
+        endpoint = net.open(buffer_size=SOCKET_BUFFER_SIZE)
+        print(f"[CLIENT] Bound to {endpoint.port}")
+        print(f"[CLIENT] Connecting to host {peer_ip}:{peer_port}...")
+
+        msg, peer_addr, channel = net.wait(connect_to_host(endpoint, (peer_ip, peer_port), username),
+                                           on_idle=pump_window)
+        if msg is None:
+            print("[CLIENT] No response from host. Timeout.")
+            end_game()
+        opponent_username, mode, is_host = parse_hello_ack(msg)
+        print(f"[CLIENT] Connected to room: {room_name} hosted by '{opponent_username}'")
+
+    return endpoint, peer_addr, is_host, username, opponent_username, mode, channel
+
+def receive_data(endpoint, decoder, peer_clock, inbox, stats, channel, events, drain=True):
+    # Installs the gameplay receive handler. It never touches the game state: complete packets are
+    # published to the inbox, and reliable messages to events, which the game loop drains once per tick.
+    # Everything queued on the socket arrives as one batch, and only its newest snapshot is decoded: after
+    # a stall the backlog is skipped in a single pass instead of being replayed a tick at a time.
+    def on_batch(batch):
+        snapshots = []  # (seq, data, arrival) of the batch's gameplay packets
+        newest = None
+        for data, addr, arrival in batch:
+            stats.on_receive(len(data))
+            if is_reliable_packet(data):
+                for message in channel.on_packet(bytes(data), arrival):
+                    events.publish(message)
+                continue
+            if is_clock_packet(data):
+                pong = peer_clock.handle(bytes(data), arrival)
+                if pong:
+                    endpoint.sendto(pong, addr)
+                    stats.on_send(len(pong))
                 continue
-        else:
-            print("[CLIENT] No response from host after multiple attempts. Timeout.")
-            exit()
-
-    return sock, peer_addr, is_host, username, opponent_username
-
-def receive_data(sock, is_host, state, running):
-    last_received_time = time.time()
 
-    while running[0]:
-        try:
-            data, _ = sock.recvfrom(BUFFER_SIZE)
-            packet_id, paddle_y, ball_x, ball_y, ball_speed_x, ball_speed_y, left_score, right_score, score_changed = struct.unpack('!iiiiiiiii', data)
-            
-            last_packet_id = state.get('last_packet_id', 0)
-            if packet_id > last_packet_id:
-                state['last_packet_id'] = packet_id
-                state['opponent_paddle_y_previous'] = state['opponent_paddle_y_target']  # Store previous position
-                state['opponent_paddle_y_target'] = paddle_y  # Update target position
-                state['last_update_time'] = time.time()  # Update the time of the last update
-
-                if not is_host:
-                    state['ball_x'] = ball_x
-                    state['ball_y'] = ball_y
-                    state['ball_speed_x'] = ball_speed_x
-                    state['ball_speed_y'] = ball_speed_y
-
-                last_received_time = time.time()
-                
-                if score_changed:
-                    state['left_score'] = left_score
-                    state['right_score'] = right_score
-
-        except socket.timeout:
-            if not is_host and time.time() - last_received_time > 0.1:
-                state['ball_x'] += state['ball_speed_x']
-                state['ball_y'] += state['ball_speed_y']
-                
-                if state['ball_y'] <= 0 or state['ball_y'] + BALL_SIZE >= FIXED_HEIGHT:
-                    state['ball_speed_y'] *= -1
-                
-            continue
-
-
-def handle_input(state):
+            header = decoder.peek(data)
+            if header is None:
+                continue
+            packet_id, stamp = header
+            stats.on_sequence(packet_id, stamp, arrival)
+            snapshots.append((packet_id, data, arrival))
+            if newest is None or seq_newer(packet_id, newest):
+                newest = packet_id
+
+        # Newest first; one that can't be decoded (its baseline is gone) falls back to the next newest
+        snapshots.sort(key=lambda snapshot: (newest - snapshot[0]) % SEQ_MOD)
+        for index, (_, data, arrival) in enumerate(snapshots):
+            result = decoder.decode(data)
+            if result is not None:
+                _, snapshot, ack, stamp, is_newest = result
+                inbox.publish((snapshot, ack, stamp, arrival, is_newest))
+                stats.coalesced += len(snapshots) - index - 1
+                break
+
+    endpoint.set_batch_handler(on_batch, drain)
+
+
+def read_input_bits():
     keys = pygame.key.get_pressed()
-    if keys[pygame.K_w] and state['paddle_y'] > 0:
-        state['paddle_y'] -= PADDLE_SPEED
-    if keys[pygame.K_s] and state['paddle_y'] < FIXED_HEIGHT - PADDLE_HEIGHT:
-        state['paddle_y'] += PADDLE_SPEED
     if keys[pygame.K_ESCAPE] or keys[pygame.K_q]:
         end_game()
-
-def update_ball(state):
-    score_changed = False
-    state['ball_x'] += state['ball_speed_x']
-    state['ball_y'] += state['ball_speed_y']
-
-    if state['ball_y'] <= 0 or state['ball_y'] + BALL_SIZE >= FIXED_HEIGHT:
-        state['ball_speed_y'] *= -1
-
-    if (50 <= state['ball_x'] <= 50 + PADDLE_WIDTH and state['paddle_y'] <= state['ball_y'] + BALL_SIZE // 2 <= state['paddle_y'] + PADDLE_HEIGHT) or \
-       (FIXED_WIDTH - 50 - PADDLE_WIDTH <= state['ball_x'] + BALL_SIZE <= FIXED_WIDTH - 50 and state['opponent_paddle_y'] <= state['ball_y'] + BALL_SIZE // 2 <= state['opponent_paddle_y'] + PADDLE_HEIGHT):
-        state['ball_speed_x'] *= -1
-
-    if state['ball_x'] <= 0:  
-        state['right_score'] += 1  
-        score_changed = True
-        reset_ball(state)
-
-    if state['ball_x'] >= FIXED_WIDTH:
-        state['left_score'] += 1 
-        score_changed = True
-        reset_ball(state)
-        
-    return score_changed
-
-def draw_game(state, is_host, username, opponent_username):
-    fixed_surface = pygame.Surface((FIXED_WIDTH, FIXED_HEIGHT))
-    fixed_surface.fill((0, 0, 0))
-
-    font = pygame.font.Font(None, 28)
-    small_font = pygame.font.Font(None, 24)
-
-    ball_x = state['ball_x']
-    if not is_host:
-        paddle_x = FIXED_WIDTH - 50 - PADDLE_WIDTH
-        opponent_x = 50
-        left_username = opponent_username
-        right_username = username
+    return (INPUT_UP if keys[pygame.K_w] else 0) | (INPUT_DOWN if keys[pygame.K_s] else 0)
+
+def render_fps():
+    # --fps N draws at most N frames/s (0: as fast as possible); otherwise the display's rate where pygame can
+    # report it. The simulation runs at GAME_SPEED either way.
+    if options and options.fps is not None:
+        return options.fps
+    refresh_rates = getattr(pygame.display, "get_desktop_refresh_rates", None)
+    rates = refresh_rates() if refresh_rates else None
+    return rates[0] if rates and rates[0] > 0 else DEFAULT_RENDER_FPS
+
+def pace_frame(net, fps):
+    # Waits out the rest of the frame handling datagrams; uncapped, it only handles what's already arrived
+    if fps > 0:
+        net.tick(fps)
     else:
-        paddle_x = 50
-        opponent_x = FIXED_WIDTH - 50 - PADDLE_WIDTH
-        left_username = username
-        right_username = opponent_username
-
-    network_lag = abs(state['opponent_paddle_y'] - state['opponent_paddle_y_target'])
-    indicator_color = (0, 255, 0)  # Green by default
-    if network_lag > 20:
-        indicator_color = (255, 255, 0)  # Yellow
-    if network_lag > 50:
-        indicator_color = (255, 0, 0)  # Red
-    pygame.draw.circle(fixed_surface, indicator_color, (20, 20), 10)
-
-    pygame.draw.rect(fixed_surface, (255, 255, 255), (paddle_x, state['paddle_y'], PADDLE_WIDTH, PADDLE_HEIGHT))
-    pygame.draw.rect(fixed_surface, (255, 255, 255), (opponent_x, state['opponent_paddle_y'], PADDLE_WIDTH, PADDLE_HEIGHT))
-    pygame.draw.ellipse(fixed_surface, (255, 255, 255), (ball_x, state['ball_y'], BALL_SIZE, BALL_SIZE))
-    pygame.draw.aaline(fixed_surface, (255, 255, 255), (FIXED_WIDTH // 2, 0), (FIXED_WIDTH // 2, FIXED_HEIGHT))
-
-    # Draw usernames above paddles
-    left_text = font.render(left_username, True, (255, 255, 255))
-    right_text = font.render(right_username, True, (255, 255, 255))
-    fixed_surface.blit(left_text, (50, 20))
-    fixed_surface.blit(right_text, (FIXED_WIDTH - 50 - right_text.get_width(), 20))
-
-    # Draw scores under usernames
-    left_score = small_font.render(str(state['left_score']), True, (255, 255, 255))
-    right_score = small_font.render(str(state['right_score']), True, (255, 255, 255))
-    fixed_surface.blit(left_score, (50 + left_text.get_width()//2 - left_score.get_width()//2, 50))
-    fixed_surface.blit(right_score, (FIXED_WIDTH - 50 - right_text.get_width()//2 - right_score.get_width()//2, 50))
-
-    scaled_surface = pygame.transform.scale(fixed_surface, current_resolution)
-    screen.blit(scaled_surface, (0, 0))
-    pygame.display.flip()
+        net.poll(0)
+
+def make_profiler(stages):
+    return FrameProfiler(stages, options.spike_ms if options else SPIKE_MS)
+
+def handle_profiler_key(event, profiler, show_profile):
+    # F4 toggles the frame-time overlay, F5 profiles the next few seconds; returns the new overlay setting
+    if event.key == pygame.K_F4:
+        return not show_profile
+    if event.key == pygame.K_F5:
+        profiler.request_capture()
+    return show_profile
+
+def draw_game(state, is_host, username, opponent_username, stats=None, show_overlay=False, profiler=None):
+    global renderer
+    if renderer is None:
+        init_display(current_resolution)
+        renderer = Renderer()
+    health = stats.health() if stats else 0
+    overlay_lines = stats.overlay_lines() if stats and show_overlay else None
+    if profiler:
+        overlay_lines = (overlay_lines or []) + profiler.overlay_lines()
+    renderer.draw(state, is_host, username, opponent_username, current_resolution, health, overlay_lines)
+
+def run_rollback(endpoint, peer_addr, is_host, username, opponent_username, channel):
+    session = RollbackSession(0 if is_host else 1)
+    running = True
+
+    def on_datagram(data, addr):
+        if addr != peer_addr:
+            return
+        if is_reliable_packet(data):
+            channel.on_packet(data, now_ms())  # Only the handshake uses it here, but a lost ACK still gets resent
+        else:
+            session.on_packet(data)
+    endpoint.set_handler(on_datagram)
+
+    timestep = FixedTimestep()
+    fps = render_fps()
+    previous = current = save_state(session.view())
+    view = new_state(is_host)
+    profiler = make_profiler(ROLLBACK_STAGES)
+    show_profile = False
+    while running:
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                running = False
+            elif event.type == pygame.KEYDOWN:
+                show_profile = handle_profiler_key(event, profiler, show_profile)
+        profiler.mark('events')
+
+        for _ in range(timestep.advance(time.perf_counter())):
+            # Stall rather than predict further than the saved-state ring can undo
+            if session.can_advance():
+                session.add_local_input(read_input_bits())
+                session.advance()
+            profiler.mark('simulate')
+            endpoint.sendto(session.build_packet(), peer_addr)
+            channel.poll(now_ms())
+            # A rollback can move things further than a tick would; blend_state snaps anything that jumped far
+            previous, current = current, save_state(session.view())
+            profiler.mark('send')
+
+        blend_state(previous, current, timestep.alpha, view)
+        draw_game(view, is_host, username, opponent_username, profiler=profiler if show_profile else None)
+        profiler.mark('draw')
+        pace_frame(get_engine(), fps)
+        profiler.mark('wait')
+        profiler.end_frame()
+
+    profiler.close()
+    end_game()
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="P2P Pong")
+    parser.add_argument("--lobby", metavar="IP[:PORT]", help="lobby server to list and find rooms through")
+    parser.add_argument("--rollback", action="store_true", help="host with rollback netcode")
+    parser.add_argument("--fps", type=int, help="render at most this many frames/s, 0 for uncapped "
+                                                "(default: the display's refresh rate)")
+    parser.add_argument("--spike-ms", type=float, default=SPIKE_MS, help="log frames slower than this")
+    parser.add_argument("--telemetry", metavar="PATH", help="write connection stats to a .jsonl or .csv file")
+    parser.add_argument("--record", metavar="PATH", help="record the match for src/recording.py to replay")
+    args = parser.parse_args(argv)
+    if args.fps is not None and args.fps < 0:
+        parser.error("--fps must be 0 or more")
+    if args.spike_ms <= 0:
+        parser.error("--spike-ms must be more than 0")
+    if args.lobby:
+        lobby_ip, _, lobby_port = args.lobby.partition(":")
+        if not lobby_ip or lobby_port and not lobby_port.isdigit():
+            parser.error(f"--lobby wants IP[:PORT], not {args.lobby!r}")
+        args.lobby = (lobby_ip, int(lobby_port or LOBBY_PORT))
+    return args
 
 def main():
+    global lobby_address, recorder, options
+    options = parse_args()
+    lobby_address = options.lobby
     room_data = room_selection_screen()
-    
-    sock, peer_addr, is_host, username, opponent_username = setup_network(room_data)
-
-    state = {
-    'paddle_y': (FIXED_HEIGHT - PADDLE_HEIGHT) // 2,
-    'opponent_paddle_y': (FIXED_HEIGHT - PADDLE_HEIGHT) // 2,
-    'opponent_paddle_y_target': (FIXED_HEIGHT - PADDLE_HEIGHT) // 2,
-    'opponent_paddle_y_previous': (FIXED_HEIGHT - PADDLE_HEIGHT) // 2,
-    'last_update_time': time.time(),  # Store the time of the last update
-    'ball_x': FIXED_WIDTH // 2,
-    'ball_y': FIXED_HEIGHT // 2,
-    'ball_speed_x': BALL_SPEED * (1 if is_host else -1),
-    'ball_speed_y': BALL_SPEED,
-    'left_score': 0,
-    'right_score': 0,
-    'last_packet_id': 0,
-    'last_score_packet_id': 0,
-    'score_changed': False
-    }
-
-    running = [True]
-    frame_counter = 0
-    packet_id = 0
+    init_display()  # Already open unless the lobby was skipped
+    if options.rollback:
+        room_data["netcode"] = "rollback"
 
-    threading.Thread(target=receive_data, args=(sock, is_host, state, running), daemon=True).start()
+    endpoint, peer_addr, is_host, username, opponent_username, mode, channel = setup_network(room_data)
+    if mode == "rollback":
+        run_rollback(endpoint, peer_addr, is_host, username, opponent_username, channel)
+        return
+    # Against a dedicated server neither side runs the authoritative physics
+    authoritative = is_host and mode == "p2p"
 
-    while running[0]:
+    state = new_state(is_host)
+
+    running = True
+    frame_counter = 0
+    encoder = SnapshotEncoder()
+    decoder = SnapshotDecoder()
+    peer_clock = ClockSync()
+    snapshots = SnapshotBuffer(peer_clock)
+    inbox = SnapshotInbox()
+    events = SnapshotInbox()
+    stats = ConnectionStats(peer_clock, opponent_username)
+    scheduler = SendScheduler(stats)
+    show_overlay = False
+    paused = False
+    telemetry = None
+    if options.telemetry:
+        telemetry = TelemetryWriter(options.telemetry)
+    if options.record:
+        recorder = MatchRecorder(options.record, state, is_host, authoritative,
+                                 username, opponent_username)
+
+    def send_reliable(packet):
+        endpoint.sendto(packet, peer_addr)
+        stats.on_send(len(packet))
+    channel.send_packet = send_reliable
+    receive_data(endpoint, decoder, peer_clock, inbox, stats, channel, events)
+    net = get_engine()
+    spectators = None
+    if authoritative:
+        # Only the side running the ball has the whole match to show
+        try:
+            spectators = SpectatorHub(net, SPECTATOR_PORT, (username, opponent_username))
+        except OSError as e:
+            print(f"[SPECTATE] Can't accept spectators on {SPECTATOR_PORT}: {e}")
+
+    timestep = FixedTimestep()
+    fps = render_fps()
+    previous = save_state(state)
+    view = new_state(is_host)
+    profiler = make_profiler(GAME_STAGES)
+    show_profile = False
+    while running:
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
-                running[0] = False
+                running = False
             elif event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_p:
-                    paused = True
-                    while paused:
-                        for pause_event in pygame.event.get():
-                            if pause_event.type == pygame.QUIT:
-                                running[0] = False
-                                paused = False
-                            elif pause_event.type == pygame.KEYDOWN and pause_event.key == pygame.K_p:
-                                paused = False
-                        pygame.time.wait(100)
-
-        handle_input(state)
-        score_changed = False
-        
-        if is_host:
-            score_changed = update_ball(state)
-            if score_changed:
-                state['score_changed'] = True
-        elif frame_counter % 2 == 0:
-            if state.get('last_update_time', 0) + 0.1 < pygame.time.get_ticks() / 1000:
-                state['ball_x'] += state['ball_speed_x']
-                state['ball_y'] += state['ball_speed_y']
-                
-                if state['ball_y'] <= 0 or state['ball_y'] + BALL_SIZE >= FIXED_HEIGHT:
-                    state['ball_speed_y'] *= -1
-
-        send_update = False
-        if score_changed:
-            send_update = True
-        elif frame_counter % NETWORK_UPDATE_FREQUENCY == 0:
-            send_update = True
-            state['score_changed'] = False            
-        if send_update:
-            packet_id += 1
-            game_state = struct.pack('!iiiiiiiii',
-                packet_id,
-                state['paddle_y'], 
-                state['ball_x'], 
-                state['ball_y'],
-                state['ball_speed_x'], 
-                state['ball_speed_y'],
-                state['left_score'],
-                state['right_score'], 
-                1 if state['score_changed'] else 0 
-            )
-            sock.sendto(game_state, peer_addr)
-        
-        # Time-based interpolation
-        current_time = time.time()
-        time_since_last_update = current_time - state['last_update_time']
-        interpolation_factor = min(1.0, time_since_last_update * NETWORK_UPDATE_FREQUENCY)
-        state['opponent_paddle_y'] = state['opponent_paddle_y_previous'] + (state['opponent_paddle_y_target'] - state['opponent_paddle_y_previous']) * interpolation_factor
-        
-        draw_game(state, is_host, username, opponent_username)
-        frame_counter += 1
-        clock.tick(GAME_SPEED)
-
+                if event.key == pygame.K_F3:
+                    show_overlay = not show_overlay
+                elif event.key == pygame.K_p:
+                    paused = not paused
+                    channel.send(b"PAUSE" if paused else b"RESUME")  # Pauses the peer (or the server's match) too
+                    pygame.display.set_caption("P2P Pong (paused)" if paused else "P2P Pong")
+                else:
+                    show_profile = handle_profiler_key(event, profiler, show_profile)
+        profiler.mark('events')
+
+        # Whole GAME_SPEED ticks for however much time passed; the drawing below doesn't set the pace
+        for _ in range(timestep.advance(time.perf_counter())):
+            previous = save_state(state)
+
+            # Apply everything the network thread received since the last tick, in one place
+            for snapshot, ack, stamp, arrival, is_newest in inbox.drain():
+                if ack is not None:
+                    encoder.on_ack(ack)
+                # Late packets still fill gaps in the jitter buffer
+                snapshots.add(stamp, snapshot[:3], arrival)
+                if is_newest and not authoritative:
+                    state.ball_speed_x, state.ball_speed_y = snapshot[3:]
+            for message in events.drain():
+                command, _, args = message.partition(b":")
+                if command == b"SCORE" and not authoritative:
+                    left, _, right = args.partition(b":")
+                    if left.isdigit() and right.isdigit():
+                        state.left_score, state.right_score = int(left), int(right)
+                elif command in (b"PAUSE", b"RESUME"):
+                    paused = command == b"PAUSE"
+                    pygame.display.set_caption("P2P Pong (paused)" if paused else "P2P Pong")
+            profiler.mark('network')
+
+            if not paused:
+                input_bits = read_input_bits()
+                state.paddle_y = move_paddle(state.paddle_y, input_bits & INPUT_UP, input_bits & INPUT_DOWN)
+                score_changed = False
+                profiler.mark('input')
+
+                if authoritative:
+                    score_changed = update_ball(state)
+                    if score_changed:
+                        channel.send(f"SCORE:{state.left_score}:{state.right_score}".encode())
+                profiler.mark('physics')
+
+                # Only the authoritative side's ball means anything to the peer
+                snapshot = snapshot_from_state(state, include_ball=authoritative)
+                if scheduler.should_send(frame_counter, snapshot, urgent=score_changed):
+                    game_state = encoder.encode(snapshot, decoder.latest, now_ms())
+                    endpoint.sendto(game_state, peer_addr)
+                    stats.on_send(len(game_state))
+            channel.poll(now_ms())
+            if peer_clock.should_ping():
+                ping = peer_clock.make_ping()
+                endpoint.sendto(ping, peer_addr)
+                stats.on_send(len(ping))
+            if telemetry:
+                telemetry.maybe_write([stats])
+            elif show_overlay and frame_counter % GAME_SPEED == 0:
+                stats.update_rates()
+            profiler.mark('send')
+
+            # Render the remote side slightly in the past, between the snapshots around that moment
+            sample = snapshots.sample(now_ms())
+            if sample is not None:
+                # Whole pixels, like the rest of the sim, so a recording replays the physics exactly
+                state.opponent_paddle_y = round(sample[0])
+                if not authoritative:
+                    state.ball_x, state.ball_y = round(sample[1]), round(sample[2])
+            profiler.mark('network')
+            if recorder and not paused:
+                recorder.record(input_bits, state)
+            if spectators:
+                spectators.publish(frame_counter, state)
+            frame_counter += 1
+            profiler.mark('record')
+
+        # Drawn at display rate, between the last two ticks
+        blend_state(previous, save_state(state), timestep.alpha, view)
+        draw_game(view, is_host, username, opponent_username, stats, show_overlay, profiler if show_profile else None)
+        profiler.mark('draw')
+        pace_frame(net, fps)
+        profiler.mark('wait')
+        profiler.end_frame()
+
+    profiler.close()
     end_game()
 
 def end_game():
     print("Exiting game...")
-    try:
-        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        sock.close()
-    except:
-        pass
+    if room_manager is not None:
+        room_manager.stop()  # Broadcasts that the room closed and unregisters it from the lobby
+    if engine is not None:
+        engine.close()  # Closes every socket and cancels the discovery broadcast
+    if recorder is not None:
+        recorder.close()
     pygame.quit()
     exit()
 
-def reset_ball(state):
-    state['ball_x'], state['ball_y'] = FIXED_WIDTH // 2, FIXED_HEIGHT // 2
-    state['ball_speed_x'] = BALL_SPEED
-    state['ball_speed_y'] = BALL_SPEED
-
 if __name__ == "__main__":
     main()
\ No newline at end of file
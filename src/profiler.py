@@ -0,0 +1,165 @@
+# Per-stage frame timing for the game loop. Each frame's time is split across the stages the loop marks and kept
+# in a ring buffer, for a p50/p99/max overlay (F4). Frames slower than spike_ms are written to a JSON-lines file as
+# they happen. A cProfile capture of the next PROFILE_FRAMES frames starts on F5 or SIGUSR1 and costs nothing
+# until then.
+#
+#   python src/profiler.py --bench   cost of the stage timing per frame, and of a cProfile capture
+import json
+import signal
+import sys
+import time
+from array import array
+
+from constants import GAME_SPEED
+
+RING_SIZE = 10 * GAME_SPEED  # Frames of history behind the overlay's percentiles
+SPIKE_MS = 1500 / GAME_SPEED  # A frame that took a tick and a half
+SPIKE_LOG = "pong_spikes.jsonl"
+SPIKE_CONTEXT = 30  # Earlier frame times written with each spike
+PROFILE_FRAMES = 5 * GAME_SPEED
+PROFILE_TOP = 20  # Functions printed when a capture finishes
+OVERLAY_REFRESH = GAME_SPEED // 2  # Frames between overlay updates; sorting the history is the costly part
+
+class FrameProfiler:
+    def __init__(self, stages, spike_ms=SPIKE_MS, spike_log=SPIKE_LOG, size=RING_SIZE):
+        self.stages = stages
+        self.size = size
+        self.history = {stage: array('d', bytes(8 * size)) for stage in stages + ('frame',)}  # ms
+        self.current = dict.fromkeys(stages, 0.0)
+        self.frame = 0
+        self.last = self.frame_start = time.perf_counter()
+        self.spike_ms = spike_ms
+        self.spike_log = spike_log
+        self.spike_file = None  # Opened on the first spike
+        self.spikes = 0
+        self.profile = None
+        self.profile_left = 0
+        self.capture_requested = False
+        self.lines = None
+        self.lines_frame = 0
+        if hasattr(signal, "SIGUSR1"):
+            signal.signal(signal.SIGUSR1, lambda signum, frame: self.request_capture())
+
+    def mark(self, stage):
+        # Everything since the previous mark belongs to `stage`; marks for a stage add up over the frame
+        now = time.perf_counter()
+        self.current[stage] += now - self.last
+        self.last = now
+
+    def end_frame(self):
+        now = time.perf_counter()
+        slot = self.frame % self.size
+        history = self.history
+        current = self.current
+        for stage in self.stages:
+            history[stage][slot] = current[stage] * 1000
+            current[stage] = 0.0
+        frame_ms = history['frame'][slot] = (now - self.frame_start) * 1000
+        self.frame += 1
+        if frame_ms > self.spike_ms and self.frame > 1:
+            self._log_spike(slot, frame_ms)
+        if self.profile_left:
+            self.profile_left -= 1
+            if not self.profile_left:
+                self._finish_capture()
+        elif self.capture_requested:
+            self._start_capture()
+        self.last = self.frame_start = time.perf_counter()  # The spike log and captures aren't billed to a stage
+
+    def _log_spike(self, slot, frame_ms):
+        if self.spike_file is None:
+            self.spike_file = open(self.spike_log, 'a')
+        history = self.history
+        earlier = [round(history['frame'][(slot - i) % self.size], 2) for i in range(SPIKE_CONTEXT, 0, -1)
+                   if self.frame - i > 0]
+        record = {'time': time.time(), 'frame': self.frame - 1, 'frame_ms': round(frame_ms, 2),
+                  'stages_ms': {stage: round(history[stage][slot], 3) for stage in self.stages}, 'earlier_ms': earlier}
+        self.spike_file.write(json.dumps(record) + "\n")
+        self.spike_file.flush()
+        self.spikes += 1
+
+    def request_capture(self):
+        # Safe from a signal handler: the capture starts at the next frame boundary
+        if not self.profile_left:
+            self.capture_requested = True
+
+    def _start_capture(self):
+        import cProfile
+        self.capture_requested = False
+        self.profile = cProfile.Profile()
+        self.profile_left = PROFILE_FRAMES
+        print(f"[PROFILE] Capturing the next {PROFILE_FRAMES} frames")
+        self.profile.enable()
+
+    def _finish_capture(self):
+        import pstats
+        self.profile.disable()
+        path = time.strftime("pong_%Y%m%d_%H%M%S.prof")
+        self.profile.dump_stats(path)
+        print(f"[PROFILE] {PROFILE_FRAMES - self.profile_left} frames written to {path}; top {PROFILE_TOP} by cumulative time:")
+        pstats.Stats(self.profile, stream=sys.stdout).sort_stats("cumulative").print_stats(PROFILE_TOP)
+        self.profile = None
+
+    def percentiles(self, stage):
+        filled = min(self.frame, self.size)
+        if not filled:
+            return 0.0, 0.0, 0.0
+        values = sorted(self.history[stage][:filled])
+        return values[filled // 2], values[min(filled - 1, int(filled * 0.99))], values[-1]
+
+    def overlay_lines(self):
+        if self.lines is None or self.frame - self.lines_frame >= OVERLAY_REFRESH:
+            self.lines = [f"{min(self.frame, self.size)} frames  p50 / p99 / max ms"]
+            for stage in self.stages + ('frame',):
+                p50, p99, worst = self.percentiles(stage)
+                self.lines.append(f"{stage:8} {p50:6.2f} {p99:6.2f} {worst:6.2f}")
+            self.lines_frame = self.frame
+        return self.lines
+
+    def close(self):
+        if self.profile_left:
+            self._finish_capture()
+            self.profile_left = 0
+        if self.spike_file:
+            self.spike_file.close()
+            print(f"[PROFILE] {self.spikes} frames over {self.spike_ms:.1f} ms logged to {self.spike_log}")
+
+def benchmark(frames=200000):
+    # A loop of eight empty stages, bare and marked, so the difference is the timing's own cost per frame
+    stages = ('events', 'network', 'input', 'physics', 'send', 'record', 'draw', 'wait')
+    profiler = FrameProfiler(stages, spike_ms=float('inf'))
+    start = time.perf_counter()
+    for _ in range(frames):
+        for stage in stages:
+            pass
+    bare = time.perf_counter() - start
+
+    start = time.perf_counter()
+    mark = profiler.mark
+    for _ in range(frames):
+        for stage in stages:
+            mark(stage)
+        profiler.end_frame()
+    marked = time.perf_counter() - start
+
+    import cProfile
+    capture = cProfile.Profile()
+    start = time.perf_counter()
+    capture.enable()
+    for _ in range(frames // 10):
+        for stage in stages:
+            mark(stage)
+        profiler.end_frame()
+    capture.disable()
+    captured = (time.perf_counter() - start) * 10
+
+    per_frame = (marked - bare) / frames * 1e6
+    print(f"[BENCH] stage timing {per_frame:.2f} us/frame ({per_frame / (1e6 / GAME_SPEED) * 100:.3f}% of a tick), "
+          f"with cProfile capturing {(captured - bare) / frames * 1e6:.2f} us/frame")
+    p50, p99, worst = profiler.percentiles('frame')
+    print(f"[BENCH] frame p50 {p50 * 1000:.2f} us, p99 {p99 * 1000:.2f} us over the last {RING_SIZE} frames")
+    return {'frame_us': per_frame}
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--bench":
+        benchmark()
@@ -0,0 +1,217 @@
+# Versioned, delta-encoded snapshot protocol for the gameplay stream.
+#
+# Header: version/flags byte, changed-field mask, [wide-field mask], uint16 seq, uint16 sender time in ms,
+# [base distance], [uint16 ack]
+# Each packet is a delta against the last snapshot the receiver acknowledged; a field is only written when
+# it changed, as an int8 difference when that fits and at full width otherwise. Only kinematics travel
+# here; scores and other events go over the reliable channel (reliable.py).
+import struct
+import time
+import sys
+
+PROTOCOL_VERSION = 3
+SEQ_MOD = 1 << 16
+HISTORY = 256
+
+F_BASE = 1  # Delta against an earlier snapshot, otherwise a full snapshot
+F_ACK = 2   # Carries the newest sequence number we have received from the peer
+
+WIRE_FIELDS = ('paddle_y', 'ball_x', 'ball_y', 'ball_speed_x', 'ball_speed_y')
+FIELD_FORMATS = ('h', 'h', 'h', 'b', 'b')
+EMPTY_SNAPSHOT = (0,) * len(WIRE_FIELDS)
+FULL_MASK = (1 << len(WIRE_FIELDS)) - 1
+
+_HEADERS = {
+    0: struct.Struct('!BBHH'),
+    F_ACK: struct.Struct('!BBHHH'),
+    F_BASE: struct.Struct('!BBBHHB'),
+    F_BASE | F_ACK: struct.Struct('!BBBHHBH'),
+}
+_field_structs = {}
+
+def _fields_struct(mask, wide):
+    key = (mask, wide)
+    packer = _field_structs.get(key)
+    if packer is None:
+        fmt = '!'
+        for i, full_fmt in enumerate(FIELD_FORMATS):
+            if mask >> i & 1:
+                fmt += full_fmt if wide >> i & 1 else 'b'
+        packer = _field_structs[key] = struct.Struct(fmt)
+    return packer
+
+def seq_newer(a, b):
+    # True when a is ahead of b, treating the 16-bit counter as circular
+    return 0 < (a - b) % SEQ_MOD < SEQ_MOD // 2
+
+def snapshot_from_state(state, include_ball=True):
+    if not include_ball:
+        return (int(state.paddle_y), 0, 0, 0, 0)
+    return (int(state.paddle_y), state.ball_x, state.ball_y, state.ball_speed_x, state.ball_speed_y)
+
+class SnapshotEncoder:
+    def __init__(self):
+        self.seq = 0
+        self.sent = [None] * HISTORY  # (seq, snapshot)
+        self.acked = None
+
+    def on_ack(self, ack):
+        if self.acked is None or seq_newer(ack, self.acked):
+            self.acked = ack
+
+    def encode(self, snapshot, ack=None, stamp=0):
+        self.seq = (self.seq + 1) % SEQ_MOD
+        seq = self.seq
+        self.sent[seq % HISTORY] = (seq, snapshot)
+
+        flags = 0
+        base = None
+        if self.acked is not None:
+            distance = (seq - self.acked) % SEQ_MOD
+            entry = self.sent[self.acked % HISTORY]
+            if 0 < distance < HISTORY and entry is not None and entry[0] == self.acked:
+                flags |= F_BASE
+                base = entry[1]
+
+        mask = 0
+        wide = 0
+        values = []
+        if base is None:
+            for i, value in enumerate(snapshot):
+                if value != 0:
+                    mask |= 1 << i
+                    values.append(value)
+            wide = mask
+        else:
+            bit = 1
+            for value, old in zip(snapshot, base):
+                if value != old:
+                    mask |= bit
+                    diff = value - old
+                    if -128 <= diff <= 127:
+                        values.append(diff)
+                    else:
+                        wide |= bit
+                        values.append(value)
+                bit <<= 1
+
+        if ack is not None:
+            flags |= F_ACK
+        version_flags = PROTOCOL_VERSION << 4 | flags
+        stamp &= 0xFFFF
+        if base is None:
+            fields = (version_flags, mask, seq, stamp)
+        else:
+            fields = (version_flags, mask, wide, seq, stamp, distance)
+        if ack is not None:
+            fields += (ack,)
+        return _HEADERS[flags].pack(*fields) + _fields_struct(mask, wide).pack(*values)
+
+class SnapshotDecoder:
+    def __init__(self):
+        self.received = [None] * HISTORY  # (seq, snapshot)
+        self.latest = None
+
+    def peek(self, data):
+        # (seq, stamp) from the header alone, for packets that are counted but not decoded
+        try:
+            flags = data[0]
+            if flags >> 4 != PROTOCOL_VERSION:
+                return None
+            fields = _HEADERS[flags & (F_BASE | F_ACK)].unpack_from(data)
+        except (IndexError, KeyError, struct.error):
+            return None
+        return fields[3:5] if flags & F_BASE else fields[2:4]
+
+    def decode(self, data):
+        # Returns (seq, snapshot, ack, stamp, is_newest) or None when the packet can't be used
+        try:
+            flags = data[0]
+            if flags >> 4 != PROTOCOL_VERSION:
+                return None
+            flags &= 0x0F
+            header = _HEADERS[flags & (F_BASE | F_ACK)]
+            fields = header.unpack_from(data)
+            ack = fields[-1] if flags & F_ACK else None
+            if flags & F_BASE:
+                mask, wide, seq, stamp, distance = fields[1:6]
+                base_seq = (seq - distance) % SEQ_MOD
+                entry = self.received[base_seq % HISTORY]
+                if entry is None or entry[0] != base_seq:
+                    return None  # We no longer hold the snapshot this delta is built on
+                base = entry[1]
+            else:
+                mask, seq, stamp = fields[1:4]
+                wide = mask
+                base = EMPTY_SNAPSHOT
+            values = _fields_struct(mask, wide).unpack_from(data, header.size)
+        except (IndexError, KeyError, struct.error):
+            return None
+
+        if mask == FULL_MASK and wide == FULL_MASK:
+            snapshot = values
+        else:
+            snapshot = list(base)
+            index = 0
+            for i in range(len(WIRE_FIELDS)):
+                if mask >> i & 1:
+                    snapshot[i] = values[index] if wide >> i & 1 else base[i] + values[index]
+                    index += 1
+            snapshot = tuple(snapshot)
+
+        self.received[seq % HISTORY] = (seq, snapshot)
+        is_newest = self.latest is None or seq_newer(seq, self.latest)
+        if is_newest:
+            self.latest = seq
+        return seq, snapshot, ack, stamp, is_newest
+
+def benchmark(frames=60000):
+    from sim import new_state, update_ball
+
+    state = new_state(True)
+    snapshots = []
+    for frame in range(frames):
+        state.paddle_y = state.opponent_paddle_y = max(0, min(440, state.ball_y - 40))
+        update_ball(state)
+        if frame % 2 == 0:
+            snapshots.append(snapshot_from_state(state))
+
+    legacy = struct.Struct('!iiiiiiiii')
+    start = time.perf_counter()
+    legacy_packets = [legacy.pack(i, *s, 0, 0, 0) for i, s in enumerate(snapshots)]  # The old format also carried scores
+    legacy_encode = time.perf_counter() - start
+    start = time.perf_counter()
+    for packet in legacy_packets:
+        legacy.unpack(packet)
+    legacy_decode = time.perf_counter() - start
+
+    # The receiver's ack reaches the sender ~3 packets later, as it would at ~100 ms RTT
+    encoder, decoder = SnapshotEncoder(), SnapshotDecoder()
+    packets = []
+    start = time.perf_counter()
+    for i, snapshot in enumerate(snapshots):
+        if i >= 3:
+            encoder.on_ack((i - 3) % SEQ_MOD + 1)
+        packets.append(encoder.encode(snapshot, i % SEQ_MOD))
+    encode = time.perf_counter() - start
+    start = time.perf_counter()
+    for packet in packets:
+        decoder.decode(packet)
+    decode = time.perf_counter() - start
+
+    count = len(snapshots)
+    legacy_bytes = sum(map(len, legacy_packets)) / count
+    new_bytes = sum(map(len, packets)) / count
+    print(f"[BENCH] {count} packets")
+    print(f"[BENCH] struct:   {legacy_bytes:5.1f} B/packet, encode {legacy_encode / count * 1e6:.2f} us, decode {legacy_decode / count * 1e6:.2f} us")
+    print(f"[BENCH] protocol: {new_bytes:5.1f} B/packet, encode {encode / count * 1e6:.2f} us, decode {decode / count * 1e6:.2f} us")
+    print(f"[BENCH] {legacy_bytes / new_bytes:.1f}x fewer bytes per second, for {encode / legacy_encode:.0f}x the CPU "
+          f"to encode and {decode / legacy_decode:.0f}x to decode")
+    return {
+        'struct_bytes': legacy_bytes, 'struct_encode_us': legacy_encode / count * 1e6, 'struct_decode_us': legacy_decode / count * 1e6,
+        'bytes': new_bytes, 'encode_us': encode / count * 1e6, 'decode_us': decode / count * 1e6,
+    }
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--bench":
+        benchmark()
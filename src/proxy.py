@@ -0,0 +1,215 @@
+# Loopback UDP impairment proxy: sits between a client and a host (or dedicated server) and injects
+# delay, jitter, bursty loss, reordering, duplication and a bandwidth cap from a seeded profile.
+#
+#   python src/proxy.py --profile venue-wifi --seed 7
+#
+# The proxy advertises itself as a room, so a client can join through it from the normal lobby.
+import argparse
+import heapq
+import json
+import random
+import select
+import socket
+import time
+
+from constants import PORT, BUFFER_SIZE, ROOM_BROADCAST_INTERVAL, DISCOVERY_PORT
+from rooms import Room, local_ip
+
+PROXY_PORT = 42071
+STATS_INTERVAL = 5
+
+# delay/jitter in ms, loss/duplicate/reorder in percent, burst = mean length of a loss burst in packets
+PROFILES = {
+    "lan": {"delay_ms": 1, "jitter_ms": 0.5},
+    "wifi": {"delay_ms": 15, "jitter_ms": 8, "loss_pct": 1, "burst": 2},
+    "venue-wifi": {"delay_ms": 40, "jitter_ms": 25, "distribution": "pareto", "loss_pct": 5, "burst": 4,
+                   "reorder_pct": 2, "duplicate_pct": 0.5, "bandwidth_kbps": 256},
+    "congested": {"delay_ms": 75, "jitter_ms": 40, "loss_pct": 10, "burst": 6, "reorder_pct": 5,
+                  "bandwidth_kbps": 64, "queue_ms": 200},
+    "mobile": {"delay_ms": 60, "jitter_ms": 30, "distribution": "uniform", "loss_pct": 3, "burst": 3},
+}
+
+class Impairment:
+    # One direction of the link
+    def __init__(self, profile, rng):
+        self.rng = rng
+        self.delay = profile.get("delay_ms", 0) / 1000
+        self.jitter = profile.get("jitter_ms", 0) / 1000
+        self.distribution = profile.get("distribution", "normal")
+        self.duplicate = profile.get("duplicate_pct", 0) / 100
+        self.reorder = profile.get("reorder_pct", 0) / 100
+        self.bandwidth = profile.get("bandwidth_kbps", 0) * 1000 / 8  # bytes per second, 0 = unlimited
+        self.queue_limit = profile.get("queue_ms", 100) / 1000
+
+        # Gilbert-Elliott loss: every packet in the bad state is lost, and bursts last `burst` packets on average
+        loss = min(profile.get("loss_pct", 0) / 100, 0.99)
+        burst = max(profile.get("burst", 1), 1)
+        self.p_recover = 1 / burst
+        self.p_fail = loss * self.p_recover / (1 - loss) if loss else 0
+        self.bad = False
+
+        self.link_free_at = 0.0
+        self.last_delivery = 0.0
+        self.counts = {"forwarded": 0, "lost": 0, "queue_drops": 0, "duplicated": 0, "reordered": 0}
+
+    def _sample_delay(self):
+        if self.distribution == "uniform":
+            jitter = self.rng.uniform(-self.jitter, self.jitter)
+        elif self.distribution == "pareto":
+            jitter = self.jitter * (self.rng.paretovariate(3) - 1)  # Long tail, never early
+        else:
+            jitter = self.rng.gauss(0, self.jitter)
+        return max(0.0, self.delay + jitter)
+
+    def schedule(self, now, size):
+        # Returns the times at which copies of this packet should be delivered
+        self.bad = self.rng.random() < (1 - self.p_recover if self.bad else self.p_fail)
+        if self.bad:
+            self.counts["lost"] += 1
+            return []
+
+        send_at = now
+        if self.bandwidth:
+            start = max(now, self.link_free_at)
+            if start - now > self.queue_limit:
+                self.counts["queue_drops"] += 1
+                return []
+            self.link_free_at = start + size / self.bandwidth
+            send_at = self.link_free_at
+
+        deliver_at = send_at + self._sample_delay()
+        if self.rng.random() < self.reorder:
+            # Held back so later packets overtake it. It stays out of last_delivery, or the FIFO clamp below
+            # would queue everything after it behind it and nothing would actually get ahead.
+            self.counts["reordered"] += 1
+            deliver_at += self.delay + 2 * self.jitter + 0.005
+        else:
+            if self.distribution != "uniform" and deliver_at < self.last_delivery:
+                deliver_at = self.last_delivery  # Plain jitter shouldn't reorder a FIFO link
+            self.last_delivery = max(self.last_delivery, deliver_at)
+
+        times = [deliver_at]
+        if self.rng.random() < self.duplicate:
+            self.counts["duplicated"] += 1
+            times.append(deliver_at + self.rng.uniform(0, 0.002))
+        self.counts["forwarded"] += 1
+        return times
+
+class ImpairmentProxy:
+    def __init__(self, profile, seed=0, listen_port=PROXY_PORT, target=("127.0.0.1", PORT), advertise=True):
+        rng = random.Random(seed)
+        self.upstream = Impairment(profile, random.Random(rng.random()))
+        self.downstream = Impairment(profile, random.Random(rng.random()))
+        self.target = target
+        self.listen = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.listen.bind(("0.0.0.0", listen_port))
+        self.listen.setblocking(False)
+        self.clients = {}  # client addr -> upstream socket
+        self.upstream_clients = {}  # upstream socket -> client addr
+        self.pending = []  # heap of (deliver_at, order, sock, data, addr)
+        self.order = 0
+        self.running = False
+
+        self.advertise = advertise
+        self.discovery_socket = None
+        if advertise:
+            self.discovery_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.discovery_socket.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+            self.room = Room("Impaired link", local_ip(), room_id="PROXY0", host_username="proxy", port=listen_port)
+            self.last_broadcast = 0
+
+    def _upstream_for(self, client_addr):
+        sock = self.clients.get(client_addr)
+        if sock is None:
+            # One upstream socket per client so the host still sees distinct peers
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.bind(("0.0.0.0", 0))
+            sock.setblocking(False)
+            self.clients[client_addr] = sock
+            self.upstream_clients[sock] = client_addr
+            print(f"[PROXY] New client {client_addr}")
+        return sock
+
+    def _enqueue(self, impairment, sock, data, addr, now):
+        for deliver_at in impairment.schedule(now, len(data) + 28):  # + IP/UDP headers
+            heapq.heappush(self.pending, (deliver_at, self.order, sock, data, addr))
+            self.order += 1
+
+    def _read(self, sock, now):
+        while True:
+            try:
+                data, addr = sock.recvfrom(BUFFER_SIZE)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                continue
+            if sock is self.listen:
+                self._enqueue(self.upstream, self._upstream_for(addr), data, self.target, now)
+            else:
+                self._enqueue(self.downstream, self.listen, data, self.upstream_clients[sock], now)
+
+    def _flush(self, now):
+        while self.pending and self.pending[0][0] <= now:
+            _, _, sock, data, addr = heapq.heappop(self.pending)
+            try:
+                sock.sendto(data, addr)
+            except OSError:
+                pass
+
+    def print_stats(self):
+        print(f"[PROXY] up {self.upstream.counts}")
+        print(f"[PROXY] down {self.downstream.counts}")
+
+    def serve_forever(self):
+        self.running = True
+        print(f"[PROXY] Forwarding :{self.listen.getsockname()[1]} -> {self.target[0]}:{self.target[1]}")
+        last_stats = time.monotonic()
+        while self.running:
+            now = time.monotonic()
+            timeout = max(0.0, self.pending[0][0] - now) if self.pending else 0.1
+            readable, _, _ = select.select([self.listen, *self.upstream_clients], [], [], min(timeout, 0.1))
+            now = time.monotonic()
+            for sock in readable:
+                self._read(sock, now)
+            self._flush(time.monotonic())
+
+            if self.advertise and now - self.last_broadcast > ROOM_BROADCAST_INTERVAL:
+                self.last_broadcast = now
+                try:
+                    self.discovery_socket.sendto(self.room.to_json().encode(), ('<broadcast>', DISCOVERY_PORT))
+                except OSError:
+                    pass
+            if now - last_stats > STATS_INTERVAL:
+                last_stats = now
+                self.print_stats()
+
+    def stop(self):
+        self.running = False
+        for sock in [self.listen, *self.upstream_clients]:
+            sock.close()
+        if self.discovery_socket:
+            self.discovery_socket.close()
+
+def load_profile(name_or_path):
+    if name_or_path in PROFILES:
+        return PROFILES[name_or_path]
+    with open(name_or_path) as f:
+        return json.load(f)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="UDP impairment proxy for P2P Pong")
+    parser.add_argument("--profile", default="venue-wifi", help=f"one of {', '.join(PROFILES)} or a JSON file")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--listen", type=int, default=PROXY_PORT)
+    parser.add_argument("--target", default=f"127.0.0.1:{PORT}", help="host:port of the game host or server")
+    parser.add_argument("--no-advertise", action="store_true", help="don't list the proxy in the lobby")
+    args = parser.parse_args()
+
+    target_ip, target_port = args.target.rsplit(":", 1)
+    proxy = ImpairmentProxy(load_profile(args.profile), args.seed, args.listen, (target_ip, int(target_port)),
+                            not args.no_advertise)
+    try:
+        proxy.serve_forever()
+    except KeyboardInterrupt:
+        proxy.print_stats()
+        proxy.stop()
@@ -0,0 +1,266 @@
+# Match recording and replay, for auditing disputed matches and reproducing desyncs.
+#
+# File: header, then an append-only stream of records, then (once the recorder is closed) a keyframe index.
+#   header    b'PONGREC1', version, flags, game speed, start time, then both usernames (uint8 length + UTF-8)
+#   'F' frame this side's input bits and every value the network set that frame (opponent paddle, ball, score)
+#   'K' key   the full state at the start of a frame, every KEYFRAME_INTERVAL frames
+#   index     'X', uint32 count, (uint32 frame, uint64 offset) per keyframe, then uint64 index offset, b'PIDX'
+# A file cut short by a crash has no index; the replayer rebuilds it by scanning the records.
+#
+#   python src/recording.py match.pong                 verify the recording and time a headless replay
+#   python src/recording.py match.pong --play [FRAME]  watch it at normal speed, optionally from a frame
+#   python src/recording.py --bench                    time recording and replay on a synthetic match
+import bisect
+import mmap
+import struct
+import sys
+import time
+
+from constants import GAME_SPEED
+from sim import new_state, save_state, load_state, move_paddle, update_ball, INPUT_UP, INPUT_DOWN
+
+MAGIC = b'PONGREC1'
+VERSION = 2  # 2: swept paddle collisions, so version 1 physics no longer replay
+KEYFRAME_INTERVAL = 5 * GAME_SPEED
+WRITE_BUFFER = 64 * 1024
+
+R_HOST = 1
+R_AUTHORITATIVE = 2  # This side ran the ball physics, so a replay recomputes it and checks it against the record
+
+HEADER = struct.Struct('!8sBBBd')
+FRAME = struct.Struct('!cBhhhbbHH')  # input, opponent_paddle_y, ball_x, ball_y, ball_speed_x, ball_speed_y, scores
+KEYFRAME = struct.Struct('!cIhhhhbbHH')  # frame, then the state in sim.SIM_KEYS order
+INDEX_HEADER = struct.Struct('!cI')
+INDEX_ENTRY = struct.Struct('!IQ')
+TRAILER = struct.Struct('!Q4s')
+INDEX_MAGIC = b'PIDX'
+
+class MatchRecorder:
+    def __init__(self, path, state, is_host, authoritative, username, opponent_username):
+        self.file = open(path, 'wb', buffering=WRITE_BUFFER)
+        flags = (R_HOST if is_host else 0) | (R_AUTHORITATIVE if authoritative else 0)
+        header = HEADER.pack(MAGIC, VERSION, flags, GAME_SPEED, time.time())
+        for name in (username, opponent_username):
+            encoded = name.encode()[:255]
+            header += bytes((len(encoded),)) + encoded
+        self.file.write(header)
+        self.offset = len(header)
+        self.frame = 0
+        self.keyframes = []  # (frame, offset)
+        self._keyframe(state)
+
+    def _keyframe(self, state):
+        self.keyframes.append((self.frame, self.offset))
+        self.file.write(KEYFRAME.pack(b'K', self.frame, *save_state(state)))
+        self.offset += KEYFRAME.size
+
+    def record(self, input_bits, state):
+        # Call once per simulated frame, after the network's values for that frame have been applied
+        self.file.write(FRAME.pack(b'F', input_bits, state.opponent_paddle_y, state.ball_x, state.ball_y,
+                                   state.ball_speed_x, state.ball_speed_y, state.left_score, state.right_score))
+        self.offset += FRAME.size
+        self.frame += 1
+        if self.frame % KEYFRAME_INTERVAL == 0:
+            self._keyframe(state)
+
+    def close(self):
+        if self.file.closed:
+            return
+        index = INDEX_HEADER.pack(b'X', len(self.keyframes))
+        index += b''.join(INDEX_ENTRY.pack(frame, offset) for frame, offset in self.keyframes)
+        self.file.write(index + TRAILER.pack(self.offset, INDEX_MAGIC))
+        self.file.close()
+
+class MatchReplay:
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        data = self.data
+        magic, version, flags, self.game_speed, self.started = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} match recording")
+        self.is_host = bool(flags & R_HOST)
+        self.authoritative = bool(flags & R_AUTHORITATIVE)
+        offset = HEADER.size
+        names = []
+        for _ in range(2):
+            length = data[offset]
+            names.append(data[offset + 1:offset + 1 + length].decode(errors='replace'))
+            offset += 1 + length
+        self.username, self.opponent_username = names
+        self.records_start = offset
+
+        self.end, self.keyframes = self._read_index()
+        if self.end is None:
+            self.end, self.keyframes = self._scan()
+        if not self.keyframes:
+            raise ValueError(f"{path} ends before its first keyframe")
+        self.keyframe_frames = [frame for frame, _ in self.keyframes]
+        last_frame, last_offset = self.keyframes[-1]
+        self.frame_count = last_frame + (self.end - last_offset - KEYFRAME.size) // FRAME.size
+
+    def _read_index(self):
+        data = self.data
+        if len(data) < TRAILER.size or data[-4:] != INDEX_MAGIC:
+            return None, None
+        end, _ = TRAILER.unpack_from(data, len(data) - TRAILER.size)
+        _, count = INDEX_HEADER.unpack_from(data, end)
+        return end, list(INDEX_ENTRY.iter_unpack(data[end + INDEX_HEADER.size:end + INDEX_HEADER.size + count * INDEX_ENTRY.size]))
+
+    def _scan(self):
+        # No index: the recorder never got to close, so walk the records and stop at the first torn one
+        data = self.data
+        size = len(data)
+        offset = self.records_start
+        frame = 0
+        keyframes = []
+        while offset < size:
+            tag = data[offset:offset + 1]
+            if tag == b'F' and offset + FRAME.size <= size:
+                offset += FRAME.size
+                frame += 1
+            elif tag == b'K' and offset + KEYFRAME.size <= size:
+                keyframes.append((frame, offset))
+                offset += KEYFRAME.size
+            else:
+                break
+        return offset, keyframes
+
+    def seek(self, frame):
+        # Returns (state, offset) for the start of frame, replayed from the nearest keyframe before it
+        frame = max(0, min(frame, self.frame_count))
+        key_frame, offset = self.keyframes[bisect.bisect_right(self.keyframe_frames, frame) - 1]
+        state = new_state(self.is_host)
+        load_state(state, KEYFRAME.unpack_from(self.data, offset)[2:])
+        offset, _, _ = self._apply(state, offset + KEYFRAME.size, frame - key_frame)
+        return state, offset
+
+    def _apply(self, state, offset, frames, check=False):
+        # Applies up to frames frame records from offset; returns (offset, frames applied, mismatch).
+        # With check, stops at the first frame whose recomputed physics differ from the record.
+        data = self.data
+        end = self.end
+        authoritative = self.authoritative
+        unpack_frame = FRAME.unpack_from
+        frame_size = FRAME.size
+        applied = 0
+        while applied < frames and offset < end:
+            if data[offset] == 75:  # b'K': the state already matches it
+                offset += KEYFRAME.size
+                continue
+            _, bits, opponent_y, ball_x, ball_y, speed_x, speed_y, left, right = unpack_frame(data, offset)
+            state.paddle_y = move_paddle(state.paddle_y, bits & INPUT_UP, bits & INPUT_DOWN)
+            if authoritative:
+                update_ball(state)
+                if check and (state.ball_x != ball_x or state.ball_y != ball_y or state.ball_speed_x != speed_x
+                              or state.ball_speed_y != speed_y or state.left_score != left or state.right_score != right):
+                    return offset, applied, True
+                state.opponent_paddle_y = opponent_y
+            else:
+                (state.opponent_paddle_y, state.ball_x, state.ball_y, state.ball_speed_x, state.ball_speed_y,
+                 state.left_score, state.right_score) = opponent_y, ball_x, ball_y, speed_x, speed_y, left, right
+            offset += frame_size
+            applied += 1
+        return offset, applied, False
+
+    def run(self, start=0, end=None):
+        # Headless replay; returns the state at end and how long it took
+        state, offset = self.seek(start)
+        began = time.perf_counter()
+        self._apply(state, offset, (self.frame_count if end is None else end) - start)
+        return state, time.perf_counter() - began
+
+    def verify(self):
+        # First frame where recomputed physics disagree with what was recorded, or None
+        if not self.authoritative:
+            return None
+        state, offset = self.seek(0)
+        _, applied, mismatch = self._apply(state, offset, self.frame_count, check=True)
+        return applied if mismatch else None
+
+    def play(self, start=0):
+        import p2p
+        from display import import_pygame
+        pygame = import_pygame()
+        p2p.init_display(p2p.current_resolution)
+        clock = pygame.time.Clock()
+        state, offset = self.seek(start)
+        applied = 1
+        while applied:
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key in (pygame.K_ESCAPE, pygame.K_q)):
+                    return
+            p2p.draw_game(state, self.is_host, self.username, self.opponent_username)
+            clock.tick(self.game_speed)
+            offset, applied, _ = self._apply(state, offset, 1)
+
+    def close(self):
+        self.data.close()
+
+def benchmark(frames=60 * GAME_SPEED * 10):
+    # Ten minutes of a host's match: the per-frame recording cost, then headless replay and seeking
+    import os
+    import random
+    import tempfile
+    path = os.path.join(tempfile.gettempdir(), "pong_bench.pong")
+    rng = random.Random(7)
+    state = new_state(True)
+    inputs = [rng.choice((0, 0, INPUT_UP, INPUT_DOWN)) for _ in range(1024)]
+
+    recorder = MatchRecorder(path, state, True, True, "host", "client")
+    record_time = 0.0
+    for frame in range(frames):
+        bits = inputs[frame & 1023]
+        state.paddle_y = move_paddle(state.paddle_y, bits & INPUT_UP, bits & INPUT_DOWN)
+        update_ball(state)
+        state.opponent_paddle_y = max(0, min(440, state.ball_y - 40))
+        start = time.perf_counter()
+        recorder.record(bits, state)
+        record_time += time.perf_counter() - start
+    recorder.close()
+    final = save_state(state)
+
+    replay = MatchReplay(path)
+    replayed, elapsed = replay.run()
+    assert save_state(replayed) == final and replay.verify() is None
+    start = time.perf_counter()
+    for _ in range(100):
+        replay.seek(rng.randrange(frames))
+    seek_ms = (time.perf_counter() - start) / 100 * 1000
+    size = os.path.getsize(path)
+    replay.close()
+    os.remove(path)
+
+    results = {
+        'record_us': record_time / frames * 1e6,
+        'bytes_per_second': size / (frames / GAME_SPEED),
+        'replay_speedup': frames / GAME_SPEED / elapsed,
+        'seek_ms': seek_ms,
+    }
+    print(f"[BENCH] {frames} frames: record {results['record_us']:.2f} us/frame, "
+          f"{results['bytes_per_second'] / 1024:.1f} KiB per second of play")
+    print(f"[BENCH] headless replay {frames / elapsed:,.0f} frames/s ({results['replay_speedup']:,.0f}x real time), "
+          f"seek {seek_ms:.2f} ms")
+    return results
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--bench":
+        benchmark()
+    elif len(sys.argv) > 1:
+        replay = MatchReplay(sys.argv[1])
+        print(f"[REPLAY] {replay.username} vs {replay.opponent_username}, {replay.frame_count} frames "
+              f"({replay.frame_count / replay.game_speed:.0f}s), {len(replay.keyframes)} keyframes")
+        if "--play" in sys.argv:
+            rest = sys.argv[sys.argv.index("--play") + 1:]
+            replay.play(int(rest[0]) if rest and rest[0].isdigit() else 0)
+        else:
+            if not replay.authoritative:
+                print("[REPLAY] The ball came from the network on this side, so there is no physics to check")
+            else:
+                desync = replay.verify()
+                print(f"[REPLAY] Physics desync at frame {desync}" if desync is not None else "[REPLAY] Physics match the recording")
+            state, elapsed = replay.run()
+            print(f"[REPLAY] Headless replay in {elapsed * 1000:.1f} ms "
+                  f"({replay.frame_count / replay.game_speed / max(elapsed, 1e-9):,.0f}x real time), "
+                  f"final score {state.left_score}-{state.right_score}")
+        replay.close()
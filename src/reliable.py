@@ -0,0 +1,170 @@
+# Reliable, ordered messages for low-rate events (handshake, scores, pause) on the same UDP socket as
+# the unreliable snapshot stream.
+#
+# Packet: b'R', uint16 cumulative ack, uint32 selective-ack bits, uint8 message count,
+# then per message: uint16 seq, uint8 length, payload.
+# Bit i of the selective acks means seq ack + 2 + i has arrived out of order, so only the messages
+# that are actually missing get resent. Retransmit timeouts follow RFC 6298 (Karn's rule, backoff).
+import struct
+import time
+import sys
+
+RELIABLE = b'R'
+SEQ_MOD = 1 << 16
+WINDOW = 32  # Messages in flight; matches the width of the selective-ack bits
+MAX_PACKET = 512
+INITIAL_RTO = 250  # ms; a game handshake shouldn't wait the RFC's full second
+MIN_RTO = 50
+MAX_RTO = 2000
+
+HEADER = struct.Struct('!cHIB')
+MESSAGE = struct.Struct('!HB')
+
+def is_reliable_packet(data):
+    return data[:1] == RELIABLE
+
+class ReliableChannel:
+    def __init__(self, send):
+        self.send_packet = send  # Called with each outgoing packet
+        self.next_seq = 1
+        self.unacked = {}  # seq -> [payload, next send time, first send time, sends], oldest first
+        self.received_seq = 0  # Everything up to here has been delivered; numbering starts at 1
+        self.out_of_order = {}  # seq -> payload, waiting for a gap to fill
+        self.ack_pending = False
+
+        self.srtt = None
+        self.rttvar = None
+        self.rto = INITIAL_RTO
+        self.retransmits = 0
+
+    def send(self, message):
+        if len(message) > 255:
+            raise ValueError("reliable messages are limited to 255 bytes")
+        self.unacked[self.next_seq] = [message, 0, None, 0]
+        self.next_seq = (self.next_seq + 1) % SEQ_MOD
+
+    def _ack_bits(self):
+        bits = 0
+        if self.out_of_order:
+            for i in range(WINDOW):
+                if (self.received_seq + 2 + i) % SEQ_MOD in self.out_of_order:
+                    bits |= 1 << i
+        return bits
+
+    def _on_ack(self, ack, bits, now):
+        for seq in list(self.unacked):
+            behind = (ack - seq) % SEQ_MOD
+            if behind >= SEQ_MOD // 2:
+                ahead = (seq - ack - 2) % SEQ_MOD
+                if ahead >= WINDOW or not bits >> ahead & 1:
+                    continue
+            entry = self.unacked.pop(seq)
+            if entry[3] == 1:
+                self._update_rtt(now - entry[2])  # Karn: a resent message's ack is ambiguous
+
+    def _update_rtt(self, sample):
+        if self.srtt is None:
+            self.srtt, self.rttvar = sample, sample / 2
+        else:
+            self.rttvar += (abs(self.srtt - sample) - self.rttvar) / 4
+            self.srtt += (sample - self.srtt) / 8
+        self.rto = min(max(self.srtt + 4 * self.rttvar, MIN_RTO), MAX_RTO)
+
+    def on_packet(self, data, now):
+        # Returns the messages that are now deliverable, in order, each exactly once
+        try:
+            _, ack, bits, count = HEADER.unpack_from(data)
+            offset = HEADER.size
+            messages = []
+            for _ in range(count):
+                seq, length = MESSAGE.unpack_from(data, offset)
+                offset += MESSAGE.size
+                payload = data[offset:offset + length]
+                if len(payload) != length:
+                    return []
+                offset += length
+                messages.append((seq, payload))
+        except struct.error:
+            return []
+
+        self._on_ack(ack, bits, now)
+        for seq, payload in messages:
+            self.ack_pending = True
+            ahead = (seq - self.received_seq) % SEQ_MOD
+            if 0 < ahead <= WINDOW + 1:
+                self.out_of_order.setdefault(seq, payload)
+
+        delivered = []
+        next_seq = (self.received_seq + 1) % SEQ_MOD
+        while next_seq in self.out_of_order:
+            delivered.append(self.out_of_order.pop(next_seq))
+            self.received_seq = next_seq
+            next_seq = (next_seq + 1) % SEQ_MOD
+        return delivered
+
+    def poll(self, now):
+        # Sends new and overdue messages plus any pending ack, all in one packet
+        if not self.unacked and not self.ack_pending:
+            return
+        parts = []
+        size = HEADER.size
+        oldest = next(iter(self.unacked), None)
+        for seq, entry in self.unacked.items():
+            if (seq - oldest) % SEQ_MOD >= WINDOW:
+                break
+            if now < entry[1]:
+                continue
+            if size + MESSAGE.size + len(entry[0]) > MAX_PACKET:
+                break
+            if entry[3]:
+                self.retransmits += 1
+            else:
+                entry[2] = now
+            entry[3] += 1
+            entry[1] = now + min(self.rto * (1 << (entry[3] - 1)), MAX_RTO)
+            parts.append(MESSAGE.pack(seq, len(entry[0])) + entry[0])
+            size += MESSAGE.size + len(entry[0])
+
+        if parts or self.ack_pending:
+            self.ack_pending = False
+            self.send_packet(HEADER.pack(RELIABLE, self.received_seq, self._ack_bits(), len(parts)) + b''.join(parts))
+
+def benchmark(messages=2000, loss=0.2, seed=1):
+    # Two channels over a lossy, reordering in-memory link; every message must arrive once and in order
+    import random
+    rng = random.Random(seed)
+    in_flight = []  # (deliver_at, order, receiver, packet)
+    channels = []
+    for side in range(2):
+        def send(packet, side=side):
+            if rng.random() >= loss:
+                in_flight.append((now + rng.uniform(20, 60), len(in_flight), 1 - side, packet))
+        channels.append(ReliableChannel(send))
+
+    delivered = []
+    now = 0
+    sent = 0
+    start = time.perf_counter()
+    while len(delivered) < messages:
+        if sent < messages and now % 16 == 0:
+            channels[0].send(b"SCORE:%d" % sent)
+            sent += 1
+        due = [item for item in in_flight if item[0] <= now]
+        in_flight[:] = [item for item in in_flight if item[0] > now]
+        for _, _, receiver, packet in sorted(due):
+            result = channels[receiver].on_packet(packet, now)
+            if receiver == 1:
+                delivered.extend(result)
+        for channel in channels:
+            channel.poll(now)
+        now += 1
+    elapsed = time.perf_counter() - start
+
+    assert delivered == [b"SCORE:%d" % i for i in range(messages)]
+    print(f"[BENCH] {messages} messages at {loss * 100:.0f}% loss: all delivered in order, "
+          f"{channels[0].retransmits} retransmits, RTO {channels[0].rto:.0f} ms, {elapsed:.2f}s")
+    return channels[0].retransmits
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--bench":
+        benchmark()
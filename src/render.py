@@ -0,0 +1,158 @@
+# In-game renderer: surfaces and fonts are created once, text is cached until it changes,
+# and only the regions that moved are redrawn when the window is already FIXED_WIDTH x FIXED_HEIGHT.
+import os
+import sys
+import time
+
+from constants import FIXED_WIDTH, FIXED_HEIGHT, PADDLE_WIDTH, PADDLE_HEIGHT, BALL_SIZE
+from display import import_pygame
+from sim import LEFT_PADDLE_X, RIGHT_PADDLE_X
+
+pygame = import_pygame()
+
+WHITE = (255, 255, 255)
+BLACK = (0, 0, 0)
+INDICATOR_RECT = pygame.Rect(10, 10, 21, 21)
+INDICATOR_COLORS = ((0, 255, 0), (255, 255, 0), (255, 0, 0))  # Good, degraded, bad
+OVERLAY_POS = (10, FIXED_HEIGHT - 10)  # Bottom left; lines stack upwards from here
+OVERLAY_LINE_HEIGHT = 20
+TEXT_CACHE_LIMIT = 64
+
+class Renderer:
+    def __init__(self):
+        # Match the display's pixel format so blits and the in-place rescale need no conversion
+        self.fixed_surface = pygame.Surface((FIXED_WIDTH, FIXED_HEIGHT)).convert()
+        self.background = pygame.Surface((FIXED_WIDTH, FIXED_HEIGHT)).convert()
+        self.font = pygame.font.Font(None, 28)
+        self.small_font = pygame.font.Font(None, 24)
+        self.text_cache = {}
+        self.names = None
+        self.name_widths = (0, 0)
+        self.previous_rects = []
+        self.full_redraw = True
+        self.layout = None  # (resolution, window size, drawing direct) of the last frame
+
+    def text(self, font, text):
+        key = (font, text)
+        surface = self.text_cache.get(key)
+        if surface is None:
+            if len(self.text_cache) >= TEXT_CACHE_LIMIT:
+                self.text_cache.clear()
+            surface = self.text_cache[key] = font.render(text, True, WHITE)
+        return surface
+
+    def _build_background(self, left_username, right_username):
+        # Everything static: the center line and usernames above the paddles
+        self.background.fill(BLACK)
+        pygame.draw.aaline(self.background, WHITE, (FIXED_WIDTH // 2, 0), (FIXED_WIDTH // 2, FIXED_HEIGHT))
+        left_text = self.text(self.font, left_username)
+        right_text = self.text(self.font, right_username)
+        self.background.blit(left_text, (50, 20))
+        self.background.blit(right_text, (FIXED_WIDTH - 50 - right_text.get_width(), 20))
+        self.name_widths = (left_text.get_width(), right_text.get_width())
+        self.names = (left_username, right_username)
+        self.full_redraw = True
+
+    def draw(self, state, is_host, username, opponent_username, resolution, health=0, overlay_lines=None):
+        display = pygame.display.get_surface()
+        direct = tuple(resolution) == (FIXED_WIDTH, FIXED_HEIGHT) and display.get_size() == tuple(resolution)
+        layout = (tuple(resolution), display.get_size(), direct)
+        if layout != self.layout:
+            # A new size or a switch between direct and rescaled drawing: nothing on either surface can be reused
+            self.layout = layout
+            self.full_redraw = True
+        # At native size we draw straight onto the window and skip the rescale entirely
+        surface = display if direct else self.fixed_surface
+
+        if is_host:
+            paddle_x, opponent_x = LEFT_PADDLE_X, RIGHT_PADDLE_X
+            names = (username, opponent_username)
+        else:
+            paddle_x, opponent_x = RIGHT_PADDLE_X, LEFT_PADDLE_X
+            names = (opponent_username, username)
+        if names != self.names:
+            self._build_background(*names)
+
+        if self.full_redraw:
+            surface.blit(self.background, (0, 0))
+        else:
+            for rect in self.previous_rects:
+                surface.blit(self.background, rect, rect)
+
+        pygame.draw.circle(surface, INDICATOR_COLORS[health], (20, 20), 10)
+
+        paddle_rect = pygame.draw.rect(surface, WHITE, (paddle_x, state.paddle_y, PADDLE_WIDTH, PADDLE_HEIGHT))
+        opponent_rect = pygame.draw.rect(surface, WHITE, (opponent_x, state.opponent_paddle_y, PADDLE_WIDTH, PADDLE_HEIGHT))
+        ball_rect = pygame.draw.ellipse(surface, WHITE, (state.ball_x, state.ball_y, BALL_SIZE, BALL_SIZE))
+
+        # Scores centered under the usernames
+        left_width, right_width = self.name_widths
+        left_score = self.text(self.small_font, str(state.left_score))
+        right_score = self.text(self.small_font, str(state.right_score))
+        left_score_rect = surface.blit(left_score, (50 + left_width // 2 - left_score.get_width() // 2, 50))
+        right_score_rect = surface.blit(right_score, (FIXED_WIDTH - 50 - right_width // 2 - right_score.get_width() // 2, 50))
+
+        rects = [INDICATOR_RECT, paddle_rect, opponent_rect, ball_rect, left_score_rect, right_score_rect]
+        if overlay_lines:
+            x, y = OVERLAY_POS
+            y -= OVERLAY_LINE_HEIGHT * len(overlay_lines)
+            for line in overlay_lines:
+                rects.append(surface.blit(self.text(self.small_font, line), (x, y)))
+                y += OVERLAY_LINE_HEIGHT
+        if direct and not self.full_redraw:
+            pygame.display.update(self.previous_rects + rects)
+        else:
+            if not direct:
+                pygame.transform.scale(self.fixed_surface, display.get_size(), display)
+            pygame.display.flip()
+        self.previous_rects = rects
+        self.full_redraw = False
+
+def _legacy_draw_game(screen, state, username, opponent_username, resolution):
+    # The previous per-frame path, kept only so the benchmark has something to compare against
+    fixed_surface = pygame.Surface((FIXED_WIDTH, FIXED_HEIGHT))
+    fixed_surface.fill(BLACK)
+    font = pygame.font.Font(None, 28)
+    small_font = pygame.font.Font(None, 24)
+    pygame.draw.circle(fixed_surface, (0, 255, 0), (20, 20), 10)
+    pygame.draw.rect(fixed_surface, WHITE, (LEFT_PADDLE_X, state.paddle_y, PADDLE_WIDTH, PADDLE_HEIGHT))
+    pygame.draw.rect(fixed_surface, WHITE, (RIGHT_PADDLE_X, state.opponent_paddle_y, PADDLE_WIDTH, PADDLE_HEIGHT))
+    pygame.draw.ellipse(fixed_surface, WHITE, (state.ball_x, state.ball_y, BALL_SIZE, BALL_SIZE))
+    pygame.draw.aaline(fixed_surface, WHITE, (FIXED_WIDTH // 2, 0), (FIXED_WIDTH // 2, FIXED_HEIGHT))
+    left_text = font.render(username, True, WHITE)
+    right_text = font.render(opponent_username, True, WHITE)
+    fixed_surface.blit(left_text, (50, 20))
+    fixed_surface.blit(right_text, (FIXED_WIDTH - 50 - right_text.get_width(), 20))
+    fixed_surface.blit(small_font.render(str(state.left_score), True, WHITE), (50, 50))
+    fixed_surface.blit(small_font.render(str(state.right_score), True, WHITE), (FIXED_WIDTH - 50, 50))
+    screen.blit(pygame.transform.scale(fixed_surface, resolution), (0, 0))
+    pygame.display.flip()
+
+def benchmark(frames=600):
+    from sim import new_state, update_ball
+
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    pygame.init()
+    results = {}
+    for resolution in ((FIXED_WIDTH, FIXED_HEIGHT), (1280, 720)):
+        screen = pygame.display.set_mode(resolution)
+        for name in ("legacy", "renderer"):
+            state = new_state(True)
+            renderer = Renderer()
+            start = time.perf_counter()
+            for _ in range(frames):
+                state.paddle_y = state.opponent_paddle_y = max(0, min(440, state.ball_y - 40))
+                update_ball(state)
+                if name == "legacy":
+                    _legacy_draw_game(screen, state, "Player", "Opponent", resolution)
+                else:
+                    renderer.draw(state, True, "Player", "Opponent", resolution)
+            results[(resolution, name)] = (time.perf_counter() - start) / frames * 1000
+        legacy, new = results[(resolution, "legacy")], results[(resolution, "renderer")]
+        print(f"[BENCH] {resolution[0]}x{resolution[1]}: legacy {legacy:.3f} ms/frame, renderer {new:.3f} ms/frame ({legacy / new:.1f}x)")
+    pygame.quit()
+    return results
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--bench":
+        benchmark()
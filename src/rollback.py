@@ -0,0 +1,120 @@
+# Input-exchange netcode: both peers run the deterministic sim.step, predict the remote input,
+# and roll back to a saved frame to resimulate when a late input disagrees with the prediction.
+import struct
+import time
+import sys
+
+from sim import new_state, save_state, load_state, step
+
+RING_SIZE = 64
+MAX_ROLLBACK = 16  # How far we may run ahead of the last confirmed remote input
+INPUT_DELAY = 2
+INPUT_HEADER = '!cIIB'  # b'I', ack of the peer's inputs, first frame, count
+INPUT_HEADER_SIZE = struct.calcsize(INPUT_HEADER)
+
+class RollbackSession:
+    def __init__(self, local_side, input_delay=INPUT_DELAY):
+        self.local_side = local_side  # 0 = left paddle, 1 = right paddle
+        self.input_delay = input_delay
+        self.state = new_state(True)
+        self.frame = 0
+
+        self.local_inputs = [0] * RING_SIZE
+        self.remote_inputs = [0] * RING_SIZE
+        self.used_remote = [0] * RING_SIZE
+        self.saved = [None] * RING_SIZE
+        self.local_frame = input_delay - 1  # Frames before the delay window play with no input
+        self.last_remote_frame = input_delay - 1
+        self.remote_ack = input_delay - 1
+        self.rollback_frame = None
+
+        self.rollbacks = 0
+        self.resimulated_frames = 0
+
+    def add_local_input(self, bits):
+        self.local_frame = self.frame + self.input_delay
+        self.local_inputs[self.local_frame % RING_SIZE] = bits
+
+    def build_packet(self):
+        first = self.remote_ack + 1
+        count = min(self.local_frame - first + 1, RING_SIZE, 255)
+        if count <= 0:
+            first, count = self.local_frame, 1
+        inputs = bytes(self.local_inputs[(first + i) % RING_SIZE] for i in range(count))
+        return struct.pack(INPUT_HEADER, b'I', self.last_remote_frame & 0xFFFFFFFF, first, count) + inputs
+
+    def on_packet(self, data):
+        if len(data) < INPUT_HEADER_SIZE or data[:1] != b'I':
+            return False
+        _, ack, first, count = struct.unpack_from(INPUT_HEADER, data)
+        if ack != 0xFFFFFFFF and ack > self.remote_ack:
+            self.remote_ack = ack
+
+        for i in range(count):
+            frame = first + i
+            if frame <= self.last_remote_frame:
+                continue
+            if frame != self.last_remote_frame + 1:
+                break  # A gap; the peer resends from our ack
+            bits = data[INPUT_HEADER_SIZE + i]
+            self.remote_inputs[frame % RING_SIZE] = bits
+            self.last_remote_frame = frame
+            if frame < self.frame and self.used_remote[frame % RING_SIZE] != bits:
+                if self.rollback_frame is None or frame < self.rollback_frame:
+                    self.rollback_frame = frame
+        return True
+
+    def can_advance(self):
+        return self.frame - self.last_remote_frame <= MAX_ROLLBACK
+
+    def _simulate(self, frame):
+        index = frame % RING_SIZE
+        self.saved[index] = save_state(self.state)
+        if frame <= self.last_remote_frame:
+            remote = self.remote_inputs[index]
+        else:
+            remote = self.remote_inputs[self.last_remote_frame % RING_SIZE]  # Predict: repeat the last known input
+        self.used_remote[index] = remote
+        local = self.local_inputs[index]
+        if self.local_side == 0:
+            step(self.state, local, remote)
+        else:
+            step(self.state, remote, local)
+
+    def advance(self):
+        if self.rollback_frame is not None:
+            load_state(self.state, self.saved[self.rollback_frame % RING_SIZE])
+            for frame in range(self.rollback_frame, self.frame):
+                self._simulate(frame)
+            self.rollbacks += 1
+            self.resimulated_frames += self.frame - self.rollback_frame
+            self.rollback_frame = None
+        self._simulate(self.frame)
+        self.frame += 1
+
+    def view(self):
+        # draw_game expects our own paddle in 'paddle_y'
+        view = self.state.copy()
+        if self.local_side == 1:
+            view.paddle_y, view.opponent_paddle_y = view.opponent_paddle_y, view.paddle_y
+        return view
+
+def benchmark(frames=MAX_ROLLBACK, iterations=2000):
+    session = RollbackSession(0)
+    for _ in range(120):
+        session.add_local_input(0)
+        session.advance()
+
+    # Worst case: the oldest predicted frame turns out wrong and everything after it is replayed
+    start = time.perf_counter()
+    for _ in range(iterations):
+        session.rollback_frame = session.frame - frames
+        session.add_local_input(0)
+        session.advance()
+    elapsed = (time.perf_counter() - start) / iterations
+    print(f"[BENCH] Rollback of {frames} frames: {elapsed * 1000:.3f} ms ({elapsed * 1000 / 16.7 * 100:.1f}% of a 60 Hz tick)")
+    return elapsed
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--bench":
+        benchmark()
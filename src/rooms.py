@@ -0,0 +1,268 @@
+import heapq
+import socket
+import time
+import json
+import random
+import string
+
+from constants import PORT, DISCOVERY_PORT, ROOM_HEARTBEAT_INTERVAL
+
+LOBBY_PAGE_SIZE = 20
+ROOM_EXPIRY = 3 * ROOM_HEARTBEAT_INTERVAL  # Missing three heartbeats; hosts that shut down cleanly say so
+PROBE = b'{"op": "probe"}'
+
+def local_ip():
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        s.connect(('8.8.8.8', 80))  # Connect to Google's DNS to determine local IP
+        return s.getsockname()[0]
+    except:
+        return '127.0.0.1'
+    finally:
+        s.close()
+
+def name_matches(name, words):
+    # The lobby's name search: every word of the filter is a whole word of the name, ignoring case
+    return not words or set(name.lower().split()).issuperset(words)
+
+class Room:
+    def __init__(self, name, host_ip, room_id=None, host_username="Player", port=PORT):
+        self.name = name
+        self.host_ip = host_ip
+        self.port = port
+        self.room_id = room_id or self._generate_id()
+        self.last_update = time.time()
+        self.player_count = 1
+        self.host_username = host_username
+        
+    def _generate_id(self):
+        return ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
+        
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "host_ip": self.host_ip,
+            "room_id": self.room_id,
+            "player_count": self.player_count,
+            "host_username": self.host_username,
+            "port": self.port
+        }
+        
+    def to_json(self):
+        return json.dumps(self.to_dict())
+        
+    @classmethod
+    def from_dict(cls, data):
+        try:
+            room = cls(data["name"], data["host_ip"], data["room_id"], data.get("host_username", "Player"), data.get("port", PORT))
+            room.player_count = data["player_count"]
+            return room
+        except:
+            return None
+        
+    @classmethod
+    def from_json(cls, json_str):
+        try:
+            return cls.from_dict(json.loads(json_str))
+        except:
+            return None
+
+class ExpiryHeap:
+    # Deadlines for keys that are refreshed far more often than they expire. Each key has one heap entry;
+    # a refresh only moves its deadline, and the entry is pushed back when it comes due early.
+    def __init__(self):
+        self.deadlines = {}
+        self.heap = []
+        self.queued = set()  # Keys with an entry in the heap, live or discarded, so each has at most one
+
+    def touch(self, key, deadline):
+        if key not in self.queued:
+            heapq.heappush(self.heap, (deadline, key))
+            self.queued.add(key)
+        self.deadlines[key] = deadline
+
+    def discard(self, key):
+        self.deadlines.pop(key, None)
+
+    def pop_expired(self, now):
+        expired = []
+        heap = self.heap
+        while heap and heap[0][0] <= now:
+            _, key = heapq.heappop(heap)
+            deadline = self.deadlines.get(key)
+            if deadline is None:
+                self.queued.discard(key)  # Discarded since
+            elif deadline > now:
+                heapq.heappush(heap, (deadline, key))
+            else:
+                del self.deadlines[key]
+                self.queued.discard(key)
+                expired.append(key)
+        return expired
+
+class RoomManager:
+    # Hosts answer probes straight away and announce when their room changes, with a slow heartbeat as
+    # the fallback; clients probe when they start and on every refresh, so rooms appear without waiting
+    def __init__(self, engine, lobby_addr=None):
+        self.engine = engine
+        self.rooms = {}
+        self.expiry = ExpiryHeap()
+        self.room_list = None  # Cached get_rooms() result, rebuilt only when a room is added or removed
+        self.endpoint = None
+        self.query_endpoint = None  # Unicast replies: probe answers and lobby listings
+        self.heartbeat_task = None
+        self.running = False
+        self.is_host = False
+        self.my_room = None
+        # Optional lobby server (lobby.py), for rooms that LAN broadcast doesn't reach
+        self.lobby_addr = lobby_addr
+        self.lobby_rooms = {}
+        self.lobby_pages = {}  # page -> rooms, for each page of the listing loaded so far
+        self.lobby_pages_wanted = 1
+        self.lobby_more = False
+        self.name_filter = ""  # Whole words a room name must contain, for lobby and LAN rooms alike
+        
+    def start(self, is_host=False):
+        self.is_host = is_host
+        self.running = True
+        try:
+            self.endpoint = self.engine.open(DISCOVERY_PORT, self._on_datagram, broadcast=True, reuse=True)
+        except OSError:
+            print("[ERROR] Could not bind to discovery port")
+        if is_host:
+            if self.endpoint is None:
+                self.endpoint = self.engine.open(broadcast=True)  # Can still announce, just not answer probes
+            if self.lobby_addr:
+                self.query_endpoint = self.engine.open(on_datagram=self._on_query_reply)
+            self.heartbeat_task = self.engine.start(self._heartbeat())
+        else:
+            self.query_endpoint = self.engine.open(on_datagram=self._on_query_reply, broadcast=True)
+            self.refresh()
+    
+    def create_room(self, name, username):
+        self.my_room = Room(name, local_ip(), host_username=username)
+        return self.my_room
+    
+    def get_rooms(self):
+        expired = self.expiry.pop_expired(time.monotonic())
+        for room_id in expired:
+            del self.rooms[room_id]
+        if expired or self.room_list is None:
+            # A room heard on the LAN is fresher than the lobby's copy
+            words = self.name_filter.lower().split()
+            rooms = dict(self.lobby_rooms)
+            rooms.update((room_id, room) for room_id, room in self.rooms.items() if name_matches(room.name, words))
+            self.room_list = list(rooms.values())
+        return self.room_list
+    
+    def refresh(self, name=None, probe=True):
+        # Probes the LAN, and asks the lobby again for every page of open rooms loaded so far. A different
+        # name filter starts the listing over from its first page.
+        if name is not None and name != self.name_filter:
+            self.name_filter = name
+            self.lobby_rooms = {}
+            self.lobby_pages = {}
+            self.lobby_pages_wanted = 1
+            self.lobby_more = False
+            self.room_list = None
+        if not self.query_endpoint:
+            return
+        if probe:
+            self.query_endpoint.sendto(PROBE, ('<broadcast>', DISCOVERY_PORT))
+        if self.lobby_addr:
+            for page in range(self.lobby_pages_wanted):
+                self._request_page(page)
+
+    def load_more(self):
+        # Asks the lobby for the next page, once it has said there is one and the last page asked for arrived
+        if self.lobby_addr and self.query_endpoint and self.lobby_more and len(self.lobby_pages) == self.lobby_pages_wanted:
+            self.lobby_pages_wanted += 1
+            self._request_page(self.lobby_pages_wanted - 1)
+
+    def _request_page(self, page):
+        self._send_lobby({"op": "list", "page": page, "page_size": LOBBY_PAGE_SIZE, "name": self.name_filter})
+    
+    def announce(self):
+        # Call after changing my_room, e.g. when the second player joins
+        if not self.my_room:
+            return
+        self.endpoint.sendto(self.my_room.to_json().encode(), ('<broadcast>', DISCOVERY_PORT))
+        if self.lobby_addr:
+            self._send_lobby({"op": "register", "room": self.my_room.to_dict()})  # Doubles as the heartbeat
+    
+    async def _heartbeat(self):
+        import asyncio  # Only hosts need it, and the engine running this has already loaded it
+        while self.running and self.is_host:
+            self.announce()
+            await asyncio.sleep(ROOM_HEARTBEAT_INTERVAL)
+    
+    def _send_lobby(self, request):
+        self.query_endpoint.sendto(json.dumps(request).encode(), self.lobby_addr)
+    
+    def _on_datagram(self, data, addr):
+        if data == PROBE:
+            if self.is_host and self.my_room:
+                self.endpoint.sendto(self.my_room.to_json().encode(), addr)
+            return
+        if self.is_host:
+            return
+        try:
+            message = json.loads(data)
+        except ValueError:
+            return
+        if isinstance(message, dict) and message.get("op") == "closed":
+            room_id = message.get("room_id")
+            if room_id in self.rooms:
+                del self.rooms[room_id]
+                self.expiry.discard(room_id)
+                self.room_list = None
+            return
+        self._add_room(Room.from_dict(message))
+    
+    def _add_room(self, room):
+        if not room:
+            return
+        room.last_update = time.time()
+        self.rooms[room.room_id] = room
+        self.room_list = None
+        self.expiry.touch(room.room_id, time.monotonic() + ROOM_EXPIRY)
+    
+    def _on_query_reply(self, data, addr):
+        # Either a host answering our probe or the lobby
+        try:
+            message = json.loads(data)
+        except ValueError:
+            return
+        if isinstance(message, dict) and "op" in message:
+            self._on_lobby_reply(message)
+        else:
+            self._add_room(Room.from_dict(message))
+    
+    def _on_lobby_reply(self, reply):
+        op = reply.get("op")
+        if op == "rooms":
+            page = reply.get("page", 0)
+            if reply.get("name", "") != self.name_filter or not isinstance(page, int) or not 0 <= page < self.lobby_pages_wanted:
+                return  # An answer to an earlier search
+            rooms = [Room.from_dict(room) for room in reply.get("rooms", [])]
+            self.lobby_pages[page] = [room for room in rooms if room]
+            if page == self.lobby_pages_wanted - 1:
+                self.lobby_more = bool(reply.get("more"))
+            self.lobby_rooms = {room.room_id: room for page in sorted(self.lobby_pages) for room in self.lobby_pages[page]}
+            self.room_list = None
+        elif op == "error":
+            print(f"[LOBBY] {reply.get('reason')}")
+    
+    def stop(self):
+        self.running = False
+        if self.heartbeat_task:
+            self.heartbeat_task.cancel()
+        if self.is_host and self.my_room and self.endpoint:
+            # Lets clients drop the room now instead of when it times out
+            self.endpoint.sendto(json.dumps({"op": "closed", "room_id": self.my_room.room_id}).encode(),
+                                 ('<broadcast>', DISCOVERY_PORT))
+            if self.lobby_addr:
+                self._send_lobby({"op": "unregister", "room_id": self.my_room.room_id})
+        for endpoint in (self.endpoint, self.query_endpoint):
+            if endpoint:
+                endpoint.close()
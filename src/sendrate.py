@@ -0,0 +1,138 @@
+# Decides when the gameplay stream sends a snapshot: at once for anything the peer can't predict (a paddle
+# starting, stopping or reversing, a bounce, a score), at an interval that adapts to the measured link
+# otherwise, and at a slow keepalive while nothing changes at all.
+import random
+import sys
+from types import SimpleNamespace
+
+from constants import GAME_SPEED, NETWORK_UPDATE_FREQUENCY, PADDLE_SPEED
+
+MIN_INTERVAL = 1  # frames; every frame on a fast, clean link
+MAX_INTERVAL = 6  # 10 Hz when the link is congested
+KEEPALIVE_INTERVAL = GAME_SPEED // 4  # frames between packets while the snapshot doesn't change
+ADAPT_INTERVAL = GAME_SPEED  # frames between rate decisions
+FAST_RTT = 60  # ms; above this, sending every frame buys little next to the RTT itself
+LOSS_BACKOFF = 5.0  # % of the peer's packets lost over the last window
+QUEUE_BACKOFF = 40  # ms of RTT above the lowest we've seen, i.e. a queue building up somewhere
+
+class SendScheduler:
+    def __init__(self, stats):
+        self.stats = stats  # A telemetry.ConnectionStats for the same peer
+        self.interval = NETWORK_UPDATE_FREQUENCY
+        self.last_sent = None
+        self.last_sent_frame = 0
+        self.previous_paddle = None
+        self.paddle_direction = 0
+        self.min_rtt = None
+        self.window = (0, 0)  # (lost, expected) when the current adaptation window started
+        self.sent = {'event': 0, 'scheduled': 0, 'keepalive': 0}
+
+    def adapt(self):
+        # Additive increase, multiplicative decrease, applied to the send rate
+        stats = self.stats
+        expected = stats.highest_seq - stats.first_seq + 1 if stats.highest_seq is not None else 0
+        lost = stats.lost
+        window_expected = expected - self.window[1]
+        loss = 100.0 * (lost - self.window[0]) / window_expected if window_expected > 0 else 0.0
+        self.window = (lost, expected)
+
+        rtt = stats.rtt  # None on the server, which only answers pings; loss alone drives it there
+        queueing = 0
+        if rtt is not None:
+            self.min_rtt = rtt if self.min_rtt is None else min(self.min_rtt, rtt)
+            queueing = rtt - self.min_rtt
+        if loss > LOSS_BACKOFF or queueing > QUEUE_BACKOFF:
+            self.interval = min(MAX_INTERVAL, self.interval * 2)
+        elif loss < 1 and queueing < QUEUE_BACKOFF / 2:
+            floor = MIN_INTERVAL if rtt is not None and rtt < FAST_RTT else NETWORK_UPDATE_FREQUENCY
+            self.interval = max(floor, self.interval - 1)
+
+    def should_send(self, frame, snapshot, urgent=False):
+        # Call once per frame with the snapshot we would send; it has to see every frame to spot turns
+        if frame % ADAPT_INTERVAL == 0:
+            self.adapt()
+        paddle = snapshot[0]
+        previous = self.previous_paddle
+        direction = 0 if previous is None else (paddle > previous) - (paddle < previous)
+        self.previous_paddle = paddle
+        turned = direction != self.paddle_direction
+        self.paddle_direction = direction
+
+        last = self.last_sent
+        if urgent or last is None or turned or snapshot[3:] != last[3:]:
+            reason = 'event'
+        elif snapshot == last:
+            reason = 'keepalive' if frame - self.last_sent_frame >= KEEPALIVE_INTERVAL else None
+        else:
+            reason = 'scheduled' if frame - self.last_sent_frame >= self.interval else None
+        if reason is None:
+            return False
+        self.last_sent = snapshot
+        self.last_sent_frame = frame
+        self.sent[reason] += 1
+        return True
+
+def _paddle_trace(frames, rng):
+    # Bursts of movement between idle stretches, like a player waiting for the ball
+    y, trace = 220, []
+    while len(trace) < frames:
+        for _ in range(rng.randint(GAME_SPEED // 2, 3 * GAME_SPEED)):
+            trace.append(y)
+        direction = rng.choice((-1, 1))
+        for _ in range(rng.randint(GAME_SPEED // 5, GAME_SPEED)):
+            y = max(0, min(440, y + direction * PADDLE_SPEED))
+            trace.append(y)
+    return trace[:frames]
+
+def benchmark(seconds=120, seed=3):
+    # Packets per second and frames from a paddle turn to the packet carrying it, fixed vs adaptive
+    from sim import new_state, update_ball
+    frames = seconds * GAME_SPEED
+    trace = _paddle_trace(frames, random.Random(seed))
+    links = {
+        'good': SimpleNamespace(rtt=20, lost=0, loss_step=0.0, queue=0),
+        'congested': SimpleNamespace(rtt=150, lost=0, loss_step=0.08, queue=80),
+    }
+
+    results = {}
+    for role in ('client', 'host'):
+        for name, link in [('fixed', None)] + list(links.items()):
+            state = new_state(True)
+            stats = SimpleNamespace(rtt=None, lost=0, first_seq=0, highest_seq=None)
+            scheduler = SendScheduler(stats)
+            sent = 0
+            waiting_since = None
+            delays = []
+            previous = None
+            for frame in range(frames):
+                state.paddle_y = trace[frame]
+                score_changed = update_ball(state) if role == 'host' else False
+                snapshot = (trace[frame], state.ball_x, state.ball_y, state.ball_speed_x, state.ball_speed_y)
+                if role == 'client':
+                    snapshot = (trace[frame], 0, 0, 0, 0)
+                if previous is not None and frame > 1 and (trace[frame] - previous) != (previous - trace[frame - 2]):
+                    waiting_since = frame if waiting_since is None else waiting_since
+                previous = trace[frame]
+
+                if link is not None:
+                    # The peer's packets arrive at this link's RTT and loss; its queue shows up after 10 s
+                    stats.highest_seq = frame // NETWORK_UPDATE_FREQUENCY
+                    stats.lost = int(stats.highest_seq * link.loss_step)
+                    stats.rtt = link.rtt + (link.queue if frame > 10 * GAME_SPEED else 0)
+                    send = scheduler.should_send(frame, snapshot, score_changed)
+                else:
+                    send = score_changed or frame % NETWORK_UPDATE_FREQUENCY == 0
+                if send:
+                    sent += 1
+                    if waiting_since is not None:
+                        delays.append(frame - waiting_since)
+                        waiting_since = None
+            key = f"{role}_{name}"
+            results[key] = (sent / seconds, sum(delays) / max(1, len(delays)))
+            print(f"[BENCH] {role:6} {name:9} {sent / seconds:5.1f} packets/s, "
+                  f"turn-to-send {results[key][1]:.2f} frames")
+    return results
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--bench":
+        benchmark()
@@ -0,0 +1,306 @@
+# Dedicated server: runs many matches in one process, multiplexed over the single PORT socket by peer address.
+import socket
+import select
+import time
+import sys
+
+from constants import PORT, DISCOVERY_PORT, BUFFER_SIZE, SOCKET_BUFFER_SIZE, GAME_SPEED, ROOM_BROADCAST_INTERVAL
+from rooms import Room, local_ip
+from handshake import hello_ack
+from sim import new_state, update_ball
+from protocol import SnapshotEncoder, SnapshotDecoder, snapshot_from_state
+from netsync import ClockSync, is_clock_packet, now_ms
+from reliable import ReliableChannel, is_reliable_packet
+from sendrate import SendScheduler
+from telemetry import ConnectionStats, TelemetryWriter
+
+PLAYER_TIMEOUT = 10
+TICK = 1.0 / GAME_SPEED
+
+class Match:
+    def __init__(self, match_id):
+        self.match_id = match_id
+        self.players = []  # [left_addr, right_addr]
+        self.usernames = []
+        self.encoders = [SnapshotEncoder(), SnapshotEncoder()]
+        self.decoders = [SnapshotDecoder(), SnapshotDecoder()]
+        self.channels = []  # Reliable handshake, score and pause messages, per side
+        self.last_seen = []
+        self.stats = []
+        self.schedulers = []
+        self.state = new_state(True)
+        self.frame_counter = 0
+        self.score_changed = False
+        self.paused = False
+
+    def is_full(self):
+        return len(self.players) == 2
+
+    def add_player(self, addr, username, channel):
+        self.players.append(addr)
+        self.usernames.append(username)
+        self.channels.append(channel)
+        self.last_seen.append(time.time())
+        self.stats.append(ConnectionStats(name=f"{self.match_id}:{'LR'[len(self.players) - 1]}:{username}"))
+        self.schedulers.append(SendScheduler(self.stats[-1]))
+        return len(self.players) - 1
+
+    def on_packet(self, side, data):
+        result = self.decoders[side].decode(data)
+        if result is None:
+            return
+        seq, snapshot, ack, stamp, is_newest = result
+        self.stats[side].on_sequence(seq, stamp, now_ms())
+        if ack is not None:
+            self.encoders[side].on_ack(ack)
+        if not is_newest:
+            return
+        if side == 0:
+            self.state.paddle_y = snapshot[0]
+        else:
+            self.state.opponent_paddle_y = snapshot[0]
+
+    def on_reliable(self, side, data):
+        for message in self.channels[side].on_packet(data, now_ms()):
+            # Either player can pause; the other one is told so both screens freeze together
+            if message in (b"PAUSE", b"RESUME") and self.is_full():
+                self.paused = message == b"PAUSE"
+                self.channels[1 - side].send(message)
+
+    def step(self, sock):
+        now = now_ms()
+        for channel in self.channels:
+            channel.poll(now)
+        if not self.is_full() or self.paused:
+            return
+        if update_ball(self.state):
+            self.score_changed = True
+            score = f"SCORE:{self.state.left_score}:{self.state.right_score}".encode()
+            for channel in self.channels:
+                channel.send(score)
+        self.frame_counter += 1
+
+        snapshot = snapshot_from_state(self.state)
+        for side, addr in enumerate(self.players):
+            # Each player receives the other player's paddle, exactly like a P2P host would send it
+            if side == 0:
+                snapshot = (self.state.opponent_paddle_y,) + snapshot[1:]
+            else:
+                snapshot = (self.state.paddle_y,) + snapshot[1:]
+            if not self.schedulers[side].should_send(self.frame_counter, snapshot, self.score_changed):
+                continue
+            packet = self.encoders[side].encode(snapshot, self.decoders[side].latest, now_ms())
+            try:
+                sock.sendto(packet, addr)
+                self.stats[side].on_send(len(packet))
+            except OSError:
+                pass
+        self.score_changed = False
+
+    def is_stale(self, now):
+        return any(now - seen > PLAYER_TIMEOUT for seen in self.last_seen)
+
+class DedicatedServer:
+    def __init__(self, port=PORT, advertise=True, telemetry_path=None):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCKET_BUFFER_SIZE)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_BUFFER_SIZE)
+        self.sock.bind(("0.0.0.0", port))
+        self.sock.setblocking(False)
+        self.matches = {}
+        self.peers = {}  # addr -> (match, side)
+        self.waiting = None
+        self.next_match_id = 1
+        self.running = False
+        self.clock = ClockSync()
+        self.telemetry = TelemetryWriter(telemetry_path) if telemetry_path else None
+
+        self.advertise = advertise
+        self.discovery_socket = None
+        self.host_ip = local_ip()
+        self.last_broadcast = 0
+        if advertise:
+            self.discovery_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.discovery_socket.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+
+    def handle_datagram(self, data, addr):
+        entry = self.peers.get(addr)
+        if is_clock_packet(data):
+            if entry is None:
+                return
+            match, side = entry
+            match.last_seen[side] = time.time()  # Also the keepalive of a player still waiting for an opponent
+            pong = self.clock.handle(data, now_ms())
+            if pong:
+                self.sock.sendto(pong, addr)
+            return
+        if entry is not None:
+            match, side = entry
+            match.stats[side].on_receive(len(data))
+            match.last_seen[side] = time.time()  # Anything counts, so a paused player isn't dropped
+            if is_reliable_packet(data):
+                match.on_reliable(side, data)
+            else:
+                match.on_packet(side, data)
+            return
+
+        # A new player's first reliable message is its HELLO; the channel carries on from there
+        if not is_reliable_packet(data):
+            return
+        channel = ReliableChannel(lambda packet, addr=addr: self._sendto(packet, addr))
+        hello = next((message for message in channel.on_packet(data, now_ms()) if message.startswith(b"HELLO:")), None)
+        if hello is None:
+            return
+        channel.poll(now_ms())  # Ack the HELLO now so the client knows to wait for an opponent
+        username = hello.decode(errors="replace").split(":", 1)[1]
+        if self.waiting is None:
+            self.waiting = Match(self.next_match_id)
+            self.matches[self.next_match_id] = self.waiting
+            self.next_match_id += 1
+        match = self.waiting
+        side = match.add_player(addr, username, channel)
+        self.peers[addr] = (match, side)
+        print(f"[SERVER] '{username}' joined match {match.match_id} from {addr}")
+
+        if match.is_full():
+            self.waiting = None
+            self._send_ack(match, 0)
+            self._send_ack(match, 1)
+            self.last_broadcast = 0
+
+    def _send_ack(self, match, side):
+        opponent = match.usernames[1 - side]
+        match.channels[side].send(hello_ack(opponent, 'LR'[side]))
+
+    def _sendto(self, packet, addr):
+        try:
+            self.sock.sendto(packet, addr)
+        except OSError:
+            pass
+
+    def _drain(self):
+        while True:
+            try:
+                data, addr = self.sock.recvfrom(BUFFER_SIZE)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                continue
+            self.handle_datagram(data, addr)
+
+    def _remove_match(self, match):
+        print(f"[SERVER] Closing match {match.match_id}")
+        del self.matches[match.match_id]
+        for addr in match.players:
+            self.peers.pop(addr, None)
+        if self.waiting is match:
+            self.waiting = None
+
+    def _broadcast_open_room(self, now):
+        if now - self.last_broadcast < ROOM_BROADCAST_INTERVAL:
+            return
+        self.last_broadcast = now
+        match = self.waiting
+        room = Room(f"Server Match {match.match_id if match else self.next_match_id}", self.host_ip,
+                    room_id=f"S{match.match_id if match else self.next_match_id}",
+                    host_username=match.usernames[0] if match else "Server")
+        room.player_count = len(match.players) if match else 0
+        try:
+            self.discovery_socket.sendto(room.to_json().encode(), ('<broadcast>', DISCOVERY_PORT))
+        except OSError:
+            pass
+
+    def tick(self):
+        for match in list(self.matches.values()):
+            match.step(self.sock)
+
+    def expire(self, now):
+        for match in list(self.matches.values()):
+            if match.is_stale(now):
+                self._remove_match(match)
+
+    def serve_forever(self):
+        self.running = True
+        print(f"[SERVER] Listening on {self.sock.getsockname()[1]}")
+        next_tick = time.perf_counter()
+        last_expire = time.time()
+        while self.running:
+            timeout = max(0, next_tick - time.perf_counter())
+            readable, _, _ = select.select([self.sock], [], [], timeout)
+            if readable:
+                self._drain()
+
+            now = time.perf_counter()
+            if now >= next_tick:
+                self.tick()
+                next_tick += TICK
+                if now - next_tick > 0.25:  # Don't try to catch up after a long stall
+                    next_tick = now
+
+            wall = time.time()
+            if wall - last_expire > 1:
+                last_expire = wall
+                self.expire(wall)
+            if self.advertise:
+                self._broadcast_open_room(wall)
+            if self.telemetry:
+                self.telemetry.maybe_write([stats for match in self.matches.values() for stats in match.stats])
+
+    def stop(self):
+        self.running = False
+        self.sock.close()
+        if self.discovery_socket:
+            self.discovery_socket.close()
+        if self.telemetry:
+            self.telemetry.close()
+
+def benchmark(num_matches=500, duration=5.0):
+    server = DedicatedServer(port=0, advertise=False)
+    sink = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sink.bind(("127.0.0.1", 0))
+    sink_addr = sink.getsockname()
+
+    # Every fake player shares the sink address for sending, so matches are filled directly
+    for i in range(num_matches):
+        match = Match(i)
+        match.add_player(sink_addr, "Left", ReliableChannel(lambda packet: None))
+        match.add_player(sink_addr, "Right", ReliableChannel(lambda packet: None))
+        server.matches[i] = match
+
+    # Pre-encode a stream of paddle updates so the client's encoding cost isn't counted
+    player = SnapshotEncoder()
+    inputs = []
+    for i in range(int(duration * GAME_SPEED * 4)):
+        if i >= 3:
+            player.on_ack(i - 2)
+        inputs.append(player.encode((220 + (i * 5) % 200, 0, 0, 0, 0)))
+
+    ticks = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < duration and ticks < len(inputs):
+        packet = inputs[ticks]
+        for match in server.matches.values():
+            match.on_packet(0, packet)
+            match.on_packet(1, packet)
+        server.tick()
+        ticks += 1
+    elapsed = time.perf_counter() - start
+
+    server.stop()
+    sink.close()
+    match_ticks_per_sec = ticks * num_matches / elapsed
+    print(f"[BENCH] {num_matches} matches, {ticks} ticks in {elapsed:.2f}s")
+    print(f"[BENCH] {match_ticks_per_sec:,.0f} match-ticks/s")
+    print(f"[BENCH] ~{match_ticks_per_sec / GAME_SPEED:,.0f} matches per core at {GAME_SPEED} Hz")
+    return match_ticks_per_sec / GAME_SPEED
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--bench":
+        benchmark(int(sys.argv[2]) if len(sys.argv) > 2 else 500)
+    else:
+        telemetry_path = sys.argv[sys.argv.index("--telemetry") + 1] if "--telemetry" in sys.argv[:-1] else None
+        server = DedicatedServer(telemetry_path=telemetry_path)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            server.stop()
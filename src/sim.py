@@ -0,0 +1,102 @@
+# Display-free game simulation shared by the pygame client and the dedicated server.
+from constants import FIXED_WIDTH, FIXED_HEIGHT, PADDLE_WIDTH, PADDLE_HEIGHT, BALL_SIZE, BALL_SPEED, PADDLE_SPEED
+
+LEFT_PADDLE_X = 50
+RIGHT_PADDLE_X = FIXED_WIDTH - 50 - PADDLE_WIDTH
+LEFT_FACE = LEFT_PADDLE_X + PADDLE_WIDTH  # The edge of the left paddle the ball hits
+PADDLE_START_Y = (FIXED_HEIGHT - PADDLE_HEIGHT) // 2
+
+INPUT_UP = 1
+INPUT_DOWN = 2
+
+# Everything the deterministic step reads or writes, in snapshot order
+SIM_KEYS = ('paddle_y', 'opponent_paddle_y', 'ball_x', 'ball_y', 'ball_speed_x', 'ball_speed_y', 'left_score', 'right_score')
+
+class GameState:
+    # Fixed attribute layout instead of a dict: cheaper to read in the per-tick hot path and to snapshot
+    __slots__ = SIM_KEYS
+
+    def __init__(self, is_host=True):
+        self.paddle_y = PADDLE_START_Y
+        self.opponent_paddle_y = PADDLE_START_Y
+        self.ball_x = FIXED_WIDTH // 2
+        self.ball_y = FIXED_HEIGHT // 2
+        self.ball_speed_x = BALL_SPEED * (1 if is_host else -1)
+        self.ball_speed_y = BALL_SPEED
+        self.left_score = 0
+        self.right_score = 0
+
+    def copy(self):
+        state = GameState.__new__(GameState)
+        load_state(state, save_state(self))
+        return state
+
+def new_state(is_host=True):
+    return GameState(is_host)
+
+def move_paddle(y, up, down):
+    if up and y > 0:
+        y -= PADDLE_SPEED
+    if down and y < FIXED_HEIGHT - PADDLE_HEIGHT:
+        y += PADDLE_SPEED
+    return y
+
+def save_state(state):
+    return (state.paddle_y, state.opponent_paddle_y, state.ball_x, state.ball_y,
+            state.ball_speed_x, state.ball_speed_y, state.left_score, state.right_score)
+
+def load_state(state, snapshot):
+    (state.paddle_y, state.opponent_paddle_y, state.ball_x, state.ball_y,
+     state.ball_speed_x, state.ball_speed_y, state.left_score, state.right_score) = snapshot
+
+def step(state, left_input, right_input):
+    # Integer-only, so two peers fed the same inputs stay bit-identical
+    state.paddle_y = move_paddle(state.paddle_y, left_input & INPUT_UP, left_input & INPUT_DOWN)
+    state.opponent_paddle_y = move_paddle(state.opponent_paddle_y, right_input & INPUT_UP, right_input & INPUT_DOWN)
+    return update_ball(state)
+
+def update_ball(state):
+    old_x = state.ball_x
+    old_y = state.ball_y
+    speed_x = state.ball_speed_x
+    speed_y = state.ball_speed_y
+    ball_x = old_x + speed_x
+    ball_y = old_y + speed_y
+    state.ball_y = ball_y
+
+    if ball_y <= 0 or ball_y + BALL_SIZE >= FIXED_HEIGHT:
+        state.ball_speed_y = -speed_y
+
+    # Swept against the paddle faces: the hit is tested where the ball crosses the face during this tick,
+    # so no speed can carry it through a paddle. The ball is reflected off the face it crossed.
+    if speed_x < 0:
+        if ball_x <= LEFT_FACE and old_x >= LEFT_PADDLE_X:
+            center_y = old_y + speed_y * max(old_x - LEFT_FACE, 0) // -speed_x + BALL_SIZE // 2
+            if state.paddle_y <= center_y <= state.paddle_y + PADDLE_HEIGHT:
+                state.ball_speed_x = -speed_x
+                if ball_x < LEFT_FACE:
+                    ball_x = 2 * LEFT_FACE - ball_x
+    elif speed_x > 0 and ball_x + BALL_SIZE >= RIGHT_PADDLE_X and old_x + BALL_SIZE <= RIGHT_PADDLE_X + PADDLE_WIDTH:
+        center_y = old_y + speed_y * max(RIGHT_PADDLE_X - BALL_SIZE - old_x, 0) // speed_x + BALL_SIZE // 2
+        if state.opponent_paddle_y <= center_y <= state.opponent_paddle_y + PADDLE_HEIGHT:
+            state.ball_speed_x = -speed_x
+            if ball_x + BALL_SIZE > RIGHT_PADDLE_X:
+                ball_x = 2 * (RIGHT_PADDLE_X - BALL_SIZE) - ball_x
+    state.ball_x = ball_x
+
+    if ball_x <= 0:
+        state.right_score += 1
+        reset_ball(state)
+        return True
+
+    if ball_x >= FIXED_WIDTH:
+        state.left_score += 1
+        reset_ball(state)
+        return True
+
+    return False
+
+def reset_ball(state):
+    state.ball_x, state.ball_y = FIXED_WIDTH // 2, FIXED_HEIGHT // 2
+    state.ball_speed_x = BALL_SPEED
+    state.ball_speed_y = BALL_SPEED
@@ -0,0 +1,262 @@
+# Spectators: read-only viewers that any P2P host or relay accepts on SPECTATOR_PORT. The host packs the
+# whole match state once per send tick and sends those same bytes to every viewer. A relay watches a host
+# (or another relay) and forwards the bytes unchanged to its own viewers, so relays chain and no single
+# uplink has to carry every viewer.
+#
+# Handshake: WATCH:<name> over the reliable channel -> WATCH_ACK:<length of left name>:<left name><right name>
+# View packet: b'V', uint32 frame, uint16 sender time in ms, then the state in sim.SIM_KEYS order
+#
+#   python src/spectate.py 192.168.1.10 [--delay 2]            watch a host or relay
+#   python src/spectate.py 192.168.1.10 --relay --port 42074   relay it to more viewers, no window
+#   python src/spectate.py --bench 200                          time fan-out to 200 viewers
+import argparse
+import socket
+import struct
+import time
+
+from constants import SPECTATOR_PORT, SOCKET_BUFFER_SIZE, GAME_SPEED, NETWORK_UPDATE_FREQUENCY, FIXED_WIDTH, FIXED_HEIGHT
+from engine import NetEngine
+from handshake import connect_to_host, watch_ack, parse_watch_ack
+from netsync import ClockSync, SnapshotBuffer, SNAPSHOT_HISTORY, is_clock_packet, now_ms
+from reliable import ReliableChannel, is_reliable_packet
+from sim import GameState, save_state, load_state
+
+VIEW = struct.Struct('!cIHhhhhbbHH')
+VIEW_INTERVAL = NETWORK_UPDATE_FREQUENCY  # Frames between view packets
+SPECTATOR_DELAY = 2.0  # Seconds viewers run behind the match by default
+VIEWER_TIMEOUT = 10
+MAX_VIEWERS = 1000
+
+class SpectatorHub:
+    def __init__(self, engine, port=SPECTATOR_PORT, names=("Left", "Right")):
+        self.endpoint = engine.open(port, self.on_datagram, buffer_size=SOCKET_BUFFER_SIZE)
+        self.names = names
+        self.viewers = {}  # addr -> [reliable channel, last heard from]
+        self.clock = ClockSync()
+        self.last_expire = time.monotonic()
+        self.packets_sent = 0
+
+    def on_datagram(self, data, addr):
+        now = now_ms()
+        viewer = self.viewers.get(addr)
+        if viewer is not None:
+            viewer[1] = time.monotonic()  # Viewers ping once a second; that keeps them listed
+            if is_clock_packet(data):
+                pong = self.clock.handle(data, now)
+                if pong:
+                    self.endpoint.sendto(pong, addr)
+            elif is_reliable_packet(data):
+                viewer[0].on_packet(data, now)
+            return
+
+        if not is_reliable_packet(data) or len(self.viewers) >= MAX_VIEWERS:
+            return
+        channel = ReliableChannel(lambda packet, addr=addr: self.endpoint.sendto(packet, addr))
+        watch = next((message for message in channel.on_packet(data, now) if message.startswith(b"WATCH:")), None)
+        if watch is None:
+            return
+        channel.send(watch_ack(*self.names))
+        channel.poll(now)
+        self.viewers[addr] = [channel, time.monotonic()]
+        print(f"[SPECTATE] '{watch[6:].decode(errors='replace')}' watching from {addr}, {len(self.viewers)} viewers")
+
+    def fan_out(self, packet):
+        # The same bytes for every viewer: nothing is encoded per viewer, it's one send each
+        sendto = self.endpoint.transport.sendto
+        for addr in self.viewers:
+            sendto(packet, addr)
+        self.packets_sent += len(self.viewers)
+
+    def publish(self, frame, state):
+        # Called every frame by the host's game loop
+        self.poll()
+        if self.viewers and frame % VIEW_INTERVAL == 0:
+            self.fan_out(VIEW.pack(b'V', frame & 0xFFFFFFFF, now_ms() & 0xFFFF, *save_state(state)))
+
+    def poll(self):
+        now = now_ms()
+        for channel, _ in self.viewers.values():
+            channel.poll(now)
+        wall = time.monotonic()
+        if wall - self.last_expire >= 1:
+            self.last_expire = wall
+            for addr in [addr for addr, (_, seen) in self.viewers.items() if wall - seen > VIEWER_TIMEOUT]:
+                del self.viewers[addr]
+                print(f"[SPECTATE] Viewer {addr} timed out, {len(self.viewers)} viewers")
+
+    def close(self):
+        self.endpoint.close()
+
+class Spectator:
+    def __init__(self, engine, source, name="Spectator", delay=SPECTATOR_DELAY, relay_port=None):
+        self.engine = engine
+        self.endpoint = engine.open(buffer_size=SOCKET_BUFFER_SIZE)
+        self.source = source
+        self.name = name
+        self.relay_port = relay_port
+        # The view stream carries the host's clock, so the buffer maps it through the first packet instead of
+        # a ping offset (which would be to a relay's clock). It has to hold the whole delay's worth of packets.
+        history = int(delay * GAME_SPEED / VIEW_INTERVAL) + SNAPSHOT_HISTORY
+        self.buffer = SnapshotBuffer(ClockSync(), delay * 1000, history)
+        self.clock = ClockSync()  # Pings to the source, which keep us listed there
+        self.channel = None
+        self.names = None
+        self.hub = None
+        self.state = GameState()
+        self.received = 0
+
+    def join(self, on_idle=None):
+        msg, addr, channel = self.engine.wait(connect_to_host(self.endpoint, self.source, self.name, "WATCH"),
+                                              on_idle=on_idle)
+        if msg is None:
+            return False
+        self.source = addr
+        self.channel = channel
+        self.names = parse_watch_ack(msg)
+        if self.relay_port is not None:
+            self.hub = SpectatorHub(self.engine, self.relay_port, self.names)
+        self.endpoint.set_handler(self.on_datagram)
+        return True
+
+    def on_datagram(self, data, addr):
+        if addr != self.source:
+            return
+        if data[:1] == b'V' and len(data) == VIEW.size:
+            if self.hub:
+                self.hub.fan_out(data)  # Passed on exactly as received
+            values = VIEW.unpack(data)
+            self.received += 1
+            self.buffer.add(values[2], values[3:], now_ms())
+        elif is_reliable_packet(data):
+            self.channel.on_packet(data, now_ms())
+        elif is_clock_packet(data):
+            self.clock.handle(data, now_ms())
+
+    def tick(self):
+        # Once a frame: keeps the source and any relayed viewers serviced, and returns the delayed state
+        self.channel.poll(now_ms())
+        if self.clock.should_ping():
+            self.endpoint.sendto(self.clock.make_ping(), self.source)
+        if self.hub:
+            self.hub.poll()
+        sample = self.buffer.sample(now_ms())
+        if sample is None:
+            return None
+        load_state(self.state, tuple(round(value) for value in sample))
+        return self.state
+
+    def close(self):
+        if self.hub:
+            self.hub.close()
+        self.endpoint.close()
+
+def watch(source, name, delay):
+    from display import import_pygame, open_window
+    from render import Renderer
+
+    pygame = import_pygame()
+    open_window((FIXED_WIDTH, FIXED_HEIGHT), "P2P Pong (spectating)")
+    engine = NetEngine()
+    spectator = Spectator(engine, source, name, delay)
+
+    def pump():
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                raise KeyboardInterrupt
+
+    try:
+        if not spectator.join(pump):
+            print("[SPECTATE] No answer from the host or relay")
+            return
+        print(f"[SPECTATE] Watching {spectator.names[0]} vs {spectator.names[1]}, {delay:.1f}s behind")
+        renderer = Renderer()
+        while True:
+            pump()
+            state = spectator.tick()
+            if state is not None:
+                renderer.draw(state, True, spectator.names[0], spectator.names[1], (FIXED_WIDTH, FIXED_HEIGHT))
+            engine.tick(GAME_SPEED)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        engine.close()
+        pygame.quit()
+
+def relay(source, port, name):
+    engine = NetEngine()
+    spectator = Spectator(engine, source, name, relay_port=port)
+    try:
+        if not spectator.join():
+            print("[RELAY] No answer from the host or relay")
+            return
+        print(f"[RELAY] Relaying {spectator.names[0]} vs {spectator.names[1]} from {spectator.source} on {port}")
+        while True:
+            spectator.tick()
+            engine.tick(GAME_SPEED)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        engine.close()
+
+def benchmark(viewers=200, ticks=600):
+    # Fan-out cost per view tick: one encode for everyone versus a delta encoder per viewer, as for players
+    from protocol import SnapshotEncoder, snapshot_from_state
+    from sim import new_state, update_ball
+
+    engine = NetEngine()
+    hub = SpectatorHub(engine, 0)
+    sinks = []
+    for _ in range(viewers):
+        sink = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sink.bind(("127.0.0.1", 0))
+        sinks.append(sink)
+        hub.viewers[sink.getsockname()] = [ReliableChannel(lambda packet: None), time.monotonic()]
+    state = new_state(True)
+
+    start = time.perf_counter()
+    for frame in range(ticks):
+        update_ball(state)
+        hub.publish(frame * VIEW_INTERVAL, state)
+    single = (time.perf_counter() - start) / ticks
+
+    encoders = [SnapshotEncoder() for _ in range(viewers)]
+    sendto = hub.endpoint.transport.sendto
+    addrs = list(hub.viewers)
+    start = time.perf_counter()
+    for frame in range(ticks):
+        update_ball(state)
+        snapshot = snapshot_from_state(state)
+        for encoder, addr in zip(encoders, addrs):
+            sendto(encoder.encode(snapshot, None, now_ms()), addr)
+    per_viewer = (time.perf_counter() - start) / ticks
+
+    engine.close()
+    for sink in sinks:
+        sink.close()
+    print(f"[BENCH] {viewers} viewers: single encode {single * 1e6:.0f} us/tick, "
+          f"encode per viewer {per_viewer * 1e6:.0f} us/tick ({per_viewer / single:.1f}x)")
+    print(f"[BENCH] {VIEW.size} B x {viewers} viewers x {GAME_SPEED // VIEW_INTERVAL} Hz = "
+          f"{VIEW.size * viewers * GAME_SPEED // VIEW_INTERVAL * 8 / 1000:.0f} kbit/s of uplink")
+    return {'fanout_us': single * 1e6, 'per_viewer_us': per_viewer * 1e6}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Watch or relay a P2P Pong match")
+    parser.add_argument("source", nargs="?", help="host or relay to watch, ip[:port]")
+    parser.add_argument("--name", default="Spectator")
+    parser.add_argument("--delay", type=float, default=SPECTATOR_DELAY, help="seconds behind the live match")
+    parser.add_argument("--relay", action="store_true", help="forward the match to other spectators instead of showing it")
+    parser.add_argument("--port", type=int, default=SPECTATOR_PORT, help="port a relay accepts spectators on")
+    parser.add_argument("--bench", type=int, metavar="VIEWERS", help="time fan-out instead of watching")
+    args = parser.parse_args()
+
+    if args.bench:
+        benchmark(args.bench)
+    elif not args.source:
+        parser.error("a host or relay to watch is required")
+    else:
+        ip, _, port = args.source.partition(":")
+        source = (ip, int(port or SPECTATOR_PORT))
+        if args.relay:
+            relay(source, args.port, args.name)
+        else:
+            watch(source, args.name, args.delay)
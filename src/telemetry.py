@@ -0,0 +1,168 @@
+# Per-connection network counters built on the gameplay sequence numbers, with JSON-lines/CSV export.
+import json
+import time
+
+SEQ_WINDOW = 64
+TELEMETRY_INTERVAL = 1.0
+FIELDS = ('time', 'connection', 'rtt_ms', 'jitter_ms', 'loss_pct', 'lost', 'out_of_order', 'duplicates',
+          'coalesced', 'packets_sent', 'packets_received', 'bytes_sent', 'bytes_received', 'send_kbps', 'receive_kbps')
+
+def _signed16(value):
+    value &= 0xFFFF
+    return value - 0x10000 if value >= 0x8000 else value
+
+class ConnectionStats:
+    def __init__(self, clock=None, name="peer"):
+        self.clock = clock  # A netsync.ClockSync, for RTT from echoed timestamps
+        self.name = name
+        self.packets_sent = 0
+        self.bytes_sent = 0
+        self.packets_received = 0
+        self.bytes_received = 0
+
+        self.first_seq = None
+        self.highest_seq = None  # Unwrapped, so it keeps counting past 65535
+        self.received_mask = 0  # Bit i set when highest_seq - i has arrived
+        self.unique = 0
+        self.out_of_order = 0
+        self.duplicates = 0
+        self.coalesced = 0  # Snapshots received but skipped for a newer one in the same batch
+
+        self.jitter = 0.0
+        self.last_transit = None
+        self.last_rates = (time.monotonic(), 0, 0)
+        self.send_kbps = 0.0
+        self.receive_kbps = 0.0
+
+    def on_send(self, nbytes):
+        self.packets_sent += 1
+        self.bytes_sent += nbytes
+
+    def on_receive(self, nbytes):
+        self.packets_received += 1
+        self.bytes_received += nbytes
+
+    def on_sequence(self, seq, stamp, arrival):
+        if self.highest_seq is None:
+            self.first_seq = self.highest_seq = seq
+            self.received_mask = 1
+            self.unique = 1
+            self.last_transit = (arrival, stamp)
+            return
+
+        extended = self.highest_seq + _signed16(seq - self.highest_seq)
+        if extended > self.highest_seq:
+            shift = extended - self.highest_seq
+            self.received_mask = ((self.received_mask << shift) | 1) & ((1 << SEQ_WINDOW) - 1)
+            self.highest_seq = extended
+            self.unique += 1
+            # RFC 3550 interarrival jitter, in-order packets only
+            last_arrival, last_stamp = self.last_transit
+            deviation = _signed16((arrival - last_arrival) - (stamp - last_stamp))
+            self.jitter += (abs(deviation) - self.jitter) / 16
+            self.last_transit = (arrival, stamp)
+            return
+
+        age = self.highest_seq - extended
+        if age >= SEQ_WINDOW:
+            self.out_of_order += 1  # Too old to tell apart from a duplicate
+            return
+        bit = 1 << age
+        if self.received_mask & bit or age == 0:
+            self.duplicates += 1
+        else:
+            self.received_mask |= bit
+            self.unique += 1
+            self.out_of_order += 1
+
+    @property
+    def lost(self):
+        if self.highest_seq is None:
+            return 0
+        return max(0, self.highest_seq - self.first_seq + 1 - self.unique)
+
+    @property
+    def loss_pct(self):
+        if self.highest_seq is None:
+            return 0.0
+        return 100.0 * self.lost / (self.highest_seq - self.first_seq + 1)
+
+    @property
+    def rtt(self):
+        return self.clock.rtt if self.clock is not None else None
+
+    def health(self):
+        # 0 = good, 1 = degraded, 2 = bad
+        rtt = self.rtt or 0
+        loss = self.loss_pct
+        if rtt > 200 or loss > 10 or self.jitter > 40:
+            return 2
+        if rtt > 100 or loss > 2 or self.jitter > 15:
+            return 1
+        return 0
+
+    def update_rates(self):
+        now = time.monotonic()
+        last_time, last_sent, last_received = self.last_rates
+        elapsed = now - last_time
+        if elapsed > 0:
+            self.send_kbps = (self.bytes_sent - last_sent) * 8 / 1000 / elapsed
+            self.receive_kbps = (self.bytes_received - last_received) * 8 / 1000 / elapsed
+        self.last_rates = (now, self.bytes_sent, self.bytes_received)
+
+    def snapshot(self):
+        rtt = self.rtt
+        return {
+            'time': round(time.time(), 3),
+            'connection': self.name,
+            'rtt_ms': round(rtt, 1) if rtt is not None else None,
+            'jitter_ms': round(self.jitter, 1),
+            'loss_pct': round(self.loss_pct, 2),
+            'lost': self.lost,
+            'out_of_order': self.out_of_order,
+            'duplicates': self.duplicates,
+            'coalesced': self.coalesced,
+            'packets_sent': self.packets_sent,
+            'packets_received': self.packets_received,
+            'bytes_sent': self.bytes_sent,
+            'bytes_received': self.bytes_received,
+            'send_kbps': round(self.send_kbps, 1),
+            'receive_kbps': round(self.receive_kbps, 1),
+        }
+
+    def overlay_lines(self):
+        rtt = self.rtt
+        return [
+            f"RTT {rtt:.0f} ms" if rtt is not None else "RTT --",
+            f"Jitter {self.jitter:.1f} ms  Loss {self.loss_pct:.1f}%",
+            f"Reorder {self.out_of_order}  Dup {self.duplicates}  Skip {self.coalesced}",
+            f"Up {self.send_kbps:.1f} kbps  Down {self.receive_kbps:.1f} kbps",
+        ]
+
+class TelemetryWriter:
+    def __init__(self, path):
+        self.file = open(path, 'a', newline='')
+        self.csv = None
+        if path.endswith('.csv'):
+            import csv  # Pulls in re; most runs log JSON lines
+            self.csv = csv.DictWriter(self.file, fieldnames=FIELDS)
+            if self.file.tell() == 0:
+                self.csv.writeheader()
+        self.last_write = time.monotonic()
+
+    def maybe_write(self, connections):
+        now = time.monotonic()
+        if now - self.last_write < TELEMETRY_INTERVAL:
+            return
+        self.last_write = now
+        for stats in connections:
+            stats.update_rates()
+            row = stats.snapshot()
+            if self.csv:
+                self.csv.writerow(row)
+            else:
+                self.file.write(json.dumps(row) + "\n")
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
@@ -0,0 +1,92 @@
+# Fixed-timestep simulation with rendering decoupled from it. Input, physics and networking advance in whole
+# GAME_SPEED ticks by wall-clock time, however long frames take to draw; each drawn frame blends the last two
+# ticks, so the game looks smooth at any display rate and a slow frame never slows the match down.
+#
+#   python src/timestep.py --bench   sim rate and smoothness with draw-time spikes, locked vs fixed step
+import random
+import sys
+
+from constants import GAME_SPEED, FIXED_WIDTH, BALL_SPEED
+from sim import SIM_KEYS
+
+MAX_CATCHUP_TICKS = 8  # Past this the sim skips ahead instead of bursting (window dragged, process suspended)
+DEFAULT_RENDER_FPS = 120  # When pygame can't tell us the display's refresh rate
+SNAP_DISTANCE = FIXED_WIDTH // 4  # Jumps bigger than this (a serve after a point) are drawn as-is, not slid
+
+POSITIONS = tuple(SIM_KEYS.index(key) for key in ('paddle_y', 'opponent_paddle_y', 'ball_x', 'ball_y'))
+
+class FixedTimestep:
+    def __init__(self, rate=GAME_SPEED, max_ticks=MAX_CATCHUP_TICKS):
+        self.dt = 1 / rate
+        self.max_ticks = max_ticks
+        self.accumulator = self.dt  # So the first frame simulates a tick instead of drawing nothing new
+        self.last = None
+        self.skipped = 0  # Ticks dropped by the catch-up limit
+
+    def advance(self, now):
+        # How many ticks to simulate before drawing the frame at `now` (seconds, any monotonic clock)
+        if self.last is not None:
+            self.accumulator += now - self.last
+        self.last = now
+        ticks = int(self.accumulator / self.dt)
+        if ticks > self.max_ticks:
+            self.skipped += ticks - self.max_ticks
+            self.accumulator -= (ticks - self.max_ticks) * self.dt
+            ticks = self.max_ticks
+        self.accumulator -= ticks * self.dt
+        return ticks
+
+    @property
+    def alpha(self):
+        # How far the frame being drawn is between the last tick and the next one, 0..1
+        return min(1.0, self.accumulator / self.dt)
+
+def blend_state(previous, current, alpha, view):
+    # previous and current are sim.save_state tuples; loads the in-between positions into view
+    values = list(current)
+    for i in POSITIONS:
+        if abs(current[i] - previous[i]) < SNAP_DISTANCE:
+            values[i] = round(previous[i] + (current[i] - previous[i]) * alpha)
+    for key, value in zip(SIM_KEYS, values):
+        setattr(view, key, value)
+    return view
+
+def _simulate(fixed, frames, draw_ms, rng):
+    # A synthetic loop on a fake clock: returns (sim ticks per second, mean and worst on-screen hitch in px), a
+    # hitch being how far the ball's drawn movement between two frames is from what that much real time moves it
+    from sim import new_state, save_state, update_ball
+    state = new_state(True)
+    view = new_state(True)
+    timestep = FixedTimestep()
+    now = 0.0
+    ticks = 0
+    previous = current = save_state(state)
+    drawn = []  # (ball x on screen, time it was shown)
+    for _ in range(frames):
+        due = timestep.advance(now) if fixed else 1
+        for _ in range(due):
+            previous = save_state(state)
+            update_ball(state)
+            current = save_state(state)
+        ticks += due
+        drawn.append((blend_state(previous, current, timestep.alpha, view).ball_x if fixed else state.ball_x, now))
+        now += max(1 / DEFAULT_RENDER_FPS if fixed else 1 / GAME_SPEED, rng.choice(draw_ms) / 1000)
+    speed = BALL_SPEED * GAME_SPEED
+    hitches = [abs(abs(x1 - x0) - speed * (t1 - t0))
+               for (x0, t0), (x1, t1) in zip(drawn, drawn[1:]) if abs(x1 - x0) < SNAP_DISTANCE]
+    return ticks / now, sum(hitches) / len(hitches), max(hitches)
+
+def benchmark(frames=20000, seed=11):
+    # Mostly quick frames with the odd 25-50 ms hitch, as from a GC pause or a window being dragged
+    draw_ms = [2] * 95 + [25] * 4 + [50]
+    results = {}
+    for name, fixed in (('locked', False), ('fixed', True)):
+        rate, mean, worst = _simulate(fixed, frames, draw_ms, random.Random(seed))
+        results[name] = (rate, worst)
+        print(f"[BENCH] {name:6} step: sim {rate:5.1f} ticks/s (target {GAME_SPEED}), "
+              f"ball hitches {mean:.2f} px mean, {worst:.1f} px worst")
+    return results
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--bench":
+        benchmark()
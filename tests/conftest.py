@@ -0,0 +1,6 @@
+# The modules in src/ import each other by bare name, as when run as scripts
+import os
+import sys
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
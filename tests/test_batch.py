@@ -0,0 +1,35 @@
+import random
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from batch import BatchState, step_batch, random_states, DTYPE
+from sim import new_state, save_state, step, INPUT_UP, INPUT_DOWN
+
+def test_batch_matches_sim_step():
+    # Every match must come out bit-identical to the scalar path, fast balls and scoring included
+    rng = random.Random(5)
+    matches, steps = 500, 600
+    inputs = np.array([[rng.choice((0, INPUT_UP, INPUT_DOWN)) for _ in range(matches)] for _ in range(64)],
+                      dtype=DTYPE)
+    states = random_states(matches, rng)
+    batch = BatchState.from_states(states)
+    scored = 0
+    for frame in range(steps):
+        left, right = inputs[frame % 64], inputs[(frame * 7) % 64]
+        scored += int(step_batch(batch, left, right).sum())
+        for i, state in enumerate(states):
+            step(state, int(left[i]), int(right[i]))
+    mismatches = [i for i, state in enumerate(states) if save_state(batch.state(i)) != save_state(state)]
+    assert mismatches == [], f"{len(mismatches)} of {matches} matches differ from sim.step"
+    assert scored > 0
+
+def test_scalar_inputs_and_round_trip():
+    states = [new_state(True) for _ in range(3)]
+    batch = BatchState.from_states(states)
+    assert [save_state(batch.state(i)) for i in range(3)] == [save_state(state) for state in states]
+    step_batch(batch, INPUT_DOWN, INPUT_UP)
+    for state in states:
+        step(state, INPUT_DOWN, INPUT_UP)
+    assert [save_state(batch.state(i)) for i in range(3)] == [save_state(state) for state in states]
@@ -0,0 +1,30 @@
+import socket
+
+import pytest
+
+from engine import NetEngine
+
+@pytest.mark.parametrize("drain", [True, False])
+def test_batches_hold_every_queued_datagram_in_order(drain):
+    net = NetEngine()
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        endpoint = net.open(0)
+        batches = []
+        endpoint.set_batch_handler(lambda batch: batches.append([(bytes(data), arrival) for data, _, arrival in batch]),
+                                   drain)
+        for i in range(100):
+            sender.sendto(b"%d" % i, ("127.0.0.1", endpoint.port))
+        while sum(map(len, batches)) < 100:
+            net.poll(0.01)
+        received = [item for batch in batches for item in batch]
+        assert [data for data, _ in received] == [b"%d" % i for i in range(100)]
+        arrivals = [arrival for _, arrival in received]
+        assert arrivals == sorted(arrivals)  # Each datagram has its own read time
+        if drain:
+            assert len(batches) < 10
+        else:
+            assert set(map(len, batches)) == {1}
+    finally:
+        sender.close()
+        net.close()
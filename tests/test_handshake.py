@@ -0,0 +1,56 @@
+import asyncio
+
+import pytest
+
+from constants import MAX_USERNAME_BYTES
+from engine import NetEngine
+from handshake import (wait_for_client, connect_to_host, parse_hello_ack, hello_ack, clip_username, watch_ack,
+                       parse_watch_ack)
+from spectate import SpectatorHub, Spectator
+
+def test_clip_username_cuts_at_a_character_boundary():
+    assert clip_username("Player") == "Player"
+    assert clip_username("x" * 300) == "x" * MAX_USERNAME_BYTES
+    clipped = clip_username("é" * 200)  # Two bytes each
+    assert clipped == "é" * (MAX_USERNAME_BYTES // 2)
+    odd = clip_username("a" + "é" * 200)
+    assert len(odd.encode()) <= MAX_USERNAME_BYTES and odd.endswith("é")
+
+@pytest.mark.parametrize("flag", ["", "L", "R", "RB"])
+def test_hello_ack_keeps_names_with_colons(flag):
+    for name in ("a:R", "x:RB", ":L", "", "plain"):
+        assert parse_hello_ack(hello_ack(name, flag))[0] == name
+
+@pytest.mark.parametrize("host_name, client_name", [("host", "x" * 300), ("é" * 200, "ü" * 130 + "!")])
+def test_long_usernames_connect(host_name, client_name):
+    # Long names used to overflow the reliable channel's 255-byte messages and crash the connect
+    net = NetEngine()
+    try:
+        host, client = net.open(), net.open()
+
+        async def handshake():
+            return await asyncio.wait_for(asyncio.gather(
+                wait_for_client(host, host_name, "p2p"),
+                connect_to_host(client, ("127.0.0.1", host.port), client_name)), 5)
+
+        (seen_by_host, _, _), (ack, _, _) = net.loop.run_until_complete(handshake())
+        assert seen_by_host == clip_username(client_name)
+        assert parse_hello_ack(ack) == (clip_username(host_name), "p2p", False)
+    finally:
+        net.close()
+
+@pytest.mark.parametrize("left, right", [("a:b", "c"), ("", "x:y:"), ("12:", ""), ("é" * 100, "ü" * 100)])
+def test_watch_ack_keeps_names_with_colons(left, right):
+    message = watch_ack(left, right)
+    assert len(message) <= 255
+    assert parse_watch_ack(message) == (clip_username(left), clip_username(right))
+
+def test_spectator_gets_both_names():
+    net = NetEngine()
+    try:
+        hub = SpectatorHub(net, 0, ("left:side", "right"))
+        spectator = Spectator(net, ("127.0.0.1", hub.endpoint.port), "viewer")
+        assert spectator.join()
+        assert spectator.names == ("left:side", "right")
+    finally:
+        net.close()
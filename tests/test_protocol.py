@@ -0,0 +1,102 @@
+import random
+
+from protocol import (SnapshotEncoder, SnapshotDecoder, seq_newer, SEQ_MOD, F_BASE, PROTOCOL_VERSION,
+                      EMPTY_SNAPSHOT)
+
+def snapshots(count, seed=1):
+    # Paddle and ball moving by small steps, with the odd jump too big for an int8 difference
+    rng = random.Random(seed)
+    paddle, x, y = 220, 480, 270
+    for i in range(count):
+        paddle = max(0, min(440, paddle + rng.randint(-6, 6)))
+        x, y = (x + 3) % 960, (y + rng.choice((-3, 3))) % 540
+        if i % 50 == 49:
+            x = rng.randint(0, 960)
+        yield (paddle, x, y, 3, rng.choice((-3, 3)))
+
+def test_seq_newer_wraps():
+    assert seq_newer(0, SEQ_MOD - 1)
+    assert seq_newer(5, SEQ_MOD - 10)
+    assert not seq_newer(SEQ_MOD - 1, 0)
+    assert not seq_newer(7, 7)
+    assert not seq_newer(0, SEQ_MOD // 2)  # Exactly half way round counts as old
+
+def test_round_trip_across_the_wrap():
+    encoder, decoder = SnapshotEncoder(), SnapshotDecoder()
+    encoder.seq = SEQ_MOD - 5
+    seqs = []
+    for snapshot in snapshots(20):
+        seq, decoded, ack, stamp, is_newest = decoder.decode(encoder.encode(snapshot, ack=123, stamp=70000))
+        assert decoded == snapshot and ack == 123 and stamp == 70000 & 0xFFFF and is_newest
+        encoder.on_ack(seq)
+        seqs.append(seq)
+    assert seqs[:6] == [SEQ_MOD - 4, SEQ_MOD - 3, SEQ_MOD - 2, SEQ_MOD - 1, 0, 1]
+
+def test_deltas_against_the_acked_baseline():
+    encoder, decoder = SnapshotEncoder(), SnapshotDecoder()
+    base = (220, 480, 270, 3, 3)
+    full = encoder.encode(base)
+    assert not full[0] & F_BASE  # Nothing acked yet: a full snapshot
+    encoder.on_ack(decoder.decode(full)[0])
+
+    small = encoder.encode((221, 483, 267, 3, 3))
+    assert small[0] & F_BASE and len(small) < len(full)
+    assert decoder.decode(small)[1] == (221, 483, 267, 3, 3)
+
+    # Still a delta on the acked snapshot, not on the unacked one just sent; a jump goes at full width
+    jump = encoder.encode((221, 900, 267, -3, 3))
+    assert jump[0] & F_BASE
+    only_full = SnapshotDecoder()
+    only_full.decode(full)
+    assert only_full.decode(jump)[1] == (221, 900, 267, -3, 3)
+    assert decoder.decode(jump)[1] == (221, 900, 267, -3, 3)
+
+    unchanged = encoder.encode(base)
+    assert decoder.decode(unchanged)[1] == base
+
+def test_delta_on_a_missing_baseline_is_dropped():
+    encoder = SnapshotEncoder()
+    encoder.encode((1, 2, 3, 4, 5))
+    encoder.on_ack(1)
+    delta = encoder.encode((2, 2, 3, 4, 5))
+    assert SnapshotDecoder().decode(delta) is None  # Never saw seq 1
+
+def test_loss_and_reorder():
+    # Packets lost or delivered late, with the receiver's ack reaching the sender a few packets later
+    rng = random.Random(5)
+    encoder, decoder = SnapshotEncoder(), SnapshotDecoder()
+    encoder.seq = SEQ_MOD - 100
+    sent = {}
+    in_flight = []
+    acks = []
+    newest = None
+    decoded = 0
+    for tick, snapshot in enumerate(snapshots(2000)):
+        if len(acks) > 3:
+            encoder.on_ack(acks.pop(0))
+        packet = encoder.encode(snapshot)
+        sent[encoder.seq] = snapshot
+        if rng.random() >= 0.1:
+            in_flight.append((tick + rng.randint(0, 4), rng.random(), packet))
+        for delivery in sorted(item for item in in_flight if item[0] <= tick):
+            in_flight.remove(delivery)
+            result = decoder.decode(delivery[2])
+            assert result is not None  # Baselines are only ever ones we acked, so we hold them
+            seq, values, _, _, is_newest = result
+            assert values == sent[seq]
+            assert is_newest == (newest is None or seq_newer(seq, newest))
+            if is_newest:
+                newest = seq
+            acks.append(decoder.latest)
+            decoded += 1
+    assert decoded > 1500
+
+def test_rejects_other_versions_and_truncated_packets():
+    packet = SnapshotEncoder().encode((1, 2, 3, 4, 5))
+    decoder = SnapshotDecoder()
+    other_version = bytes([(PROTOCOL_VERSION + 1) << 4 | packet[0] & 0x0F]) + packet[1:]
+    assert decoder.decode(other_version) is None
+    assert decoder.decode(packet[:-1]) is None
+    assert decoder.decode(b"") is None
+    assert decoder.peek(packet[:3]) is None
+    assert decoder.decode(SnapshotEncoder().encode(EMPTY_SNAPSHOT))[1] == EMPTY_SNAPSHOT
@@ -0,0 +1,34 @@
+import random
+
+from proxy import Impairment, PROFILES
+
+def deliver(profile, packets=20000, seed=7):
+    # Sends one packet per 60 Hz tick through one direction of the link; returns the impairment and the
+    # sequence numbers in the order they come out
+    impairment = Impairment(profile, random.Random(seed))
+    deliveries = []
+    for seq in range(packets):
+        for deliver_at in impairment.schedule(seq / 60, 40):
+            deliveries.append((deliver_at, len(deliveries), seq))  # Ties go out in send order, as in the proxy's heap
+    return impairment, [seq for _, _, seq in sorted(deliveries)]
+
+def inversions(order):
+    # Packets delivered after one that was sent later
+    highest, count = -1, 0
+    for seq in order:
+        if seq < highest:
+            count += 1
+        highest = max(highest, seq)
+    return count
+
+def test_reordered_packets_are_overtaken():
+    impairment, order = deliver(PROFILES["congested"])
+    reordered = impairment.counts["reordered"]
+    assert reordered > 0
+    assert inversions(order) >= 0.9 * reordered
+
+def test_jitter_alone_keeps_fifo_order():
+    profile = dict(PROFILES["congested"], reorder_pct=0)
+    impairment, order = deliver(profile)
+    assert impairment.counts["reordered"] == 0
+    assert inversions(order) == 0
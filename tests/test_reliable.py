@@ -0,0 +1,111 @@
+import random
+
+from reliable import ReliableChannel, SEQ_MOD, WINDOW, INITIAL_RTO, MAX_RTO, MESSAGE, HEADER
+
+def pair():
+    # Two channels whose packets land in outboxes; the test decides what is delivered, and when
+    outboxes = ([], [])
+    channels = [ReliableChannel(outboxes[side].append) for side in range(2)]
+    return channels, outboxes
+
+def seqs_in(packet):
+    count = packet[HEADER.size - 1]
+    offset = HEADER.size
+    seqs = []
+    for _ in range(count):
+        seq, length = MESSAGE.unpack_from(packet, offset)
+        seqs.append(seq)
+        offset += MESSAGE.size + length
+    return seqs
+
+def test_in_order_under_loss_and_reorder_across_the_wrap():
+    rng = random.Random(4)
+    channels, _ = pair()
+    channels[0].next_seq = SEQ_MOD - 40
+    channels[1].received_seq = SEQ_MOD - 41
+    in_flight = []
+    for side in range(2):
+        def send(packet, side=side):
+            if rng.random() >= 0.3:
+                in_flight.append((now + rng.randint(10, 80), rng.random(), 1 - side, packet))
+        channels[side].send_packet = send
+
+    delivered = []
+    count = 300
+    now = 0
+    while len(delivered) < count and now < 60000:
+        if now % 8 == 0 and now // 8 < count:
+            channels[0].send(b"MSG:%d" % (now // 8))
+        for item in sorted(item for item in in_flight if item[0] <= now):
+            in_flight.remove(item)
+            result = channels[item[2]].on_packet(item[3], now)
+            if item[2] == 1:
+                delivered += result
+            else:
+                assert result == []
+        for channel in channels:
+            channel.poll(now)
+        now += 1
+    assert delivered == [b"MSG:%d" % i for i in range(count)]
+    assert channels[1].received_seq < 1000  # Went past 65535 and round to the start
+    assert channels[0].retransmits > 0
+
+def test_selective_ack_resends_only_the_missing_message():
+    channels, outboxes = pair()
+    for i in range(5):
+        channels[0].send(b"m%d" % i)
+        channels[0].poll(0)  # One message per packet
+    packets = outboxes[0][:]
+    assert [seqs_in(packet) for packet in packets] == [[1], [2], [3], [4], [5]]
+
+    delivered = []
+    for packet in packets[:1] + packets[2:]:  # Seq 2 lost
+        delivered += channels[1].on_packet(packet, 10)
+    assert delivered == [b"m0"]
+    channels[1].poll(10)
+    channels[0].on_packet(outboxes[1][-1], 20)
+    assert list(channels[0].unacked) == [2]
+
+    outboxes[0].clear()
+    channels[0].poll(INITIAL_RTO - 1)
+    assert outboxes[0] == []  # Not due yet
+    channels[0].poll(INITIAL_RTO)
+    assert [seqs_in(packet) for packet in outboxes[0]] == [[2]]
+    assert channels[1].on_packet(outboxes[0][0], INITIAL_RTO + 10) == [b"m1", b"m2", b"m3", b"m4"]
+
+def test_rto_backs_off_up_to_the_cap_and_karn_skips_resent_samples():
+    channels, outboxes = pair()
+    channels[0].send(b"hello")
+    sends = []
+    for now in range(8000):
+        before = len(outboxes[0])
+        channels[0].poll(now)
+        if len(outboxes[0]) > before:
+            sends.append(now)
+    gaps = [b - a for a, b in zip(sends, sends[1:])]
+    assert gaps[:4] == [INITIAL_RTO, 2 * INITIAL_RTO, 4 * INITIAL_RTO, MAX_RTO]
+    assert set(gaps[3:]) == {MAX_RTO}
+    assert channels[0].retransmits == len(sends) - 1
+
+    channels[1].on_packet(outboxes[0][-1], 8000)
+    channels[1].poll(8000)
+    channels[0].on_packet(outboxes[1][-1], 8001)
+    assert not channels[0].unacked
+    assert channels[0].srtt is None and channels[0].rto == INITIAL_RTO  # The ack may be for any of the sends
+
+def test_rtt_sample_from_a_message_sent_once():
+    channels, outboxes = pair()
+    channels[0].send(b"hello")
+    channels[0].poll(0)
+    channels[1].on_packet(outboxes[0][0], 50)
+    channels[1].poll(50)
+    channels[0].on_packet(outboxes[1][0], 100)
+    assert channels[0].srtt == 100
+    assert channels[0].rto == 100 + 4 * 50
+
+def test_window_limits_messages_in_flight():
+    channels, outboxes = pair()
+    for i in range(WINDOW + 10):
+        channels[0].send(b"%d" % i)
+    channels[0].poll(0)
+    assert seqs_in(outboxes[0][0]) == list(range(1, WINDOW + 1))
@@ -0,0 +1,81 @@
+from lobby import Lobby
+from rooms import ExpiryHeap, Room
+
+def test_expiry_heap_refresh_and_discard():
+    expiry = ExpiryHeap()
+    expiry.touch("a", 10)
+    expiry.touch("b", 20)
+    expiry.touch("a", 30)  # Refreshed: no longer due at 10
+    assert expiry.pop_expired(15) == []
+    assert expiry.pop_expired(25) == ["b"]
+    expiry.discard("a")
+    assert expiry.pop_expired(100) == []
+    assert expiry.heap == []
+
+def test_expiry_heap_keeps_one_entry_per_key():
+    expiry = ExpiryHeap()
+    for i in range(50):
+        expiry.touch("room", i)
+        expiry.discard("room")
+        expiry.touch("room", i + 100)
+    assert len(expiry.heap) == 1
+    assert expiry.pop_expired(148) == []
+    assert len(expiry.heap) == 1
+    assert expiry.pop_expired(149) == ["room"]
+    assert expiry.heap == [] and not expiry.queued
+
+def test_expiry_heap_discarded_key_can_come_back():
+    expiry = ExpiryHeap()
+    expiry.touch("room", 5)
+    expiry.discard("room")
+    assert expiry.pop_expired(6) == []
+    expiry.touch("room", 10)
+    assert expiry.pop_expired(9) == []
+    assert expiry.pop_expired(10) == ["room"]
+
+def make_lobby(count=45):
+    lobby = Lobby()
+    for i in range(count):
+        room = Room(f"Room {i} {'alpha' if i % 3 == 0 else 'beta'}", "10.0.0.1", room_id=f"R{i}")
+        room.player_count = 2 if i % 5 == 4 else 1
+        lobby.register(room, ("10.0.0.1", 1000 + i), 0)
+    return lobby
+
+def test_lobby_pages_through_open_rooms():
+    lobby = make_lobby()
+    open_ids = [f"R{i}" for i in range(45) if i % 5 != 4]
+    seen = []
+    page = 0
+    while True:
+        rooms, total, more = lobby.query(page, 10)
+        assert total == len(open_ids)
+        seen += [room.room_id for room in rooms]
+        if not more:
+            break
+        page += 1
+    assert seen == open_ids
+    assert lobby.query(page + 1, 10) == ([], len(open_ids), False)
+    assert len(lobby.query(0, 10, open_only=False)[0]) == 10
+    assert lobby.query(0, 10, open_only=False)[1] == 45
+
+def test_lobby_name_search_matches_whole_words():
+    lobby = make_lobby()
+    alpha = [f"R{i}" for i in range(45) if i % 3 == 0 and i % 5 != 4]
+    first, total, more = lobby.query(0, 5, name="ALPHA")
+    assert total is None and more
+    second, _, more = lobby.query(1, 5, name="alpha")
+    rest, _, more_after = lobby.query(2, 5, name="alpha")
+    assert [room.room_id for room in first + second + rest] == alpha and not more_after
+    assert [room.room_id for room in lobby.query(0, 10, name="room 3")[0]] == ["R3"]
+    assert lobby.query(0, 10, name="alp")[0] == []  # Whole words only
+    assert lobby.query(0, 10, name="gamma") == ([], None, False)
+
+def test_lobby_reindexes_a_renamed_room_and_forgets_removed_ones():
+    lobby = make_lobby(3)
+    renamed = Room("Gamma night", "10.0.0.1", room_id="R0")
+    assert lobby.register(renamed, ("10.0.0.1", 1000), 1)
+    assert lobby.query(0, 10, name="alpha")[0] == []
+    assert [room.room_id for room in lobby.query(0, 10, name="gamma")[0]] == ["R0"]
+    assert not lobby.register(renamed, ("10.9.9.9", 1), 1)  # Someone else's room id
+    assert lobby.unregister("R0", ("10.0.0.1", 1000))
+    assert lobby.query(0, 10, name="gamma")[0] == [] and "gamma" not in lobby.words
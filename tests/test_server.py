@@ -0,0 +1,37 @@
+import asyncio
+import threading
+
+import handshake
+import server
+from engine import NetEngine
+from handshake import connect_to_host, parse_hello_ack
+
+def test_waiting_player_is_paired_after_player_timeout(monkeypatch):
+    # Timeouts scaled down so the second player still turns up after PLAYER_TIMEOUT, with the server's
+    # once-a-second expiry pass having run in between
+    monkeypatch.setattr(server, "PLAYER_TIMEOUT", 0.5)
+    monkeypatch.setattr(handshake, "WAIT_KEEPALIVE", 0.1)
+    dedicated = server.DedicatedServer(port=0, advertise=False)
+    thread = threading.Thread(target=dedicated.serve_forever)
+    thread.start()
+    net = NetEngine()
+    try:
+        server_addr = ("127.0.0.1", dedicated.sock.getsockname()[1])
+        first, second = net.open(), net.open()
+
+        async def join_late():
+            await asyncio.sleep(2.0)
+            return await connect_to_host(second, server_addr, "second")
+
+        async def join_both():
+            return await asyncio.wait_for(asyncio.gather(connect_to_host(first, server_addr, "first"), join_late()), 10)
+
+        (first_ack, _, _), (second_ack, _, _) = net.loop.run_until_complete(join_both())
+        assert parse_hello_ack(first_ack) == ("second", "dedicated", True)
+        assert parse_hello_ack(second_ack) == ("first", "dedicated", False)
+        assert list(dedicated.matches) == [1]
+    finally:
+        net.close()
+        dedicated.running = False
+        thread.join()
+        dedicated.stop()